@@ -0,0 +1,259 @@
+import base64
+import hashlib
+import io
+import os
+import re
+from pathlib import Path
+from urllib.parse import quote
+from typing import Dict
+
+FAVICON_ICO_SIZES = (16, 32, 48)
+FAVICON_PNG_SIZES = (180, 192, 512)
+
+# Types that may be inlined into the CSS as data URIs
+IMAGE_TYPES = {
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+
+# Logo uploads, checked by suffix and content before anything reads them further.
+# The UI requests the logo as logo_title_white.svg, so nothing else would render there
+LOGO_TYPES = (".svg",)
+
+# Leading bytes of each raster type; SVG is checked as text
+_MAGIC = {
+    ".png": (b"\x89PNG\r\n\x1a\n",),
+    ".jpg": (b"\xff\xd8\xff",),
+    ".jpeg": (b"\xff\xd8\xff",),
+    ".gif": (b"GIF87a", b"GIF89a"),
+}
+_SVG_START_RE = re.compile(rb"\A(?:\xef\xbb\xbf)?\s*<(?:\?xml|svg|!--|!DOCTYPE\s+svg)", re.I)
+
+# Characters left as-is in URL-encoded SVG; quotes are not, the URI sits in url("...")
+_SVG_URI_SAFE = " '=:/;,.-_!*()~@&+$?[]"
+
+_EDITOR_NS = ("inkscape", "sodipodi", "sketch", "serif", "rdf", "cc", "dc")
+
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.S)
+_DOCTYPE_RE = re.compile(r"<!DOCTYPE[^>]*>", re.S | re.I)
+_METADATA_RE = re.compile(r"<metadata\b.*?</metadata>|<metadata\b[^>]*/>", re.S)
+_EDITOR_ELEM_RE = re.compile(
+    rf"<(?P<tag>(?:{'|'.join(_EDITOR_NS)}):[\w-]+)\b[^>]*?(?:/>|>.*?</(?P=tag)>)", re.S
+)
+_EDITOR_ATTR_RE = re.compile(
+    rf"""\s(?:xmlns:)?(?:{'|'.join(_EDITOR_NS)})(?::[\w-]+)?\s*=\s*(?:"[^"]*"|'[^']*')"""
+)
+_GEOMETRY_ATTR_RE = re.compile(r"""(?P<attr>\s(?:d|points|transform)\s*=\s*)(?P<q>["'])(?P<val>.*?)(?P=q)""", re.S)
+_NUMBER_RE = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_PATH_TOKEN_RE = re.compile(rf"[A-Za-z]|{_NUMBER_RE.pattern}")
+_BETWEEN_TAGS_RE = re.compile(r">\s+<")
+
+
+def _fmt_number(token: str, precision: int) -> str:
+    """Round a number and drop redundant zeros: 0.50000 -> .5"""
+    value = round(float(token), precision)
+    text = f"{value:.{precision}f}".rstrip("0").rstrip(".")
+    if text in ("-0", ""):
+        return "0"
+    if text.startswith("0."):
+        return text[1:]
+    if text.startswith("-0."):
+        return "-" + text[2:]
+    return text
+
+
+def _collapse_geometry(value: str, precision: int) -> str:
+    """Round numbers in path data and keep only the separators that are required."""
+    out = []
+    prev = ""
+    for token in _PATH_TOKEN_RE.findall(value):
+        if not token.isalpha():
+            token = _fmt_number(token, precision)
+            # A separator is needed between two numbers unless the sign or a
+            # second decimal point already ends the previous one
+            if prev and not prev.isalpha():
+                if not (token.startswith("-") or (token.startswith(".") and "." in prev)):
+                    out.append(" ")
+        out.append(token)
+        prev = token
+    return "".join(out)
+
+
+def minify_svg(svg: str, precision: int = 2) -> str:
+    """Strip editor metadata/comments, collapse path data and round precision."""
+    svg = _COMMENT_RE.sub("", svg)
+    svg = _DOCTYPE_RE.sub("", svg)
+    svg = _METADATA_RE.sub("", svg)
+    svg = _EDITOR_ELEM_RE.sub("", svg)
+    svg = _EDITOR_ATTR_RE.sub("", svg)
+
+    def _geometry(m: re.Match) -> str:
+        val = m.group("val")
+        # transform="matrix(...)" keeps its function names, only numbers shrink
+        if m.group("attr").strip().startswith("transform"):
+            val = _NUMBER_RE.sub(lambda n: _fmt_number(n.group(), precision), val)
+        else:
+            val = _collapse_geometry(val, precision)
+        return f'{m.group("attr")}{m.group("q")}{val}{m.group("q")}'
+
+    svg = _GEOMETRY_ATTR_RE.sub(_geometry, svg)
+    svg = _BETWEEN_TAGS_RE.sub("><", svg)
+    return svg.strip()
+
+
+def check_image(data: bytes, suffix: str, allowed: tuple[str, ...] = tuple(IMAGE_TYPES)) -> None:
+    """Raise ValueError unless data is an image of an allowed type, by suffix and by content."""
+    suffix = suffix.lower()
+    if suffix not in allowed:
+        raise ValueError(f"[X] Unsupported image type {suffix!r}, expected one of {', '.join(allowed)}")
+
+    if suffix == ".svg":
+        try:
+            head = data[:4096].decode("utf-8")
+        except UnicodeDecodeError:
+            head = ""
+        ok = bool(_SVG_START_RE.match(data)) and "<svg" in head
+    elif suffix == ".webp":
+        ok = data[:4] == b"RIFF" and data[8:12] == b"WEBP"
+    elif suffix == ".avif":
+        ok = data[4:8] == b"ftyp" and data[8:12] in (b"avif", b"avis")
+    else:
+        ok = data.startswith(_MAGIC[suffix])
+    if not ok:
+        raise ValueError(f"[X] Content is not a {suffix[1:].upper()} image")
+
+
+def data_uri(data: bytes, suffix: str) -> str:
+    """
+    data: URI for an image. SVG is URL-encoded, which stays readable and
+    compresses better than base64; everything else is base64.
+    """
+    mime = IMAGE_TYPES.get(suffix.lower())
+    if mime is None:
+        raise ValueError(f"[X] Unsupported image type {suffix!r}, expected one of {', '.join(IMAGE_TYPES)}")
+
+    if mime == "image/svg+xml":
+        svg = data.decode("utf-8")
+        # Single quotes need no escaping inside url("...")
+        if "'" not in svg:
+            svg = svg.replace('"', "'")
+        return f"data:{mime},{quote(svg, safe=_SVG_URI_SAFE)}"
+
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+class AssetOptimizer:
+    """Optimise uploaded branding assets, cached by input hash."""
+
+    def __init__(self, cache_dir: str | Path, size_budget: int = 50 * 1024, precision: int = 2):
+        self.CACHE = Path(cache_dir)
+        self.size_budget = size_budget
+        self.precision = precision
+
+    def _cache_dir(self, data: bytes) -> Path:
+        key = hashlib.sha256(data + f"|p{self.precision}".encode()).hexdigest()[:16]
+        return self.CACHE / key
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def optimize_logo(self, src: str | Path) -> Path:
+        """Return the optimised logo, reusing the cached output for unchanged input."""
+        src = Path(src)
+        try:
+            data = src.read_bytes()
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"[X] Logo not present: {src}") from e
+        check_image(data, src.suffix, LOGO_TYPES)
+
+        out = self._cache_dir(data) / f"logo{src.suffix.lower()}"
+        if out.is_file():
+            optimized = out.read_bytes()
+        else:
+            optimized = self._minified(src, data)
+
+        # Checked on cache hits too, the budget may have been lowered since
+        if len(optimized) > self.size_budget:
+            raise ValueError(
+                f"[X] Logo is {len(optimized)} bytes after optimisation, "
+                f"over the {self.size_budget} byte budget: {src}"
+            )
+
+        if not out.is_file():
+            print(f"- Optimised logo: {len(data)} -> {len(optimized)} bytes")
+            self._write(out, optimized)
+        return out
+
+    def optimize_image(self, src: str | Path) -> Path:
+        """Return the optimised theme image, reusing the cached output for unchanged input."""
+        src = Path(src)
+        try:
+            data = src.read_bytes()
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"[X] Image not present: {src}") from e
+        check_image(data, src.suffix)
+
+        out = self._cache_dir(data) / f"image{src.suffix.lower()}"
+        if not out.is_file():
+            self._write(out, self._minified(src, data))
+        return out
+
+    def _minified(self, src: Path, data: bytes) -> bytes:
+        if src.suffix.lower() != ".svg":
+            return data
+        optimized = minify_svg(data.decode("utf-8"), self.precision).encode("utf-8")
+        # Never make things worse
+        return optimized if len(optimized) < len(data) else data
+
+    def favicons(self, src: str | Path) -> Dict[str, Path]:
+        """Generate favicon.ico and PNG icons from the logo. Empty if Pillow is missing."""
+        src = Path(src)
+        data = src.read_bytes()
+        out_dir = self._cache_dir(data) / "favicons"
+
+        names = ["favicon.ico"] + [f"icon-{size}.png" for size in FAVICON_PNG_SIZES]
+        if all((out_dir / n).is_file() for n in names):
+            return {n: out_dir / n for n in names}
+
+        # Imaging libraries are optional and slow to import, load them on demand
+        try:
+            from PIL import Image
+        except ImportError:
+            print("- Pillow not installed, favicons skipped.")
+            return {}
+
+        if src.suffix.lower() == ".svg":
+            try:
+                import cairosvg
+            except ImportError:
+                print("- cairosvg not installed, favicons from SVG skipped.")
+                return {}
+            data = cairosvg.svg2png(bytestring=data, output_width=max(FAVICON_PNG_SIZES))
+
+        with Image.open(io.BytesIO(data)) as img:
+            img = img.convert("RGBA")
+
+            # Pad to a square so icons are not stretched
+            side = max(img.size)
+            square = Image.new("RGBA", (side, side), (0, 0, 0, 0))
+            square.paste(img, ((side - img.width) // 2, (side - img.height) // 2))
+
+            buf = io.BytesIO()
+            square.save(buf, format="ICO", sizes=[(s, s) for s in FAVICON_ICO_SIZES])
+            self._write(out_dir / "favicon.ico", buf.getvalue())
+
+            for size in FAVICON_PNG_SIZES:
+                buf = io.BytesIO()
+                square.resize((size, size), Image.LANCZOS).save(buf, format="PNG", optimize=True)
+                self._write(out_dir / f"icon-{size}.png", buf.getvalue())
+
+        return {n: out_dir / n for n in names}
@@ -0,0 +1,74 @@
+"""
+Scaling benchmark for the single-pass vars block rewrite.
+
+Run from the repo root:
+    python benchmarks/bench_css_model.py
+"""
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tb_override import FileIO
+
+SIZES = [10, 100, 1_000, 10_000]
+REPEAT = 5
+
+
+def make_css(n: int) -> str:
+    """Return a CSS file with n variables inside the vars block."""
+    lines = [
+        "/* ===\n   >>> TB_CUSTOM_THEME_VARS_BEGIN\n   === */",
+        ":root{",
+    ]
+    for i in range(n):
+        if i % 10 == 0:
+            lines.append(f"  /* --- group {i // 10} --- */")
+        if i % 2:
+            lines.append(f"  --tb-var-{i}: #{i % 0xffffff:06x};")
+        else:
+            lines.append(f"  --tb-var-{i}: {i % 500}px;")
+    lines.append("}")
+    lines.append("/* ===\n   <<< TB_CUSTOM_THEME_VARS_END\n   === */")
+    return "\n".join(lines) + "\n"
+
+
+def make_overrides(n: int) -> dict:
+    """Override every variable in the block."""
+    return {f"--tb-var-{i}": (f"{(i + 1) % 0xffffff:06x}" if i % 2 else f"{i % 500 + 1}") for i in range(n)}
+
+
+def bench(n: int) -> float:
+    """Return the best wall time of override_css_value for n variables."""
+    fileio = FileIO(conf_path="/dev/null", css_path="/dev/null")
+    text = make_css(n)
+    overrides = make_overrides(n)
+
+    best = float("inf")
+    for _ in range(REPEAT):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            fileio.override_css_value(old_file=text, css_selectors=overrides)
+            best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    print(f"{'vars':>8} {'total ms':>10} {'us/var':>8}")
+    results = []
+    for n in SIZES:
+        t = bench(n)
+        results.append((n, t))
+        print(f"{n:>8} {t * 1000:>10.2f} {t / n * 1e6:>8.2f}")
+
+    # Linear scaling: per-variable cost should stay flat as n grows
+    (n0, t0), (n1, t1) = results[-2], results[-1]
+    ratio = (t1 / n1) / (t0 / n0)
+    print(f"\nper-var cost ratio {n1} vs {n0}: {ratio:.2f}x (~1.0 means linear)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,539 @@
+"""
+Page-load weight of the generated proxy rules, before and after an apply.
+
+A local stand-in for nginx serves a sample ThingsBoard index.html as the
+proxied upstream, and the override assets from disk. It follows the
+location, alias, add_header, sub_filter, gzip_static and etag rules of one
+server block. A simulated browser then replays a cold load (empty cache)
+and a warm load (same cache, --warm-after seconds later). Each load reports
+requests, response body bytes, cache hits implied by Cache-Control, 304
+revalidations and wall time.
+
+Run from the repo root:
+    python benchmarks/page_load.py --conf /etc/nginx/sites-available/tb-proxy
+    python benchmarks/page_load.py --conf tb-proxy --assets /opt/custom_assets --profile brand.toml
+    python benchmarks/page_load.py ... --save page.json       # store a baseline
+    python benchmarks/page_load.py ... --compare page.json    # fail on regressions
+
+With --profile the apply runs on a temporary copy of the config and assets,
+with nginx -t and the reload replaced by `true`, so nothing live is touched.
+Only the requests the sample page makes are simulated. TB's own bundles are
+not part of it, so proxied URLs other than the index answer 404.
+"""
+import argparse
+import contextlib
+import gzip
+import html.parser
+import http.client
+import io
+import json
+import mimetypes
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+from urllib.parse import unquote, urljoin, urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from nginx_conf import Block, NginxConf
+from profile_loader import load_profile
+from tb_override import BrandProfile, update_tb_batch
+
+try:
+    import brotli
+except ImportError:  # optional, the browser only asks for .br when it can decode it
+    brotli = None
+
+SAMPLE_INDEX = Path(__file__).resolve().parent / "sample_index.html"
+
+# Counted per load; ms is reported but too noisy to gate on
+METRICS = ("requests", "bytes", "cache_hits", "revalidated", "not_found")
+
+ACCEPT_ENCODING = "br, gzip" if brotli else "gzip"
+
+_CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")\s]+)\1\s*\)""")
+_LINK_PRELOAD_RE = re.compile(r"<([^>]+)>\s*;[^,]*\brel=\"?preload\b")
+_VAR_RE = re.compile(r"\$(\w+)|\$\{(\w+)\}")
+
+
+def _word(value: str) -> str:
+    """An nginx argument without its quotes and escapes."""
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+class Location(NamedTuple):
+    modifier: str  # "=", "^~" or "" (regex locations are not simulated)
+    path: str
+    alias: str | None
+    proxied: bool
+    headers: List[tuple[str, str]]
+    sub_filters: List[tuple[str, str]]
+    sub_filter_once: bool
+    gzip_static: bool
+    brotli_static: bool
+    etag: bool
+
+
+class ProxyRules:
+    """How one server block of the config answers a request for host."""
+
+    def __init__(self, conf_text: str, host: str = "localhost"):
+        conf = NginxConf(conf_text)
+        if not conf.servers:
+            raise ValueError("[X] No server block in config")
+
+        server = next((s for s in conf.servers if host in self._server_names(s)), conf.servers[0])
+        self.host = host
+        self.variables = {"host": host, **self._map_values(conf, host)}
+        self.server_headers = self._headers(server)
+        self.locations = [
+            self._location(b) for b in server.children
+            if isinstance(b, Block) and b.name == "location" and (len(b.args) == 1 or b.args[0] in ("=", "^~"))
+        ]
+
+    @staticmethod
+    def _server_names(server: Block) -> List[str]:
+        return [_word(a) for d in server.children if d.name == "server_name" for a in d.args]
+
+    @staticmethod
+    def _map_values(conf: NginxConf, host: str) -> Dict[str, str]:
+        """Value of every `map $host $var` for host, from exact keys or the default."""
+        values = {}
+        for variable, block in conf.maps.items():
+            if block.args[0] != "$host":
+                continue
+            entries = {_word(d.name): _word(d.args[-1]) for d in block.children if d.args}
+            value = entries.get(host, entries.get("default"))
+            if value is not None:
+                values[variable.lstrip("$")] = value
+        return values
+
+    @staticmethod
+    def _headers(block: Block) -> List[tuple[str, str]]:
+        return [(_word(d.args[0]), _word(d.args[1])) for d in block.children
+                if d.name == "add_header" and len(d.args) >= 2]
+
+    def _location(self, block: Block) -> Location:
+        modifier, path = block.args if len(block.args) == 2 else ("", block.args[0])
+        flags = {d.name: _word(d.args[0]) for d in block.children if len(d.args) == 1}
+        return Location(
+            modifier=modifier,
+            path=path,
+            alias=flags.get("alias"),
+            proxied=any(d.name == "proxy_pass" for d in block.children),
+            headers=self._headers(block),
+            sub_filters=[(_word(d.args[0]), _word(d.args[1])) for d in block.children
+                         if d.name == "sub_filter" and len(d.args) == 2],
+            sub_filter_once=flags.get("sub_filter_once", "on") == "on",
+            gzip_static=flags.get("gzip_static", "off") in ("on", "always"),
+            brotli_static=flags.get("brotli_static", "off") in ("on", "always"),
+            etag=flags.get("etag", "on") == "on",
+        )
+
+    def match(self, path: str) -> Location | None:
+        """nginx's choice for path: an exact match, else the longest prefix."""
+        for location in self.locations:
+            if location.modifier == "=" and location.path == path:
+                return location
+        prefixes = [l for l in self.locations if l.modifier != "=" and path.startswith(l.path)]
+        return max(prefixes, key=lambda l: len(l.path), default=None)
+
+    def file_for(self, location: Location, path: str) -> Path:
+        """File an alias location serves for path. KeyError for unknown variables."""
+        alias = _VAR_RE.sub(lambda m: self.variables[m.group(1) or m.group(2)], location.alias)
+        if location.modifier == "=":
+            return Path(alias)
+        return Path(alias + path[len(location.path):])
+
+
+class StandIn(ThreadingHTTPServer):
+    """Local stand-in for nginx on an ephemeral port."""
+
+    daemon_threads = True
+
+    def __init__(self, rules: ProxyRules, index_html: bytes):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.rules = rules
+        self.index_html = index_html
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        rules: ProxyRules = self.server.rules
+        path = unquote(urlsplit(self.path).path)
+        location = rules.match(path)
+        if location is None:
+            return self._send(404)
+
+        # Like nginx, a location's add_header replaces the server's entirely
+        headers = list(location.headers or rules.server_headers)
+
+        if location.proxied:
+            return self._upstream(path, location, headers)
+        if location.alias is None:
+            return self._send(404)
+
+        try:
+            file = rules.file_for(location, path)
+        except KeyError:
+            return self._send(500)
+        if not file.is_file():
+            return self._send(404)
+
+        if location.etag:
+            stat = file.stat()
+            etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+            headers.append(("ETag", etag))
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers=headers)
+
+        body, encoding = self._variant(file, location)
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        content_type = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+        self._send(200, body, [("Content-Type", content_type), *headers])
+
+    def _variant(self, file: Path, location: Location) -> tuple[bytes, str | None]:
+        """Precompressed copy the client accepts, as gzip_static/brotli_static pick it."""
+        accept = self.headers.get("Accept-Encoding", "")
+        for enabled, encoding, suffix in ((location.brotli_static, "br", ".br"), (location.gzip_static, "gzip", ".gz")):
+            variant = file.with_name(file.name + suffix)
+            if enabled and encoding in accept and variant.is_file():
+                return variant.read_bytes(), encoding
+        return file.read_bytes(), None
+
+    def _upstream(self, path: str, location: Location, headers: List[tuple[str, str]]) -> None:
+        if path not in ("/", "/index.html"):
+            return self._send(404)
+
+        page = self.server.index_html.decode("utf-8")
+        for search, replace in location.sub_filters:
+            page = page.replace(search, replace, 1 if location.sub_filter_once else -1)
+        self._send(200, page.encode("utf-8"), [("Content-Type", "text/html; charset=utf-8"), *headers])
+
+    def _send(self, status: int, body: bytes = b"", headers: List[tuple[str, str]] = ()) -> None:
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0" if status == 304 else str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+
+class Cached(NamedTuple):
+    body: bytes
+    content_type: str
+    link: str
+    etag: str | None
+    stored_at: float
+    max_age: float
+
+
+def _cache_policy(cache_control: str | None, etag: str | None) -> float | None:
+    """
+    Seconds a response stays fresh, 0 to store it but revalidate every time,
+    None to not store it. Without Cache-Control (and without Last-Modified,
+    which the stand-in does not send) there is no heuristic freshness, so the
+    response is only worth keeping if it has an ETag to revalidate with.
+    """
+    if cache_control is None:
+        return 0.0 if etag else None
+
+    directives = {}
+    for part in cache_control.split(","):
+        name, _, value = part.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    if "max-age" in directives:
+        try:
+            return float(directives["max-age"])
+        except ValueError:
+            return 0.0
+    return 0.0 if etag else None
+
+
+class _References(html.parser.HTMLParser):
+    """Subresource URLs of an HTML page, and its <base href>."""
+
+    def __init__(self):
+        super().__init__()
+        self.base: str | None = None
+        self.urls: List[str] = []
+        self._in_style = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "base" and attrs.get("href") and self.base is None:
+            self.base = attrs["href"]
+        elif tag == "link" and attrs.get("href"):
+            rel = (attrs.get("rel") or "").lower().split()
+            if {"stylesheet", "icon", "preload", "modulepreload"} & set(rel):
+                self.urls.append(attrs["href"])
+        elif tag in ("img", "script") and attrs.get("src"):
+            self.urls.append(attrs["src"])
+        elif tag == "style":
+            self._in_style = True
+
+    def handle_endtag(self, tag):
+        if tag == "style":
+            self._in_style = False
+
+    def handle_data(self, data):
+        if self._in_style:
+            self.urls.extend(m.group(2) for m in _CSS_URL_RE.finditer(data))
+
+
+def references(url: str, response: Cached) -> List[str]:
+    """Same-origin URLs a response makes the browser fetch next."""
+    refs = [m.group(1) for m in _LINK_PRELOAD_RE.finditer(response.link)]
+    base = url
+
+    if response.content_type.startswith("text/html"):
+        parser = _References()
+        parser.feed(response.body.decode("utf-8", "replace"))
+        base = urljoin(url, parser.base) if parser.base else url
+        refs.extend(parser.urls)
+    elif response.content_type.startswith("text/css"):
+        refs.extend(m.group(2) for m in _CSS_URL_RE.finditer(response.body.decode("utf-8", "replace")))
+
+    out = []
+    for ref in refs:
+        if ref.startswith(("data:", "#")):
+            continue
+        parts = urlsplit(urljoin(base, ref))
+        if parts.scheme or parts.netloc:
+            continue
+        out.append(parts.path + (f"?{parts.query}" if parts.query else ""))
+    return out
+
+
+class Browser:
+    """Sequential page loads with an HTTP cache, on a simulated clock."""
+
+    def __init__(self, port: int, host: str = "localhost"):
+        self.port = port
+        self.host = host
+        self.cache: Dict[str, Cached] = {}
+        self.clock = 0.0
+
+    def load(self, page: str = "/") -> Dict:
+        stats = dict.fromkeys(METRICS, 0)
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+
+        t0 = time.perf_counter()
+        pending, seen = [page], set()
+        try:
+            while pending:
+                url = pending.pop(0)
+                if url in seen:
+                    continue
+                seen.add(url)
+                response = self._fetch(conn, url, stats)
+                if response is not None:
+                    pending.extend(references(url, response))
+        finally:
+            conn.close()
+
+        stats["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        return stats
+
+    def _fetch(self, conn: http.client.HTTPConnection, url: str, stats: Dict) -> Cached | None:
+        cached = self.cache.get(url)
+        if cached is not None and self.clock - cached.stored_at < cached.max_age:
+            stats["cache_hits"] += 1
+            return cached
+
+        headers = {"Host": self.host, "Accept-Encoding": ACCEPT_ENCODING}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+
+        conn.request("GET", url, headers=headers)
+        resp = conn.getresponse()
+        raw = resp.read()
+        stats["requests"] += 1
+        stats["bytes"] += len(raw)
+
+        if resp.status == 304 and cached is not None:
+            stats["revalidated"] += 1
+            max_age = _cache_policy(resp.getheader("Cache-Control"), cached.etag)
+            self.cache[url] = cached._replace(stored_at=self.clock, max_age=max_age or 0.0)
+            return cached
+        if resp.status != 200:
+            stats["not_found"] += 1
+            return None
+
+        encoding = resp.getheader("Content-Encoding")
+        if encoding == "gzip":
+            raw = gzip.decompress(raw)
+        elif encoding == "br":
+            raw = brotli.decompress(raw)
+
+        etag = resp.getheader("ETag")
+        response = Cached(raw, resp.getheader("Content-Type", ""), resp.getheader("Link", ""), etag, self.clock, 0.0)
+        max_age = _cache_policy(resp.getheader("Cache-Control"), etag)
+        if max_age is None:
+            self.cache.pop(url, None)
+        else:
+            self.cache[url] = response._replace(max_age=max_age)
+        return response
+
+
+def simulate(conf_path: str | Path, index_html: str | Path = SAMPLE_INDEX, host: str = "localhost",
+             warm_after: float = 300.0) -> Dict[str, Dict]:
+    """Cold and warm load stats for the config at conf_path."""
+    rules = ProxyRules(Path(conf_path).read_text(encoding="utf-8"), host)
+    server = StandIn(rules, Path(index_html).read_bytes())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        browser = Browser(server.server_address[1], host)
+        cold = browser.load()
+        browser.clock += warm_after
+        warm = browser.load()
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {"cold": cold, "warm": warm}
+
+
+def before_after(conf_path: Path, assets_dir: Path, profile_path: Path, css_path: Path | None = None,
+                 index_html: Path = SAMPLE_INDEX, host: str | None = None, warm_after: float = 300.0,
+                 fingerprint: bool = False, inline_vars: str | None = None) -> Dict[str, Dict]:
+    """Simulate, apply the profile to a temporary copy of the site, simulate again."""
+    profile = load_profile(profile_path)
+    host = host or profile["host"] or "localhost"
+    css_path = css_path or assets_dir / "custom-theme.css"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        assets = work / "assets"
+        if assets_dir.is_dir():
+            shutil.copytree(assets_dir, assets, ignore=shutil.ignore_patterns(".revisions", ".cache"))
+        else:
+            assets.mkdir()
+        css = assets / css_path.name
+        if not css.is_file():
+            shutil.copy(css_path, css)
+
+        # Point the copied config at the copied files
+        conf = work / "tb-proxy"
+        text = conf_path.read_text(encoding="utf-8")
+        text = text.replace(str(css_path), str(css)).replace(str(assets_dir), str(assets))
+        conf.write_text(text, encoding="utf-8")
+
+        before = simulate(conf, index_html, host, warm_after)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            update_tb_batch(
+                [BrandProfile(conf, css, profile["variables"], profile["logo"], assets, profile["host"],
+                              profile["fonts"], profile["images"])],
+                fingerprint=fingerprint,
+                validate_cmd=["true"],
+                reload_cmd=["true"],
+                inline_vars=inline_vars,
+                # Temporary copies and `true` as nginx, nothing here needs root
+                require_root=False,
+            )
+
+        after = simulate(conf, index_html, host, warm_after)
+
+    return {"before": before, "after": after}
+
+
+def diff_table(before: Dict[str, Dict], after: Dict[str, Dict]) -> str:
+    """Fixed-width before/after table per load and metric."""
+    lines = [f"{'LOAD':<5} {'METRIC':<12} {'BEFORE':>10} {'AFTER':>10} {'DIFF':>10}"]
+    for load in ("cold", "warm"):
+        for metric in (*METRICS, "ms"):
+            a, b = before[load][metric], after[load][metric]
+            diff = f"{b - a:+.2f}" if metric == "ms" else f"{b - a:+d}"
+            lines.append(f"{load:<5} {metric:<12} {a:>10} {b:>10} {diff:>10}")
+    return "\n".join(lines)
+
+
+def load_table(report: Dict[str, Dict]) -> str:
+    """Fixed-width table of one simulation's metrics per load."""
+    lines = [f"{'LOAD':<5} {'METRIC':<12} {'VALUE':>10}"]
+    for load in ("cold", "warm"):
+        for metric in (*METRICS, "ms"):
+            lines.append(f"{load:<5} {metric:<12} {report[load][metric]:>10}")
+    return "\n".join(lines)
+
+
+def compare(report: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Loads that grew in requests/bytes beyond threshold, or lost cache hits."""
+    regressions = []
+    for load in ("cold", "warm"):
+        now, base = report[load], baseline.get(load)
+        if base is None:
+            continue
+        for metric in ("requests", "bytes"):
+            if now[metric] > base[metric] * (1 + threshold) and now[metric] > base[metric]:
+                regressions.append(f"{load} {metric}: {base[metric]} -> {now[metric]}")
+        if now["cache_hits"] < base["cache_hits"]:
+            regressions.append(f"{load} cache_hits: {base['cache_hits']} -> {now['cache_hits']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate cold and warm page loads through the proxy rules.")
+    parser.add_argument("--conf", type=Path, default=Path("/etc/nginx/sites-available/tb-proxy"))
+    parser.add_argument("--assets", type=Path, default=Path("/opt/custom_assets"))
+    parser.add_argument("--css", type=Path, help="Theme CSS, defaults to <assets>/custom-theme.css")
+    parser.add_argument("--index", type=Path, default=SAMPLE_INDEX, help="index.html the upstream serves")
+    parser.add_argument("--host", help="Host header, picks the server block and theme map entry")
+    parser.add_argument("--warm-after", type=float, default=300.0, help="Seconds between the cold and warm load")
+    parser.add_argument("--profile", type=Path, help="Apply this profile to a copy and report before vs after")
+    parser.add_argument("--fingerprint", action="store_true", help="Apply with content-hashed assets")
+    parser.add_argument("--inline-vars", choices=["inline", "preload"], help="Apply with inlined or preloaded vars")
+    parser.add_argument("--save", type=Path, help="Write the report as a JSON baseline")
+    parser.add_argument("--compare", type=Path, help="Compare against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed growth, 0.1 = 10%%")
+    args = parser.parse_args()
+
+    if args.profile:
+        report = before_after(args.conf, args.assets, args.profile, args.css, args.index, args.host,
+                              args.warm_after, args.fingerprint, args.inline_vars)
+        print(diff_table(report["before"], report["after"]))
+        final = report["after"]
+    else:
+        report = final = simulate(args.conf, args.index, args.host or "localhost", args.warm_after)
+        print(load_table(final))
+
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"\n[+] Report saved: {args.save}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        regressions = compare(final, baseline.get("after", baseline), args.threshold)
+        if regressions:
+            print("\n[X] Page weight regressions:")
+            for line in regressions:
+                print(f"- {line}")
+            sys.exit(1)
+        print(f"\n[+] No page weight regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
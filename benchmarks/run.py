@@ -0,0 +1,186 @@
+"""
+Benchmark suite for the override engine on synthetic large inputs.
+
+Run from the repo root:
+    python benchmarks/run.py                          # print timings
+    python benchmarks/run.py --save baseline.json     # store a baseline
+    python benchmarks/run.py --compare baseline.json  # fail on regressions
+
+nginx and systemctl are replaced by stub binaries on PATH, so the full
+apply path runs without touching a real proxy.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_css_model import make_css, make_overrides
+from tb_override import BrandProfile, FileIO, TBOverride, update_tb_batch
+
+CSS_SIZES = [10, 1_000, 10_000, 50_000]
+CONF_SIZES = [1, 10, 100, 1_000]
+QUICK_CSS_SIZES = [10, 1_000]
+QUICK_CONF_SIZES = [1, 100]
+
+LOGO_BLOCK = (
+    "    location = /assets/logo.svg {\n"
+    "        alias /opt/custom_assets/logo.svg;\n"
+    '        add_header Cache-Control "no-store";\n'
+    "    }\n"
+)
+
+
+def make_conf(servers: int) -> str:
+    """Return a proxy config with servers blocks; the last one has the marker."""
+    blocks = []
+    for i in range(servers):
+        marker = "    # $MAIN_LOGO$\n" if i == servers - 1 else ""
+        blocks.append(
+            "server {\n"
+            f"    listen {8000 + i % 1000};\n"
+            f"    server_name tenant{i}.example.com; # tenant {i}\n"
+            f"{marker}"
+            "    location / {\n"
+            "        proxy_pass http://localhost:8081/;\n"
+            "        proxy_set_header Host $host;\n"
+            "        sub_filter '</head>' '<link rel=\"stylesheet\" href=\"/assets/custom-theme.css\"></head>';\n"
+            "    }\n"
+            "}\n"
+        )
+    return "".join(blocks)
+
+
+def install_stubs(bin_dir: Path) -> None:
+    """Put no-op nginx/systemctl binaries first on PATH."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name in ("nginx", "systemctl"):
+        stub = bin_dir / name
+        stub.write_text("#!/bin/sh\nexit 0\n")
+        stub.chmod(0o755)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+
+def best_of(fn: Callable[[], None], setup: Callable[[], None] | None = None, repeat: int = 5) -> float:
+    """Best wall time of fn over repeat runs, stdout silenced."""
+    best = float("inf")
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run_suite(work: Path, quick: bool = False) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    css_sizes = QUICK_CSS_SIZES if quick else CSS_SIZES
+    conf_sizes = QUICK_CONF_SIZES if quick else CONF_SIZES
+
+    conf_path = work / "tb-proxy"
+    css_path = work / "custom-theme.css"
+    assets = work / "assets"
+    assets.mkdir(exist_ok=True)
+
+    for n in css_sizes:
+        css = make_css(n)
+        overrides = make_overrides(n)
+        fileio = FileIO(conf_path=conf_path, css_path=css_path)
+        results[f"override_css_value/{n}"] = best_of(
+            lambda: fileio.override_css_value(old_file=css, css_selectors=overrides)
+        )
+
+        def reset_css():
+            css_path.write_text(css, encoding="utf-8")
+
+        tbov = TBOverride(conf_path, css_path, assets_dir=assets)
+        results[f"override_theme/{n}"] = best_of(lambda: tbov.override_theme(overrides), setup=reset_css)
+
+    for servers in conf_sizes:
+        conf = make_conf(servers)
+
+        def reset_conf():
+            conf_path.write_text(conf, encoding="utf-8")
+
+        fileio = FileIO(conf_path=conf_path, css_path=css_path)
+        results[f"insert_block/{servers}"] = best_of(
+            lambda: fileio.insert_block(marker="$MAIN_LOGO$", data=LOGO_BLOCK), setup=reset_conf
+        )
+
+    # Full apply path: validate, stage, write, stub nginx -t + reload, precompress
+    logo = work / "upload.svg"
+    logo.write_text('<svg xmlns="http://www.w3.org/2000/svg"><path d="M 0.5,1.25 L 10,10 Z"/></svg>')
+    for n in css_sizes:
+        css = make_css(n)
+        conf = make_conf(conf_sizes[-1])
+        overrides = {"--tb-brand": "#123456"}
+
+        def reset_site():
+            css_path.write_text(css.replace("--tb-var-1:", "--tb-brand: #ff7a00;\n  --tb-var-1:", 1), encoding="utf-8")
+            conf_path.write_text(conf, encoding="utf-8")
+            shutil.rmtree(assets, ignore_errors=True)
+            assets.mkdir()
+
+        profile = BrandProfile(conf_path, css_path, overrides, logo, assets)
+        results[f"apply/{n}"] = best_of(lambda: update_tb_batch([profile], require_root=False), setup=reset_site, repeat=3)
+
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float) -> list[str]:
+    """Cases slower than baseline by more than threshold (0.25 = 25%)."""
+    regressions = []
+    for case, seconds in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        if seconds > base * (1 + threshold):
+            regressions.append(f"{case}: {base * 1000:.2f}ms -> {seconds * 1000:.2f}ms (+{(seconds / base - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the override engine.")
+    parser.add_argument("--save", type=Path, help="Write results as a JSON baseline")
+    parser.add_argument("--compare", type=Path, help="Compare against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--quick", action="store_true", help="Small sizes only")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        install_stubs(work / "bin")
+        results = run_suite(work, quick=args.quick)
+
+    for case, seconds in results.items():
+        print(f"{case:<32} {seconds * 1000:>10.2f} ms")
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"\n[+] Baseline saved: {args.save}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\n[X] Regressions beyond threshold:")
+            for line in regressions:
+                print(f"- {line}")
+            sys.exit(1)
+        print(f"\n[+] No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
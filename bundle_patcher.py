@@ -0,0 +1,81 @@
+import mmap
+import os
+import re
+from pathlib import Path
+from typing import Dict
+
+CHUNK = 1024 * 1024
+
+
+class BundlePatcher:
+    """
+    Patch hard-coded strings in ThingsBoard's compiled UI bundles.
+
+    The bundle is memory-mapped and all patterns are found in a single scan
+    with one compiled alternation (longest pattern first, so overlapping
+    patterns resolve leftmost-longest). The output is streamed to a sibling
+    file from mmap slices, never loading the bundle into Python strings.
+    """
+
+    def __init__(self, replacements: Dict[str, str]):
+        if not replacements:
+            raise ValueError("[X] No bundle replacements given")
+
+        self.replacements: Dict[bytes, bytes] = {
+            k.encode("utf-8"): v.encode("utf-8") for k, v in replacements.items()
+        }
+        if b"" in self.replacements:
+            raise ValueError("[X] Empty bundle pattern")
+
+        ordered = sorted(self.replacements, key=len, reverse=True)
+        self.pattern = re.compile(b"|".join(re.escape(p) for p in ordered))
+
+    @staticmethod
+    def sibling(path: str | Path) -> Path:
+        """main.abc123.js -> main.abc123.patched.js"""
+        path = Path(path)
+        return path.with_name(f"{path.stem}.patched{path.suffix}")
+
+    def patch(self, src: str | Path, dst: str | Path | None = None) -> Dict[str, int]:
+        """Stream a patched copy of src to dst. Returns hits per pattern."""
+        src = Path(src)
+        dst = Path(dst) if dst else self.sibling(src)
+        tmp = dst.with_name(dst.name + ".tmp")
+
+        hits = {k.decode("utf-8"): 0 for k in self.replacements}
+
+        try:
+            with open(src, "rb") as f_in, open(tmp, "wb") as f_out:
+                if os.fstat(f_in.fileno()).st_size == 0:
+                    raise ValueError(f"[X] Bundle is empty: {src}")
+
+                with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    view = memoryview(mm)
+                    try:
+                        pos = 0
+                        for m in self.pattern.finditer(mm):
+                            self._copy(f_out, view, pos, m.start())
+                            key = m.group()
+                            f_out.write(self.replacements[key])
+                            hits[key.decode("utf-8")] += 1
+                            pos = m.end()
+                        self._copy(f_out, view, pos, len(mm))
+                    finally:
+                        view.release()
+        except FileNotFoundError as e:
+            tmp.unlink(missing_ok=True)
+            raise FileNotFoundError(f"[X] Bundle not present: {src}") from e
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+        os.replace(tmp, dst)
+        return hits
+
+    @staticmethod
+    def _copy(f_out, view: memoryview, start: int, end: int) -> None:
+        """Write view[start:end] in bounded chunks, without copying into bytes."""
+        while start < end:
+            stop = min(start + CHUNK, end)
+            f_out.write(view[start:stop])
+            start = stop
@@ -0,0 +1,75 @@
+import hashlib
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from nginx_conf import semantic_tokens
+
+
+def file_digest(path: str | Path) -> str | None:
+    """Return the sha256 of a file's bytes, None if it does not exist."""
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def conf_digest(path: str | Path) -> str | None:
+    """Return a digest of the nginx config ignoring comments and whitespace."""
+    try:
+        text = Path(path).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    try:
+        tokens = semantic_tokens(text)
+    except ValueError:
+        # Unparseable, fall back to raw bytes so the change is not missed
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256("\0".join(tokens).encode("utf-8")).hexdigest()
+
+
+class Changes:
+    """What an apply actually changed on disk."""
+
+    def __init__(self, changed_files: List[Path], conf_changed: bool):
+        self.changed_files = changed_files
+        self.conf_changed = conf_changed
+
+    @property
+    def needs_reload(self) -> bool:
+        """CSS and assets are served via alias, only config changes need a reload."""
+        return self.conf_changed
+
+    def __bool__(self) -> bool:
+        return bool(self.changed_files)
+
+    def describe(self) -> str:
+        if not self.changed_files:
+            return "nothing changed"
+        kind = "config" if self.conf_changed else "served assets only"
+        return f"{len(self.changed_files)} file(s) changed ({kind})"
+
+
+class ChangeTracker:
+    """Hash the conf and assets before an apply, classify the difference after."""
+
+    def __init__(self, conf_paths: Iterable[str | Path], asset_paths: Iterable[str | Path] = ()):
+        self.conf_paths = [Path(p) for p in conf_paths]
+        self.asset_paths = [Path(p) for p in asset_paths]
+
+        self.before = self._snapshot()
+
+    def _snapshot(self) -> Dict[Path, tuple[str | None, str | None]]:
+        snap = {}
+        for path in self.conf_paths:
+            snap[path] = (file_digest(path), conf_digest(path))
+        for path in self.asset_paths:
+            snap[path] = (file_digest(path), None)
+        return snap
+
+    def classify(self) -> Changes:
+        after = self._snapshot()
+
+        changed_files = [p for p in after if after[p][0] != self.before[p][0]]
+        conf_changed = any(after[p][1] != self.before[p][1] for p in self.conf_paths)
+
+        return Changes(changed_files=changed_files, conf_changed=conf_changed)
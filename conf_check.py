@@ -0,0 +1,200 @@
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from nginx_conf import Block, Directive, parse_cached
+
+# Directives that must (True) or must not (False) open a block
+_BLOCKS = {
+    "http": True, "events": True, "server": True, "location": True, "upstream": True,
+    "map": True, "if": True, "types": True, "limit_except": True, "geo": True,
+    "alias": False, "root": False, "add_header": False, "proxy_pass": False,
+    "gzip_static": False, "brotli_static": False, "etag": False, "expires": False,
+    "open_file_cache": False, "open_file_cache_valid": False, "sub_filter": False,
+}
+
+# Argument count (min, max) for directives TBOverride generates or edits around
+_ARITY = {
+    "alias": (1, 1), "root": (1, 1), "proxy_pass": (1, 1),
+    "add_header": (2, 3), "expires": (1, 2), "sub_filter": (2, 2), "sub_filter_once": (1, 1),
+    "gzip_static": (1, 1), "brotli_static": (1, 1), "etag": (1, 1),
+    "open_file_cache": (1, 2), "open_file_cache_valid": (1, 1),
+    "location": (1, 2), "server": (0, 0), "listen": (1, None), "server_name": (1, None),
+    "map": (2, 2),
+}
+
+# Same name, different directive inside these blocks: (parent, name) -> (opens a block, arity)
+_NESTED = {
+    ("upstream", "server"): (False, (1, None)),
+}
+
+_FLAGS = {
+    "gzip_static": {"on", "off", "always"},
+    "brotli_static": {"on", "off", "always"},
+    "etag": {"on", "off"},
+    "sub_filter_once": {"on", "off"},
+}
+
+_NAME_RE = re.compile(r"^[A-Za-z_][\w-]*$")
+
+# Blocks whose children are table entries rather than directives
+_TABLES = {"map", "types", "geo", "split_clients"}
+
+_VAR_RE = re.compile(r"\$(\w+)|\$\{(\w+)\}")
+_LOCATION_MODIFIERS = {"=", "~", "~*", "^~"}
+
+
+def _walk(block: Block):
+    """Yield (parent, directive) for every directive under block."""
+    for child in block.children:
+        yield block, child
+        if isinstance(child, Block):
+            yield from _walk(child)
+
+
+def _check_syntax(text: str) -> Tuple[List[str], List[str]]:
+    """Static checks that only depend on the text. Returns (errors, alias targets)."""
+    try:
+        root = parse_cached(text)
+    except ValueError as e:
+        return [str(e).removeprefix("[X] ")], []
+
+    errors = []
+    aliases = []
+    # map result variable -> every value it can take
+    maps: Dict[str, List[str]] = {}
+    # (parent block offset, location match) -> line of the first definition
+    seen: Dict[Tuple[int, str], int] = {}
+
+    def line(d: Directive) -> int:
+        return text.count("\n", 0, d.start) + 1
+
+    for parent, d in _walk(root):
+        where = f"line {line(d)}"
+
+        if parent.name in _TABLES:
+            if parent.name == "map" and len(parent.args) == 2 and d.args:
+                maps.setdefault(parent.args[1].lstrip("$"), []).append(d.args[-1].strip("\"'"))
+            continue
+
+        if not _NAME_RE.match(d.name):
+            errors.append(f"{where}: invalid directive name '{d.name}'")
+            continue
+
+        is_block = isinstance(d, Block)
+        opens, arity = _NESTED.get((parent.name, d.name), (_BLOCKS.get(d.name), _ARITY.get(d.name, (0, None))))
+        if opens is not None and opens != is_block:
+            kind = "a block" if opens else "a simple directive"
+            errors.append(f"{where}: '{d.name}' must be {kind}")
+            continue
+
+        lo, hi = arity
+        if len(d.args) < lo or (hi is not None and len(d.args) > hi):
+            errors.append(f"{where}: wrong number of arguments for '{d.name}' ({len(d.args)})")
+            continue
+
+        if d.name in _FLAGS and d.args[0] not in _FLAGS[d.name]:
+            errors.append(f"{where}: invalid value '{d.args[0]}' for '{d.name}'")
+
+        if d.name == "location":
+            if len(d.args) == 2 and d.args[0] not in _LOCATION_MODIFIERS:
+                errors.append(f"{where}: invalid location modifier '{d.args[0]}'")
+                continue
+            modifier, path = (d.args if len(d.args) == 2 else ("", d.args[0]))
+            if modifier in ("~", "~*"):
+                continue
+            # Exact and prefix (with or without ^~) matches must be unique per level
+            key = (parent.start, ("=" if modifier == "=" else "") + path)
+            if key in seen:
+                errors.append(f"{where}: duplicate location '{' '.join(d.args)}' (first at line {seen[key]})")
+            else:
+                seen[key] = line(d)
+
+        if d.name == "alias":
+            aliases.append(d.args[0].strip("\"'"))
+
+    return errors, _expand_aliases(aliases, maps)
+
+
+def _expand_aliases(aliases: List[str], maps: Dict[str, List[str]]) -> List[str]:
+    """
+    Alias targets with map variables expanded over every mapped value;
+    targets using any other variable cannot be resolved here and are skipped.
+    """
+    out = []
+    for alias in aliases:
+        names = {a or b for a, b in _VAR_RE.findall(alias)}
+        if not names:
+            out.append(alias)
+            continue
+        if len(names) != 1 or next(iter(names)) not in maps:
+            continue
+        name = next(iter(names))
+        for value in dict.fromkeys(maps[name]):
+            out.append(_VAR_RE.sub(lambda m: value, alias))
+    return out
+
+
+def _check_alias(target: str) -> str | None:
+    path = Path(target)
+    if target.endswith("/"):
+        if not path.is_dir():
+            return f"alias target is not a directory: {target}"
+        if not os.access(path, os.R_OK | os.X_OK):
+            return f"alias directory is not readable: {target}"
+    else:
+        if not path.is_file():
+            return f"alias target does not exist: {target}"
+        if not os.access(path, os.R_OK):
+            return f"alias target is not readable: {target}"
+    return None
+
+
+class ConfCheckError(ValueError):
+    """The in-process pre-validation rejected a config."""
+
+
+class ConfChecker:
+    """
+    Cheap in-process checks run before `nginx -t`: brace balance, directive
+    syntax, duplicate exact/prefix locations and readable alias targets.
+    Parse results are cached by config hash; alias targets are re-checked
+    on every call since they depend on the filesystem, not the text.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.cache: Dict[str, Tuple[List[str], List[str]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def check_text(self, text: str) -> List[str]:
+        """Return a list of problems, empty if the config looks valid."""
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        cached = self.cache.get(key)
+        if cached is None:
+            self.misses += 1
+            cached = _check_syntax(text)
+            if len(self.cache) >= self.max_entries:
+                self.cache.pop(next(iter(self.cache)))
+            self.cache[key] = cached
+        else:
+            self.hits += 1
+
+        errors, aliases = cached
+        return errors + [e for e in map(_check_alias, aliases) if e]
+
+    def check(self, path: str | Path) -> List[str]:
+        return self.check_text(Path(path).read_text(encoding="utf-8"))
+
+    def require(self, path: str | Path) -> None:
+        """Raise ConfCheckError listing every problem in the config at path."""
+        errors = self.check(path)
+        if errors:
+            raise ConfCheckError(f"[X] Pre-validation failed for {path}:\n" + "\n".join(f"- {e}" for e in errors))
+
+
+# Shared checker, so long-running processes keep the cache warm
+checker = ConfChecker()
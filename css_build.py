@@ -0,0 +1,140 @@
+import hashlib
+import re
+from typing import Dict, List, Set
+
+from var_graph import references
+
+# Strings and unquoted url() are copied verbatim, comments are dropped
+_TOKEN_RE = re.compile(
+    r"(?P<comment>/\*.*?(?:\*/|\Z))"
+    r"|(?P<string>\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')"
+    r"|(?P<url>url\(\s*[^\s\"')][^)]*\))"
+    r"|(?P<punct>[{};])"
+    r"|(?P<text>[^\"'{};/]+|/)",
+    re.S | re.I,
+)
+_SPACE_RE = re.compile(r"\s+")
+_PRELUDE_OP_RE = re.compile(r" ?([,>~+]) ?")
+_VALUE_COMMA_RE = re.compile(r", ")
+_VALUE_PAREN_RE = re.compile(r"\( | \)| (?=!)")
+_PLACEHOLDER_RE = re.compile(r"\x00(\d+)\x00")
+
+_HEADER_RE = re.compile(r"/\*! tbov-build sha256:(?P<digest>[0-9a-f]+) \*/")
+
+
+def source_digest(css: str, flatten: bool = False) -> str:
+    """Short sha256 of a stylesheet source and the build options, recorded in the built file."""
+    data = css.encode("utf-8") + (b"\0flatten" if flatten else b"")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def built_from(built: str) -> str | None:
+    """Source digest recorded in a built stylesheet, None if it has none."""
+    m = _HEADER_RE.match(built)
+    return m.group("digest") if m else None
+
+
+def _segments(css: str) -> tuple[List[tuple[str, str]], List[str]]:
+    """
+    Split css into (text, terminator) pairs at { } ; with strings and url()
+    swapped for \\0n\\0 placeholders, and return them with the literals.
+    """
+    literals = []
+    segments = []
+    buf = []
+    for m in _TOKEN_RE.finditer(css):
+        kind = m.lastgroup
+        if kind == "comment":
+            buf.append(" ")
+        elif kind in ("string", "url"):
+            buf.append(f"\x00{len(literals)}\x00")
+            literals.append(m.group())
+        elif kind == "punct":
+            segments.append((_SPACE_RE.sub(" ", "".join(buf)).strip(), m.group()))
+            buf = []
+        else:
+            buf.append(m.group())
+    tail = _SPACE_RE.sub(" ", "".join(buf)).strip()
+    if tail:
+        segments.append((tail, ";"))
+    return segments, literals
+
+
+def _declaration(text: str) -> tuple[str, str] | None:
+    """(property, value) of a declaration segment, None for anything else."""
+    if text.startswith("@") or ":" not in text:
+        return None
+    prop, value = text.split(":", 1)
+    return prop.strip(), value.strip()
+
+
+def used_vars(css: str) -> Set[str]:
+    """Custom properties referenced by the rules, directly or through var() chains."""
+    segments, _ = _segments(css)
+
+    declared: Dict[str, List[str]] = {}
+    roots: Set[str] = set()
+    for text, end in segments:
+        decl = _declaration(text) if end != "{" else None
+        if decl is None:
+            roots |= references(text)
+        elif decl[0].startswith("--"):
+            declared.setdefault(decl[0], []).append(decl[1])
+        else:
+            roots |= references(decl[1])
+
+    used = set()
+    pending = list(roots)
+    while pending:
+        name = pending.pop()
+        if name in used:
+            continue
+        used.add(name)
+        for value in declared.get(name, ()):
+            pending.extend(references(value))
+    return used
+
+
+def minify_css(css: str, keep_vars: Set[str] | None = None) -> str:
+    """
+    Strip comments and whitespace. With keep_vars, custom property
+    declarations not in it are dropped. Rules left empty are dropped too.
+    """
+    segments, literals = _segments(css)
+
+    out: List[str] = []
+    opened: List[int] = []
+    for text, end in segments:
+        if end == "{":
+            opened.append(len(out))
+            # At-rule preludes may hold calc(), whose + needs its spaces
+            out.append((text if text.startswith("@") else _PRELUDE_OP_RE.sub(r"\1", text)) + "{")
+            continue
+
+        decl = _declaration(text)
+        if decl is not None:
+            prop, value = decl
+            if not (keep_vars is not None and prop.startswith("--") and prop not in keep_vars):
+                value = _VALUE_PAREN_RE.sub(lambda m: m.group().strip(), _VALUE_COMMA_RE.sub(",", value))
+                out.append(f"{prop}:{value};")
+        elif text:
+            out.append(text + ";")
+
+        if end == "}":
+            if out and out[-1].endswith(";") and opened and len(out) - 1 > opened[-1]:
+                out[-1] = out[-1][:-1]
+            start = opened.pop() if opened else None
+            if start is not None and start == len(out) - 1:
+                del out[start:]
+            else:
+                out.append("}")
+
+    return _PLACEHOLDER_RE.sub(lambda m: literals[int(m.group(1))], "".join(out))
+
+
+def build_production_css(css: str, digest: str | None = None) -> str:
+    """
+    Minified stylesheet without unused variables, headed by digest: the
+    source_digest() of what css was derived from (of css itself by default).
+    """
+    return f"/*! tbov-build sha256:{digest or source_digest(css)} */\n" + minify_css(css, keep_vars=used_vars(css))
@@ -0,0 +1,151 @@
+import re
+from typing import Dict, List
+
+# One alternation scanned left to right: comments are consumed first so that
+# declarations inside them are never indexed.
+_TOKEN_RE = re.compile(
+    r"(?P<comment>/\*.*?(?:\*/|\Z))"
+    r"|(?<![\w-])(?P<name>--[\w-]+)\s*:\s*"
+    r"(?P<value>(?:\"[^\"]*\"|'[^']*'|[^;{}\"'])*?)\s*;",
+    re.S,
+)
+_NUMBER_RE = re.compile(r"(?P<num>-?(?:\d+\.?\d*|\.\d+))(?P<unit>[a-zA-Z%]*)")
+_HEX_DIGITS_RE = re.compile(r"[0-9a-fA-F]{3,8}")
+
+# Longest value printed in full, data URIs can run to kilobytes
+LOG_VALUE_MAX = 60
+
+
+def short_value(value: str, limit: int = LOG_VALUE_MAX) -> str:
+    """value cut to limit characters for logging, with its full length noted."""
+    if len(value) <= limit:
+        return value
+    return f"{value[:limit]}... ({len(value)} chars)"
+
+
+class Declaration:
+    """A single `--name: value;` declaration inside the vars block."""
+
+    __slots__ = ("name", "value", "start", "end", "unit", "is_hex")
+
+    def __init__(self, name: str, value: str, start: int, end: int):
+        self.name = name
+        self.value = value
+
+        # Offsets of the value inside the block text
+        self.start = start
+        self.end = end
+
+        self.is_hex = value.startswith("#")
+        m = _NUMBER_RE.fullmatch(value)
+        self.unit = m.group("unit") if m else ""
+
+    def coerce(self, new_value: str) -> str:
+        """Give new_value the same `#` prefix / unit as the current value."""
+        new_value = new_value.strip()
+
+        if self.is_hex and _HEX_DIGITS_RE.fullmatch(new_value):
+            return f"#{new_value}"
+
+        if self.unit:
+            m = _NUMBER_RE.fullmatch(new_value)
+            if m and not m.group("unit"):
+                return f"{new_value}{self.unit}"
+
+        return new_value
+
+    def __repr__(self) -> str:
+        return f"Declaration({self.name!r}, {self.value!r}, {self.start}, {self.end})"
+
+
+class VarsBlock:
+    """Tokenized model of the TB_CUSTOM_THEME_VARS block."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+        self.declarations: List[Declaration] = []
+        self.comments: List[tuple[int, int]] = []
+        self.index: Dict[str, Declaration] = {}
+
+        # Number of values changed by the last render()
+        self.changed = 0
+
+        self._tokenize()
+
+    def _tokenize(self) -> None:
+        """Index every declaration and comment in a single scan."""
+        text = self.text
+
+        # The block starts right after the BEGIN marker, i.e. inside the
+        # banner comment. Skip to its closing `*/` if it is still open.
+        pos = 0
+        close = text.find("*/")
+        if close != -1 and text.find("/*", 0, close) == -1:
+            self.comments.append((0, close + 2))
+            pos = close + 2
+
+        for m in _TOKEN_RE.finditer(text, pos):
+            if m.group("comment") is not None:
+                self.comments.append(m.span())
+                continue
+
+            decl = Declaration(
+                name=m.group("name"),
+                value=m.group("value"),
+                start=m.start("value"),
+                end=m.end("value"),
+            )
+            self.declarations.append(decl)
+
+            # Last declaration wins, as in the cascade, so overrides edit the one in effect
+            self.index[decl.name] = decl
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def __len__(self) -> int:
+        return len(self.declarations)
+
+    def get(self, name: str) -> str | None:
+        """Return the current value of a variable."""
+        decl = self.index.get(name)
+        return decl.value if decl else None
+
+    def values(self) -> Dict[str, str]:
+        """Return {name: value} for every indexed variable."""
+        return {name: decl.value for name, decl in self.index.items()}
+
+    def render(self, css_selectors: Dict[str, str], quiet: bool = False) -> str:
+        """Apply all overrides in one pass and return the new block text. quiet skips the log."""
+        edits = []
+
+        for selector, new_value in css_selectors.items():
+            decl = self.index.get(selector)
+
+            if decl is None:
+                raise ValueError(f"[X] Variable not found in vars block: {selector}")
+
+            new_value = decl.coerce(new_value)
+
+            if new_value != decl.value:
+                if not quiet:
+                    print(f"Overriding: {short_value(decl.value)} -> {short_value(new_value)}")
+                edits.append((decl.start, decl.end, new_value))
+
+        self.changed = len(edits)
+
+        if not edits:
+            return self.text
+
+        edits.sort()
+
+        parts = []
+        pos = 0
+        for start, end, value in edits:
+            parts.append(self.text[pos:start])
+            parts.append(value)
+            pos = end
+        parts.append(self.text[pos:])
+
+        return "".join(parts)
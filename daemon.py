@@ -0,0 +1,466 @@
+import argparse
+import base64
+import binascii
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from asset_optimizer import LOGO_TYPES, check_image
+from changes import ChangeTracker
+from conf_check import ConfCheckError
+from staging import StagedChanges
+from tb_override import BrandProfile, TBOverride, apply_changes
+from variables import validate_overrides
+
+DEFAULT_SOCKET = "/run/tbov.sock"
+
+# Clients in the socket's group may submit overrides without being root
+SOCKET_MODE = 0o660
+
+# One request is a single JSON line; anything longer is not a profile
+MAX_REQUEST_BYTES = 1024 * 1024
+
+
+class ResidentStaging(StagedChanges):
+    """
+    Stage whose reads come from files kept in memory between batches. A
+    file is read from disk again only if its mtime, size or inode changed,
+    so edits made by anything else are still picked up.
+    """
+
+    def __init__(self, files: Dict[Path, tuple]):
+        super().__init__()
+        # path -> ((mtime_ns, size, inode), text), shared by every batch
+        self.files = files
+
+    @staticmethod
+    def _key(path: Path) -> tuple:
+        st = path.stat()
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def read(self, path: str | Path) -> str:
+        path = Path(path)
+        if path in self.pending:
+            return super().read(path)
+
+        key = self._key(path)
+        cached = self.files.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        data = path.read_text(encoding="utf-8")
+        self.files[path] = (key, data)
+        return data
+
+    def commit(self) -> None:
+        written = dict(self.pending)
+        super().commit()
+        for path, data in written.items():
+            # Only text is read back through the stage
+            if isinstance(data, str):
+                self.files[path] = (self._key(path), data)
+
+    def rollback(self) -> None:
+        for path in self.backups:
+            self.files.pop(path, None)
+        super().rollback()
+
+
+class Request:
+    """One client's overrides, and the result it is waiting for."""
+
+    def __init__(self, variables: Dict[str, str], logo: str | Path | None = None, host: str | None = None):
+        self.variables = variables
+        self.logo = Path(logo) if logo else None
+        self.host = host or None
+        # Logo written from uploaded bytes, removed once the request is done
+        self.uploaded = False
+
+        self.result: Dict = {}
+        self.done = threading.Event()
+
+    def finish(self, ok: bool, **result) -> None:
+        self.result = {"ok": ok, **result}
+        self.done.set()
+
+
+def parse_request(message, upload_dir: str | Path) -> Request:
+    """
+    Request from a decoded client message:
+    {"variables": {...}, "logo": {"name": "logo.svg", "data": base64}, "host": name}.
+    The logo travels as bytes the client could read, never as a path for root to open.
+    """
+    if not isinstance(message, dict):
+        raise ValueError("[X] Request must be a JSON object")
+    unknown = sorted(set(message) - {"variables", "logo", "host"})
+    if unknown:
+        raise ValueError(f"[X] Request fields not supported: {', '.join(unknown)}")
+
+    variables = message.get("variables", {})
+    if not isinstance(variables, dict):
+        raise ValueError("[X] Request 'variables' must be an object")
+
+    request = Request(
+        {str(k): str(v) for k, v in variables.items()},
+        None,
+        str(message["host"]) if message.get("host") else None,
+    )
+
+    logo = message.get("logo")
+    if logo:
+        request.logo = _save_upload(logo, Path(upload_dir))
+        request.uploaded = True
+    return request
+
+
+def _save_upload(logo, upload_dir: Path) -> Path:
+    """Check an uploaded logo by suffix and content and store it where only root can read it."""
+    if not isinstance(logo, dict) or not isinstance(logo.get("name"), str) or not isinstance(logo.get("data"), str):
+        raise ValueError("[X] Request 'logo' must be an object with 'name' and base64 'data'")
+    try:
+        data = base64.b64decode(logo["data"], validate=True)
+    except binascii.Error as e:
+        raise ValueError("[X] Request 'logo' data is not valid base64") from e
+
+    suffix = Path(logo["name"]).suffix.lower()
+    check_image(data, suffix, LOGO_TYPES)
+
+    upload_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+    # One file per request, another request may upload the same logo meanwhile
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=upload_dir)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return Path(path)
+
+
+class ApplyDaemon:
+    """
+    Long-running apply service on a Unix socket. Keeps one TBOverride per
+    site, the file texts and the parsed config resident, and merges requests
+    that arrive within window seconds of each other into one staged write,
+    one nginx -t and at most one reload. Every request gets its own result.
+    """
+
+    def __init__(self, conf_path: str | Path, css_path: str | Path, socket_path: str | Path = DEFAULT_SOCKET,
+                 assets_dir: str | Path = Path("/opt/custom_assets"), window: float = 0.2, max_batch: int = 64,
+                 validate_cmd: list[str] | None = None, reload_cmd: list[str] | None = None,
+                 timeout: float | None = None):
+        self.CONF = Path(conf_path)
+        self.CSS_FILE = Path(css_path)
+        self.CUSTOM_ASSETS = Path(assets_dir)
+        self.SOCKET = Path(socket_path)
+        # Logos uploaded over the socket, root-only
+        self.UPLOADS = self.CUSTOM_ASSETS / ".cache" / "uploads"
+
+        self.window = window
+        self.max_batch = max_batch
+        self.validate_cmd = validate_cmd
+        self.reload_cmd = reload_cmd
+        self.timeout = timeout
+
+        # Applied to every site
+        self.FINGERPRINT = False
+        self.INLINE_VARS: str | None = None
+        self.MINIFY_CSS = False
+
+        # Resident state: one TBOverride per host (None is the default site),
+        # so var() graphs survive between batches, and the files they read
+        self.sites: Dict[str | None, TBOverride] = {}
+        self.files: Dict[Path, tuple] = {}
+
+        self.queue: "queue.Queue[Request | None]" = queue.Queue()
+        self.server: socketserver.ThreadingUnixStreamServer | None = None
+        self._threads: List[threading.Thread] = []
+
+        # Counters
+        self.requests = 0
+        self.batches = 0
+        self.reloads = 0
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        return {"requests": self.requests, "batches": self.batches, "reloads": self.reloads}
+
+    def site(self, host: str | None) -> TBOverride:
+        tbov = self.sites.get(host)
+        if tbov is None:
+            tbov = BrandProfile(self.CONF, self.CSS_FILE, {}, None, self.CUSTOM_ASSETS, host).site()
+            tbov.FINGERPRINT = self.FINGERPRINT
+            tbov.INLINE_VARS = self.INLINE_VARS
+            tbov.MINIFY_CSS = self.MINIFY_CSS
+            self.sites[host] = tbov
+        return tbov
+
+    def submit(self, request: Request) -> Request:
+        """Queue a request for the next batch. Wait on request.done for the result."""
+        self.queue.put(request)
+        return request
+
+    def apply_batch(self, batch: List[Request]) -> None:
+        """Apply a batch of requests as one transaction and finish each of them."""
+        self.requests += len(batch)
+
+        # A bad request fails on its own, the rest still go through
+        groups: Dict[str | None, List[Request]] = {}
+        for request in batch:
+            normalised, errors = validate_overrides(request.variables)
+            if errors:
+                request.finish(False, error="Invalid overrides: " + "; ".join(errors))
+                continue
+            if request.logo is not None and not request.logo.is_file():
+                request.finish(False, error=f"Logo not present: {request.logo}")
+                continue
+            try:
+                site = self.site(request.host)
+            except ValueError as e:
+                request.finish(False, error=str(e).removeprefix("[X] "))
+                continue
+            request.variables = normalised
+            groups.setdefault(site.THEME_HOST, []).append(request)
+
+        accepted = [r for requests in groups.values() for r in requests]
+        if not accepted:
+            return
+
+        self.batches += 1
+        print(f"[+] Applying {len(accepted)} request(s) for {len(groups)} site(s)...")
+
+        staging = ResidentStaging(self.files)
+        sites = [self.site(host) for host in groups]
+        for tbov in sites:
+            tbov.fileio.staging = staging
+
+        assets = {tbov.fileio.CSS_FILE for tbov in sites}
+        if self.MINIFY_CSS:
+            assets |= {tbov.production_css for tbov in sites}
+        tracker = ChangeTracker(conf_paths=[self.CONF], asset_paths=assets)
+
+        # Later requests win where they set the same variable
+        merged: Dict[str | None, Dict[str, str]] = {}
+        revision = None
+        try:
+            try:
+                for host, requests in groups.items():
+                    tbov = self.site(host)
+                    merged[host] = {k: v for r in requests for k, v in r.variables.items()}
+                    logo = next((r.logo for r in reversed(requests) if r.logo is not None), None)
+
+                    with tbov.fileio.edit_conf():
+                        if merged[host]:
+                            tbov.override_theme(elements=merged[host])
+                        if logo is not None:
+                            tbov.override_main_logo(logo)
+                        if self.MINIFY_CSS:
+                            tbov.build_css()
+                        else:
+                            tbov.serve_source_css()
+                        if self.FINGERPRINT:
+                            tbov.fingerprint_assets()
+
+                for tbov in sites:
+                    tbov.stage_precompressed()
+                staging.commit()
+                try:
+                    reloaded = apply_changes(tracker, self.validate_cmd, self.reload_cmd, timeout=self.timeout)
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ConfCheckError):
+                    staging.rollback()
+                    raise
+            except Exception as e:
+                detail = _describe(e)
+                print(f"[X] Batch failed: {detail}")
+                for request in accepted:
+                    request.finish(False, error=detail, batch=len(accepted))
+                return
+            finally:
+                for tbov in sites:
+                    tbov.fileio.staging = None
+
+            for tbov in sites:
+                tbov.precompress_assets()
+                revision = tbov.record_revision("daemon") or revision
+        finally:
+            # Sites are resident, a failed batch's assets must not reach the next one
+            for tbov in sites:
+                tbov.served_assets.clear()
+        self.reloads += reloaded
+
+        for host, requests in groups.items():
+            for request in requests:
+                superseded = sorted(k for k, v in request.variables.items() if merged[host][k] != v)
+                request.finish(True, batch=len(accepted), reloaded=reloaded, revision=revision,
+                               superseded=superseded)
+
+    def _worker(self) -> None:
+        """Take requests off the queue, one batch per merge window."""
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+
+            try:
+                self.apply_batch(batch)
+            finally:
+                # Never leave a client hanging, whatever went wrong
+                for request in batch:
+                    if not request.done.is_set():
+                        request.finish(False, error="Request was not applied")
+                    if request.uploaded:
+                        request.logo.unlink(missing_ok=True)
+            print(f"- {self.counters}")
+
+            if stop:
+                return
+
+    def start(self) -> None:
+        """Listen on the socket and start applying in the background."""
+        # A socket left behind by an unclean exit would make bind() fail
+        self.SOCKET.unlink(missing_ok=True)
+        self.SOCKET.parent.mkdir(parents=True, exist_ok=True)
+
+        self.server = _Server(str(self.SOCKET), _Handler)
+        self.server.service = self
+        os.chmod(self.SOCKET, SOCKET_MODE)
+
+        self._threads = [
+            threading.Thread(target=self._worker, name="tbov-apply", daemon=True),
+            threading.Thread(target=self.server.serve_forever, name="tbov-socket", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        print(f"[+] Listening on {self.SOCKET} (window {self.window}s)")
+
+    def stop(self) -> None:
+        """Finish queued requests, then close the socket."""
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self.server = None
+        self.SOCKET.unlink(missing_ok=True)
+
+    def run(self) -> None:
+        """Serve until interrupted or terminated."""
+        signal.signal(signal.SIGTERM, _interrupt)
+        self.start()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            print("\n[+] Stopped serving.")
+        finally:
+            self.stop()
+
+
+def _interrupt(signum, frame) -> None:
+    # systemd stops services with SIGTERM, shut down as on Ctrl+C
+    raise KeyboardInterrupt
+
+
+def _describe(e: Exception) -> str:
+    """One-line reason for a failed batch, nginx's own message when there is one."""
+    if isinstance(e, subprocess.CalledProcessError):
+        lines = (e.stderr or "").strip().splitlines()
+        return lines[-1] if lines else f"{' '.join(e.cmd)} exited {e.returncode}"
+    if isinstance(e, subprocess.TimeoutExpired):
+        return f"{' '.join(e.cmd)} exceeded {e.timeout:g}s"
+    return str(e).removeprefix("[X] ").splitlines()[0]
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    service: ApplyDaemon
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        line = self.rfile.readline(MAX_REQUEST_BYTES)
+        try:
+            request = self.server.service.submit(parse_request(json.loads(line), self.server.service.UPLOADS))
+        except ValueError as e:
+            result = {"ok": False, "error": str(e).removeprefix("[X] ")}
+        else:
+            request.done.wait()
+            result = request.result
+        self.wfile.write(json.dumps(result).encode("utf-8") + b"\n")
+
+
+def submit(variables: Dict[str, str], logo: str | Path | None = None, host: str | None = None,
+           socket_path: str | Path = DEFAULT_SOCKET, timeout: float = 120.0) -> Dict:
+    """Send one override request to a running daemon and wait for its result."""
+    message = {"variables": variables, "logo": None, "host": host}
+    if logo:
+        # Read with the caller's own permissions, the daemon only sees the bytes
+        try:
+            data = Path(logo).read_bytes()
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"[X] Logo not present: {logo}") from e
+        message["logo"] = {"name": Path(logo).name, "data": base64.b64encode(data).decode("ascii")}
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        try:
+            s.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise ConnectionError(f"[X] Apply daemon not running on {socket_path}") from e
+        s.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        with s.makefile("rb") as f:
+            line = f.readline()
+
+    if not line:
+        raise ConnectionError(f"[X] Apply daemon closed the connection: {socket_path}")
+    return json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve override requests on a Unix socket.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("--conf", default="/etc/nginx/sites-available/tb-proxy")
+    parser.add_argument("--css", default="/opt/custom_assets/custom-theme.css")
+    parser.add_argument("--assets", default="/opt/custom_assets")
+    parser.add_argument("--window", type=float, default=0.2, help="Merge window in seconds")
+    parser.add_argument("--fingerprint", action="store_true", help="Serve content-hashed assets with immutable caching")
+    parser.add_argument("--inline-vars", choices=["inline", "preload"],
+                        help="Inline the theme vars into index.html, or preload the stylesheet")
+    parser.add_argument("--minify", action="store_true", help="Serve a minified build of the CSS")
+    args = parser.parse_args()
+
+    if os.geteuid() != 0:
+        print("Run script as sudo!")
+        raise SystemExit(1)
+
+    service = ApplyDaemon(args.conf, args.css, args.socket, assets_dir=args.assets, window=args.window)
+    service.FINGERPRINT = args.fingerprint
+    service.INLINE_VARS = args.inline_vars
+    service.MINIFY_CSS = args.minify
+    service.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Dict
+
+HASH_LEN = 12
+
+_CSS_URL_RE = re.compile(r"""url\(\s*(?P<q>['"]?)(?P<url>[^'")\s]+)(?P=q)\s*\)""")
+
+
+def content_hash(data: bytes) -> str:
+    """Short sha256 used in fingerprinted filenames."""
+    return hashlib.sha256(data).hexdigest()[:HASH_LEN]
+
+
+def file_hash(path: str | Path) -> str:
+    """content_hash of a file, read in chunks rather than all at once."""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()[:HASH_LEN]
+
+
+def hashed_name(name: str, digest: str) -> str:
+    """logo_title_white.svg -> logo_title_white.<digest>.svg"""
+    path = Path(name)
+    return f"{path.stem}.{digest}{path.suffix}"
+
+
+def fingerprinted_name(name: str, data: bytes) -> str:
+    """logo_title_white.svg -> logo_title_white.<hash>.svg"""
+    return hashed_name(name, content_hash(data))
+
+
+def write_fingerprinted(data: bytes, name: str, dest_dir: str | Path) -> Path:
+    """Store data under its content-hashed name in dest_dir, once."""
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+
+    dest = dest_dir / fingerprinted_name(name, data)
+
+    # Same name means same bytes, never rewrite an immutable file
+    if not dest.is_file():
+        tmp = dest.with_name(dest.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, dest)
+
+    return dest
+
+
+def rewrite_css_urls(css: str, mapping: Dict[str, str]) -> str:
+    """Point url() references found in mapping at their fingerprinted URLs."""
+    def _sub(m: re.Match) -> str:
+        url = m.group("url")
+        new = mapping.get(url.split("?", 1)[0])
+        if new is None:
+            return m.group(0)
+        return f'url("{new}")'
+
+    return _CSS_URL_RE.sub(_sub, css)
+
+
+def stylesheet_href_re(url_prefix: str, css_name: str, fingerprint_prefix: str) -> re.Pattern:
+    """
+    Match the stylesheet href in the conf, fingerprinted or not, with or without ?v=.
+    Only href values match, never a location or alias serving the same file.
+    """
+    path = Path(css_name)
+    return re.compile(
+        r"""(?:(?<=href=")|(?<=href=')|(?<=href=\\")|(?<=href=\\'))"""
+        rf"(?:{re.escape(fingerprint_prefix)}|{re.escape(url_prefix)})"
+        rf"{re.escape(path.stem)}(?:\.[0-9a-f]{{{HASH_LEN}}})?{re.escape(path.suffix)}"
+        rf"(?:\?v=[^'\"\s]*)?"
+    )
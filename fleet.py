@@ -0,0 +1,212 @@
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import shlex
+import subprocess
+import sys
+import time
+import tomllib
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+from tb_override import NGINX_RELOAD_CMD, NGINX_TEST_CMD, BrandProfile, update_tb_batch
+
+# Extra time past a target's timeout before a worker still running is
+# terminated, so a killed nginx command can roll the target back first
+STALL_GRACE = 2.0
+
+
+class Target(NamedTuple):
+    """One ThingsBoard deployment: its proxy config, assets and nginx commands."""
+    name: str
+    conf_path: Path
+    css_path: Path
+    assets_dir: Path
+    validate_cmd: List[str]
+    reload_cmd: List[str]
+    timeout: float
+
+
+class TargetResult(NamedTuple):
+    name: str
+    status: str  # "ok", "failed" or "timeout"
+    seconds: float
+    detail: str = ""
+    log: str = ""
+
+
+def _command(value, default: List[str]) -> List[str]:
+    if value is None:
+        return list(default)
+    if isinstance(value, str):
+        return shlex.split(value)
+    return [str(v) for v in value]
+
+
+def load_inventory(path: str | Path) -> List[Target]:
+    """
+    Load a fleet inventory from TOML or JSON:
+
+        [defaults]
+        validate = "nginx -t"
+        reload = "systemctl reload nginx"
+        timeout = 60
+
+        [[targets]]
+        name = "plant-a"
+        conf = "/mnt/plant-a/etc/nginx/sites-available/tb-proxy"
+        assets = "/mnt/plant-a/opt/custom_assets"
+
+    css defaults to <assets>/custom-theme.css; every default can be
+    overridden per target.
+    """
+    path = Path(path)
+
+    try:
+        raw = path.read_bytes()
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"[X] Inventory not present: {path}") from e
+
+    if path.suffix == ".toml":
+        data = tomllib.loads(raw.decode("utf-8"))
+    else:
+        data = json.loads(raw)
+
+    if not isinstance(data, dict) or not isinstance(data.get("targets"), list):
+        raise ValueError(f"[X] Inventory needs a 'targets' list: {path}")
+
+    defaults = data.get("defaults", {})
+    targets = []
+    names = set()
+    for i, entry in enumerate(data["targets"]):
+        opts = {**defaults, **entry}
+        if "conf" not in opts or "assets" not in opts:
+            raise ValueError(f"[X] Inventory target #{i + 1} needs 'conf' and 'assets': {path}")
+
+        assets = Path(opts["assets"])
+        name = str(opts.get("name", assets))
+        if name in names:
+            raise ValueError(f"[X] Duplicate inventory target name: {name}")
+        names.add(name)
+
+        targets.append(Target(
+            name=name,
+            conf_path=Path(opts["conf"]),
+            css_path=Path(opts.get("css", assets / "custom-theme.css")),
+            assets_dir=assets,
+            validate_cmd=_command(opts.get("validate"), NGINX_TEST_CMD),
+            reload_cmd=_command(opts.get("reload"), NGINX_RELOAD_CMD),
+            timeout=float(opts.get("timeout", 60)),
+        ))
+    return targets
+
+
+def _apply_target(target: Target, profile: Dict, fingerprint: bool, log: io.StringIO) -> TargetResult:
+    t0 = time.perf_counter()
+    try:
+        update_tb_batch(
+            [BrandProfile(target.conf_path, target.css_path, profile["variables"], profile["logo"], target.assets_dir,
+                          profile.get("host"), profile.get("fonts"), profile.get("images"), profile.get("bundles"))],
+            fingerprint=fingerprint,
+            validate_cmd=target.validate_cmd,
+            reload_cmd=target.reload_cmd,
+            timeout=target.timeout,
+        )
+    except subprocess.TimeoutExpired as e:
+        return TargetResult(target.name, "timeout", time.perf_counter() - t0,
+                            f"{shlex.join(e.cmd)} exceeded {e.timeout:g}s", log.getvalue())
+    except subprocess.CalledProcessError as e:
+        detail = (e.stderr or "").strip().splitlines()
+        return TargetResult(target.name, "failed", time.perf_counter() - t0,
+                            detail[-1] if detail else f"{shlex.join(e.cmd)} exited {e.returncode}", log.getvalue())
+    except Exception as e:
+        return TargetResult(target.name, "failed", time.perf_counter() - t0,
+                            str(e).splitlines()[0], log.getvalue())
+    return TargetResult(target.name, "ok", time.perf_counter() - t0, log=log.getvalue())
+
+
+def _run_target(target: Target, profile: Dict, fingerprint: bool, conn) -> None:
+    """Worker process: apply one target with its output captured, and send the result back."""
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        result = _apply_target(target, profile, fingerprint, log)
+    conn.send(result)
+    conn.close()
+
+
+def apply_fleet(targets: List[Target], profile: Dict, fingerprint: bool = False,
+                workers: int = 4) -> List[TargetResult]:
+    """
+    Apply one profile to every target with at most workers in flight.
+    Each target is its own transaction (stage, nginx -t, reload, rollback on
+    failure) in its own process, so its output is captured apart from the
+    others. nginx commands are killed at the target's timeout, and a worker
+    still running STALL_GRACE seconds later is terminated and reported as
+    "timeout". A target is only reported once its worker has exited, so
+    nothing can still commit or reload after the summary. Results come back
+    in inventory order.
+    """
+    if os.geteuid() != 0:
+        print(f"Run script as sudo!")
+        sys.exit(1)
+
+    # Fork keeps the caller's module state, spawn would re-import everything per target
+    ctx = multiprocessing.get_context("fork")
+    queued = list(targets)
+    running: Dict[str, list] = {}
+    results: Dict[str, TargetResult] = {}
+
+    while len(results) < len(targets):
+        while queued and len(running) < max(1, workers):
+            target = queued.pop(0)
+            recv, send = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_run_target, args=(target, profile, fingerprint, send),
+                               name=f"tbov-fleet-{target.name}")
+            proc.start()
+            send.close()
+            running[target.name] = (target, proc, recv, time.perf_counter())
+
+        for name, (target, proc, recv, t0) in list(running.items()):
+            elapsed = time.perf_counter() - t0
+            if recv.poll():
+                try:
+                    results[name] = recv.recv()
+                except EOFError:
+                    results[name] = TargetResult(name, "failed", elapsed, f"worker exited with {proc.exitcode}")
+                proc.join()
+                recv.close()
+                del running[name]
+            elif elapsed > target.timeout + STALL_GRACE:
+                # Stuck past its own rollback, e.g. on a hung filesystem: stop it so the fleet can finish
+                print(f"[X] {name}: still running {elapsed:.0f}s in, terminating its worker")
+                _stop(proc)
+                results[name] = TargetResult(name, "timeout", elapsed,
+                                             f"apply exceeded {target.timeout:g}s, worker terminated")
+                recv.close()
+                del running[name]
+        time.sleep(0.01)
+
+    return [results[t.name] for t in targets]
+
+
+def _stop(proc) -> None:
+    """Terminate a worker, and kill it if it does not exit within STALL_GRACE."""
+    proc.terminate()
+    proc.join(STALL_GRACE)
+    if proc.is_alive():
+        proc.kill()
+        proc.join()
+
+
+def summary_table(results: List[TargetResult]) -> str:
+    """Fixed-width table of per-target status and timing, with totals."""
+    width = max([len("TARGET")] + [len(r.name) for r in results])
+    lines = [f"{'TARGET':<{width}}  {'STATUS':<7}  {'TIME':>8}  DETAIL"]
+    for r in results:
+        lines.append(f"{r.name:<{width}}  {r.status:<7}  {r.seconds:>7.2f}s  {r.detail}".rstrip())
+
+    ok = sum(r.status == "ok" for r in results)
+    lines.append(f"\n{ok}/{len(results)} target(s) applied, {len(results) - ok} failed")
+    return "\n".join(lines)
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+import re
+from pathlib import Path
+from typing import Iterable, List, NamedTuple
+
+# Latin plus common punctuation and symbols, as the usual "latin" web font subset
+DEFAULT_UNICODE_RANGES = (
+    "U+0000-00FF, U+0131, U+0152-0153, U+02BB-02BC, U+02C6, U+02DA, U+02DC, "
+    "U+2000-206F, U+2074, U+20AC, U+2122, U+2191, U+2193, U+2212, U+2215, U+FEFF, U+FFFD"
+)
+
+# Used behind the brand font while it loads, and for missing glyphs
+FALLBACK_STACK = 'Roboto, "Helvetica Neue", sans-serif'
+
+FONT_SUFFIXES = (".ttf", ".otf", ".woff", ".woff2")
+
+_FORMATS = {".woff2": "woff2", ".woff": "woff", ".ttf": "truetype", ".otf": "opentype"}
+
+_RANGE_RE = re.compile(r"U\+(?P<lo>[0-9A-F]{1,6})(?:-(?P<hi>[0-9A-F]{1,6}))?", re.I)
+
+
+def parse_unicode_ranges(ranges: str) -> List[tuple[int, int]]:
+    """'U+0000-00FF, U+0131' -> [(0x0, 0xff), (0x131, 0x131)]"""
+    out = []
+    for part in ranges.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        m = _RANGE_RE.fullmatch(part)
+        if not m:
+            raise ValueError(f"[X] Not a unicode range like U+0000-00FF: {part!r}")
+        lo = int(m.group("lo"), 16)
+        hi = int(m.group("hi") or m.group("lo"), 16)
+        if hi < lo:
+            raise ValueError(f"[X] Unicode range ends before it starts: {part!r}")
+        out.append((lo, hi))
+    return out
+
+
+def font_format(path: str | Path) -> str:
+    """The @font-face format() name for a font file."""
+    return _FORMATS[Path(path).suffix.lower()]
+
+
+def font_stack(family: str) -> str:
+    """--tb-font-family value with the brand family first."""
+    return f'"{family}", {FALLBACK_STACK}'
+
+
+class FontPipeline:
+    """Subset uploaded fonts to the configured glyph ranges and convert them to WOFF2, cached by input hash."""
+
+    def __init__(self, cache_dir: str | Path, unicode_ranges: str = DEFAULT_UNICODE_RANGES):
+        self.CACHE = Path(cache_dir)
+        self.unicode_ranges = unicode_ranges
+        self.ranges = parse_unicode_ranges(unicode_ranges)
+
+    def _cache_dir(self, data: bytes) -> Path:
+        key = hashlib.sha256(data + f"|font|{self.unicode_ranges}".encode()).hexdigest()[:16]
+        return self.CACHE / key
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def build(self, src: str | Path) -> Path:
+        """
+        Return the web font for src: a WOFF2 subset, a WOFF subset when
+        brotli is missing, or src unchanged when fontTools is missing.
+        """
+        src = Path(src)
+        if src.suffix.lower() not in FONT_SUFFIXES:
+            raise ValueError(f"[X] Unsupported font type {src.suffix!r}, expected one of {', '.join(FONT_SUFFIXES)}: {src}")
+        try:
+            data = src.read_bytes()
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"[X] Font not present: {src}") from e
+
+        out_dir = self._cache_dir(data)
+        for cached in (out_dir / "font.woff2", out_dir / "font.woff"):
+            if cached.is_file():
+                return cached
+
+        # Font tooling is optional and slow to import, load it on demand
+        try:
+            from fontTools import subset
+        except ImportError:
+            print(f"- fontTools not installed, serving {src.name} without subsetting.")
+            return src
+
+        try:
+            import brotli  # noqa: F401 - fontTools needs it for WOFF2
+            flavor = "woff2"
+        except ImportError:
+            print("- brotli not installed, writing WOFF instead of WOFF2.")
+            flavor = "woff"
+
+        options = subset.Options()
+        options.flavor = flavor
+        options.layout_features = ["*"]
+
+        font = subset.load_font(str(src), options)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=[c for lo, hi in self.ranges for c in range(lo, hi + 1)])
+        subsetter.subset(font)
+
+        buf = io.BytesIO()
+        subset.save_font(font, buf, options)
+        font.close()
+
+        out = out_dir / f"font.{flavor}"
+        print(f"- Subset font {src.name}: {len(data)} -> {len(buf.getvalue())} bytes ({flavor})")
+        self._write(out, buf.getvalue())
+        return out
+
+
+class FontFace(NamedTuple):
+    """One served font file of the brand family."""
+    url: str
+    weight: str = "400"
+    style: str = "normal"
+    # Only set for subset files, a full font covers every glyph it has
+    unicode_range: str | None = None
+
+
+def font_face_rules(family: str, faces: Iterable[FontFace]) -> str:
+    """@font-face rules with font-display: swap, so text renders in the fallback font first."""
+    rules = []
+    for face in faces:
+        lines = [
+            "@font-face{",
+            f'  font-family: "{family}";',
+            f"  font-style: {face.style};",
+            f"  font-weight: {face.weight};",
+            "  font-display: swap;",
+            f'  src: url("{face.url}") format("{font_format(face.url)}");',
+        ]
+        if face.unicode_range:
+            lines.append(f"  unicode-range: {', '.join(p.strip() for p in face.unicode_range.split(','))};")
+        lines.append("}")
+        rules.append("\n".join(lines))
+    return "\n".join(rules)
@@ -1,6 +1,7 @@
+import argparse
+import sys
 from pathlib import Path
-from tb_override import update_tb, TBOverride
-from selection import Selection
+from tb_override import update_tb, update_tb_batch, rollback_revision, BrandProfile, TBOverride
 
 banner = r"""
 ████████╗██████╗        ██████╗ ██╗   ██╗███████╗██████╗ ██████╗ ██╗██████╗ ███████╗
@@ -14,6 +15,9 @@ banner = r"""
 
 class Menu:
     def __init__(self, conf_path: str, css_path: str):
+        # TUI stack (questionary, rich) is only needed for the interactive menu
+        from selection import Selection
+
         self.s = Selection()
         self.t = TBOverride(conf_path, css_path)
     
@@ -43,11 +47,12 @@ class Menu:
                     
                     elif action == "Set new value":
                         value = self.s.enter_input(var)
-                        # print(list(var.keys())[0], value)
-                        pending_changes[list(var.keys())[0]] = value
+                        # A cancelled prompt leaves the variable as it was
+                        if value is not None:
+                            pending_changes[list(var.keys())[0]] = value
                     
                     elif action == "Reset to default":
-                        value = list(var.values())[0]
+                        value = list(var.values())[0]["default"]
                         pending_changes[list(var.keys())[0]] = value
                 
             elif menu == "Logo Change":
@@ -55,11 +60,192 @@ class Menu:
                 pending_changes["logo_path"] = path
         return pending_changes
     
-def main():
+def apply(profile_path: str, conf_path: Path, css_path: Path, assets_dir: Path, fingerprint: bool = False,
+          inline_vars: str | None = None, inline_image_max: int | None = None, minify_css: bool = False,
+          flatten_vars: bool = False) -> None:
+    '''Apply a declarative profile without the interactive menu'''
+    from profile_loader import load_profile
+    
+    profile = load_profile(profile_path)
+    update_tb_batch(
+        [BrandProfile(conf_path, css_path, profile["variables"], profile["logo"], assets_dir, profile["host"],
+                      profile["fonts"], profile["images"], profile["bundles"])],
+        fingerprint=fingerprint,
+        inline_vars=inline_vars,
+        inline_image_max=inline_image_max,
+        minify_css=minify_css,
+        flatten_vars=flatten_vars,
+    )
+
+def apply_via_daemon(profile_path: str, socket_path: str, **options) -> bool:
+    '''Hand a profile to a running apply daemon instead of applying in-process. Returns True if applied'''
+    from daemon import submit
+    from profile_loader import load_profile
+    
+    # The daemon applies with the options it was started with, and takes no font, image or bundle files
+    flags = [f"--{name.replace('_', '-')}" for name, value in options.items() if value not in (None, False)]
+    if flags:
+        print(f"[X] {', '.join(flags)} cannot be sent to the daemon, start daemon.py with them instead.")
+        return False
+    
+    profile = load_profile(profile_path)
+    sections = [f"[{name}]" for name in ("fonts", "images", "bundles") if profile[name]]
+    if sections:
+        print(f"[X] The daemon does not apply {' or '.join(sections)}, apply {profile_path} without --socket.")
+        return False
+    
+    result = submit(profile["variables"], profile["logo"], profile["host"], socket_path=socket_path)
+    if not result["ok"]:
+        print(f"[X] {result['error']}")
+        return False
+    
+    reload = "reloaded" if result["reloaded"] else "no reload needed"
+    print(f"[+] Applied in a batch of {result['batch']} request(s), {reload}.")
+    if result["superseded"]:
+        print(f"- Overridden by a later request in the batch: {', '.join(result['superseded'])}")
+    return True
+
+def fleet(inventory_path: str, profile_path: str, workers: int = 4, fingerprint: bool = False) -> bool:
+    '''Apply a profile to every deployment in an inventory. Returns True if all succeeded'''
+    from fleet import apply_fleet, load_inventory, summary_table
+    from profile_loader import load_profile
+    
+    targets = load_inventory(inventory_path)
+    profile = load_profile(profile_path)
+    print(f"[+] Applying {profile_path} to {len(targets)} target(s), {workers} at a time...")
+    
+    results = apply_fleet(targets, profile, fingerprint=fingerprint, workers=workers)
+    print(summary_table(results))
+    return all(r.status == "ok" for r in results)
+
+def history(assets_dir: Path, keep: int | None = None, max_age_days: float | None = None) -> None:
+    '''List recorded revisions, optionally garbage collecting first'''
+    from datetime import datetime
+    from revisions import RevisionStore
+    
+    store = RevisionStore(assets_dir / ".revisions")
+    if keep is not None or max_age_days is not None:
+        revs, objects = store.gc(keep=keep if keep is not None else 20, max_age_days=max_age_days)
+        print(f"[+] Removed {revs} revision(s) and {objects} object(s).")
+    
+    for rev in store.history():
+        created = datetime.fromtimestamp(rev["created"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{rev['id']}  {created}  {len(rev['files'])} file(s)  {rev['message']}")
+
+def palette(seeds_path: str, out_dir: Path) -> bool:
+    '''Derive full themes from a CSV of seed colours into one JSON profile per tenant'''
+    import csv
+    import json
+    from palette import PaletteSet
+    from variables import validate_overrides
+    
+    with open(seeds_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    
+    palettes = PaletteSet(
+        brand=[r["brand"] for r in rows],
+        background=[r.get("background") or None for r in rows],
+        brand_2=[r.get("brand_2") or None for r in rows],
+    )
+    
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ok = True
+    for row, overrides in zip(rows, palettes.overrides()):
+        _, errors = validate_overrides(overrides)
+        if errors:
+            print(f"[X] {row['tenant']}: " + "; ".join(errors))
+            ok = False
+        (out_dir / f"{row['tenant']}.json").write_text(json.dumps({"variables": overrides}, indent=2), encoding="utf-8")
+    
+    for pair, indices in palettes.failing().items():
+        ok = False
+        print(f"[X] {pair} below WCAG contrast for {len(indices)} tenant(s): "
+              + ", ".join(rows[i]["tenant"] for i in indices[:10]))
+    
+    print(f"[+] Wrote {len(rows)} profile(s) to {out_dir}")
+    return ok
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="White-label overrides for ThingsBoard CE.")
+    parser.add_argument("--conf", type=Path, default=Path("/etc/nginx/sites-available/tb-proxy"))
+    parser.add_argument("--css", type=Path, default=Path("/opt/custom_assets/custom-theme.css"))
+    parser.add_argument("--assets", type=Path, default=Path("/opt/custom_assets"))
+    
+    sub = parser.add_subparsers(dest="command")
+    apply_parser = sub.add_parser("apply", help="Apply a TOML/JSON profile non-interactively")
+    apply_parser.add_argument("profile", help="Profile with [variables] and an optional logo path")
+    apply_parser.add_argument("--fingerprint", action="store_true", help="Serve content-hashed assets with immutable caching")
+    apply_parser.add_argument("--inline-vars", choices=["inline", "preload"],
+                              help="Inline the theme vars into index.html, or preload the stylesheet")
+    apply_parser.add_argument("--inline-image-max", type=int, metavar="BYTES",
+                              help="Largest [images] file inlined into the CSS as a data URI (default 4096)")
+    apply_parser.add_argument("--minify", action="store_true",
+                              help="Serve a minified build of the CSS, keeping the annotated file as the source")
+    apply_parser.add_argument("--flatten-vars", action="store_true",
+                              help="Serve a copy of the CSS with var() chains resolved to literal values")
+    apply_parser.add_argument("--socket", help="Submit to the apply daemon on this Unix socket (see daemon.py)")
+    apply_parser.add_argument("--trace-json", help="Append per-phase JSON spans to this file ('-' for stderr)")
+    apply_parser.add_argument("--metrics-textfile", help="node_exporter textfile (.prom) for phase metrics")
+    
+    fleet_parser = sub.add_parser("fleet", help="Apply a profile to many deployments concurrently")
+    fleet_parser.add_argument("inventory", help="TOML/JSON inventory of [[targets]] with conf/assets/validate/reload")
+    fleet_parser.add_argument("profile", help="Profile with [variables] and an optional logo path")
+    fleet_parser.add_argument("--workers", type=int, default=4, help="Targets applied in parallel")
+    fleet_parser.add_argument("--fingerprint", action="store_true", help="Serve content-hashed assets with immutable caching")
+    
+    palette_parser = sub.add_parser("palette", help="Derive full themes from seed colours (needs NumPy)")
+    palette_parser.add_argument("seeds", help="CSV with tenant,brand[,brand_2][,background] columns")
+    palette_parser.add_argument("out_dir", type=Path, help="Directory for the generated JSON profiles")
+    
+    rollback_parser = sub.add_parser("rollback", help="Restore a recorded revision and reload once")
+    rollback_parser.add_argument("revision", nargs="?", help="Revision id, defaults to the one before the latest")
+    
+    history_parser = sub.add_parser("history", help="List recorded revisions")
+    history_parser.add_argument("--gc-keep", type=int, help="Garbage collect, keeping this many revisions")
+    history_parser.add_argument("--gc-max-age", type=float, help="Garbage collect revisions older than this many days")
+    
+    return parser.parse_args(argv)
+
+def main(argv: list[str] | None = None):
     '''Run the program'''
+    args = parse_args(argv)
+    
+    if args.command == "apply" and args.socket:
+        if not apply_via_daemon(args.profile, args.socket, fingerprint=args.fingerprint, inline_vars=args.inline_vars,
+                                inline_image_max=args.inline_image_max, minify=args.minify,
+                                flatten_vars=args.flatten_vars):
+            sys.exit(1)
+        return
+    
+    if args.command == "apply":
+        from telemetry import tracer
+        tracer.configure(json_log=args.trace_json, textfile=args.metrics_textfile)
+        apply(args.profile, args.conf, args.css, args.assets, fingerprint=args.fingerprint,
+              inline_vars=args.inline_vars, inline_image_max=args.inline_image_max, minify_css=args.minify,
+              flatten_vars=args.flatten_vars)
+        return
+    
+    if args.command == "palette":
+        if not palette(args.seeds, args.out_dir):
+            sys.exit(1)
+        return
+    
+    if args.command == "rollback":
+        rollback_revision(args.conf, args.assets, args.revision)
+        return
+    
+    if args.command == "history":
+        history(args.assets, keep=args.gc_keep, max_age_days=args.gc_max_age)
+        return
+    
+    if args.command == "fleet":
+        if not fleet(args.inventory, args.profile, workers=args.workers, fingerprint=args.fingerprint):
+            sys.exit(1)
+        return
+    
     print(banner)
-    conf_path = Path("/etc/nginx/sites-available/tb-proxy")
-    css_path = Path("/opt/custom_assets/custom-theme.css")
+    conf_path = args.conf
+    css_path = args.css
     menu = Menu(conf_path, css_path)
     overrides = menu.prompt()
     if "logo_path" not in list(overrides.keys()):
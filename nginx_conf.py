@@ -0,0 +1,421 @@
+import re
+import threading
+from typing import Dict, Iterator, List, Tuple
+
+_TOKEN_RE = re.compile(
+    r"""
+     (?P<ws>\s+)
+    |(?P<comment>\#[^\n]*)
+    |(?P<open>\{)
+    |(?P<close>\})
+    |(?P<semi>;)
+    |(?P<word>(?:"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|\\.|\$\{[^}]*\}|[^\s;{}"'\\])+)
+    """,
+    re.X | re.S,
+)
+
+
+def tokenize(text: str) -> Iterator[Tuple[str, str, int, int]]:
+    """Yield (kind, value, start, end) for every non-whitespace token."""
+    pos = 0
+    size = len(text)
+    while pos < size:
+        m = _TOKEN_RE.match(text, pos)
+        if m is None:
+            raise ValueError(f"[X] Unterminated quote in nginx config at offset {pos}")
+        kind = m.lastgroup
+        if kind != "ws":
+            yield kind, m.group(), m.start(), m.end()
+        pos = m.end()
+
+
+class Directive:
+    """`name args;` with its offsets in the config text."""
+
+    __slots__ = ("name", "args", "start", "end")
+
+    def __init__(self, name: str, args: List[str], start: int, end: int):
+        self.name = name
+        self.args = args
+        self.start = start
+        self.end = end
+
+    def __repr__(self) -> str:
+        return f"Directive({self.name!r}, {self.args!r})"
+
+
+class Block(Directive):
+    """`name args { ... }`; end is just past the closing brace."""
+
+    __slots__ = ("children",)
+
+    def __init__(self, name: str, args: List[str], start: int, end: int = -1):
+        super().__init__(name, args, start, end)
+        self.children: List[Directive] = []
+
+    def find(self, name: str) -> List[Directive]:
+        """Return direct children called name."""
+        return [c for c in self.children if c.name == name]
+
+    def __repr__(self) -> str:
+        return f"Block({self.name!r}, {self.args!r}, {len(self.children)} children)"
+
+
+def location_key(block: Block) -> str:
+    """Index key of a location: modifier and match path, e.g. '= /assets/x.svg'."""
+    return " ".join(block.args)
+
+
+def parse(text: str) -> Block:
+    """Parse nginx config text into a tree rooted at a synthetic 'main' block."""
+    root = Block("main", [], 0)
+    stack = [root]
+    words: List[str] = []
+    start = -1
+
+    for kind, value, tok_start, tok_end in tokenize(text):
+        if kind == "comment":
+            continue
+
+        if kind == "word":
+            if not words:
+                start = tok_start
+            words.append(value)
+        elif kind == "semi":
+            if not words:
+                raise ValueError(f"[X] Unexpected ';' in nginx config at offset {tok_start}")
+            stack[-1].children.append(Directive(words[0], words[1:], start, tok_end))
+            words = []
+        elif kind == "open":
+            if not words:
+                raise ValueError(f"[X] Unexpected '{{' in nginx config at offset {tok_start}")
+            block = Block(words[0], words[1:], start)
+            stack[-1].children.append(block)
+            stack.append(block)
+            words = []
+        elif kind == "close":
+            if words or len(stack) == 1:
+                raise ValueError(f"[X] Unexpected '}}' in nginx config at offset {tok_start}")
+            stack.pop().end = tok_end
+
+    if words or len(stack) != 1:
+        raise ValueError("[X] Unexpected end of nginx config (unbalanced braces?)")
+
+    root.end = len(text)
+    return root
+
+
+# Recently parsed trees by text. Trees are never modified after parse(), so
+# long-running processes can share them instead of re-parsing the same config
+TREE_CACHE_SIZE = 8
+_trees: Dict[str, Block] = {}
+_trees_lock = threading.Lock()
+
+
+def parse_cached(text: str) -> Block:
+    """parse() that reuses the tree of a recently seen identical text."""
+    with _trees_lock:
+        root = _trees.pop(text, None)
+        if root is not None:
+            _trees[text] = root
+            return root
+
+    root = parse(text)
+    with _trees_lock:
+        if len(_trees) >= TREE_CACHE_SIZE:
+            _trees.pop(next(iter(_trees)))
+        _trees[text] = root
+    return root
+
+
+def semantic_tokens(text: str) -> List[str]:
+    """Tokens that matter to nginx, ignoring comments and whitespace."""
+    return [value for kind, value, _, _ in tokenize(text) if kind != "comment"]
+
+
+class NginxConf:
+    """
+    Parsed tb-proxy config with locations indexed per server by match path.
+    Edits are queued and applied in one splice by render(), so every region
+    that was not edited is reproduced byte for byte.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.root = parse_cached(text)
+
+        self.servers: List[Block] = [
+            b for b in self._walk(self.root) if isinstance(b, Block) and b.name == "server"
+        ]
+
+        # (server index, location key) -> location block
+        self.locations: Dict[Tuple[int, str], Block] = {}
+        for i, server in enumerate(self.servers):
+            for block in self._walk(server):
+                if isinstance(block, Block) and block.name == "location":
+                    self.locations.setdefault((i, location_key(block)), block)
+
+        # map result variable -> top-level map block
+        self.maps: Dict[str, Block] = {
+            b.args[1]: b for b in self.root.children
+            if isinstance(b, Block) and b.name == "map" and len(b.args) == 2
+        }
+
+        self.edits: List[Tuple[int, int, str]] = []
+        self._queued: Dict[Tuple[int, str], int] = {}
+
+        # Maps created in this session: variable -> (edit index, source, entries)
+        self._new_maps: Dict[str, Tuple[int, str, Dict[str, str]]] = {}
+        self._queued_entries: Dict[Tuple[str, str], int] = {}
+        self._map_entries: Dict[str, Dict[str, Directive]] = {}
+
+    @staticmethod
+    def _walk(block: Block) -> Iterator[Directive]:
+        for child in block.children:
+            yield child
+            if isinstance(child, Block) and child.name != "server":
+                yield from NginxConf._walk(child)
+
+    def server_at(self, offset: int) -> int:
+        """Index of the server block containing offset."""
+        for i, server in enumerate(self.servers):
+            if server.start <= offset < server.end:
+                return i
+        raise ValueError(f"[X] Offset {offset} is not inside a server block")
+
+    def find_location(self, key: str, server: int = 0) -> Block | None:
+        return self.locations.get((server, key))
+
+    def upsert_location(self, snippet: str, marker: str) -> bool:
+        """
+        Insert or update the location blocks in snippet. Existing locations
+        with the same match path in the marker's server are replaced in
+        place, new ones are inserted right after the marker.
+        Returns True if anything changed.
+        """
+        at = self.text.find(marker)
+        if at == -1:
+            raise ValueError(f"[X] Marker not found: {marker}")
+        server = self.server_at(at)
+
+        new_blocks = [b for b in parse(snippet).children if isinstance(b, Block) and b.name == "location"]
+        if not new_blocks:
+            raise ValueError("[X] Snippet has no location block")
+
+        # Directives queued inside a location would overlap its replacement
+        for block in new_blocks:
+            existing = self.locations.get((server, location_key(block)))
+            inside = existing is not None and any(
+                existing.start <= start and end <= existing.end and (start, end) != (existing.start, existing.end)
+                for start, end, _ in self.edits
+            )
+            if inside:
+                self._reparse()
+                at = self.text.find(marker)
+                break
+
+        changed = False
+        for block in new_blocks:
+            key = (server, location_key(block))
+            text = snippet[block.start:block.end]
+            existing = self.locations.get(key)
+
+            if key in self._queued:
+                # Upserted earlier in this session, update the queued edit
+                start, end, old = self.edits[self._queued[key]]
+                new = self._insertion(snippet, block) if start == end else text
+                self.edits[self._queued[key]] = (start, end, new)
+                changed = changed or new != old
+            elif existing is None:
+                end = at + len(marker)
+                self._queued[key] = len(self.edits)
+                self.edits.append((end, end, self._insertion(snippet, block)))
+                changed = True
+            elif self.text[existing.start:existing.end] != text:
+                self._queued[key] = len(self.edits)
+                self.edits.append((existing.start, existing.end, text))
+                changed = True
+
+        return changed
+
+    @staticmethod
+    def _insertion(snippet: str, block: Block) -> str:
+        """A new block on its own line after the marker, keeping the snippet's indentation."""
+        indent = snippet[snippet.rfind("\n", 0, block.start) + 1:block.start]
+        if indent.strip():
+            indent = ""
+        return f"\n{indent}{snippet[block.start:block.end]}"
+
+    @staticmethod
+    def _map_value(value: str) -> str:
+        return f'"{value}"' if re.search(r"[\s;{}#'\"]", value) else value
+
+    def _render_map(self, source: str, variable: str, entries: Dict[str, str]) -> str:
+        lines = [f"map {source} {variable} {{"]
+        lines += [f"    {key} {self._map_value(value)};" for key, value in entries.items()]
+        return "\n".join(lines) + "\n}"
+
+    def upsert_map_entry(self, source: str, variable: str, key: str, value: str,
+                         marker: str, default: str | None = None) -> bool:
+        """
+        Set `key value;` in the top-level `map source variable { }` block,
+        creating the block after marker (with an optional default) if it does
+        not exist. Only the one entry is edited, so the cost of a change does
+        not grow with the number of entries. Returns True if anything changed.
+        """
+        if variable in self._new_maps:
+            index, _, entries = self._new_maps[variable]
+            if entries.get(key) == value:
+                return False
+            entries[key] = value
+            start, end, _ = self.edits[index]
+            self.edits[index] = (start, end, "\n" + self._render_map(source, variable, entries))
+            return True
+
+        block = self.maps.get(variable)
+        if block is None:
+            at = self.text.find(marker)
+            if at == -1:
+                raise ValueError(f"[X] Marker not found: {marker}")
+            entries = {"default": default} if default is not None else {}
+            entries[key] = value
+            end = at + len(marker)
+            self._new_maps[variable] = (len(self.edits), source, entries)
+            self.edits.append((end, end, "\n" + self._render_map(source, variable, entries)))
+            return True
+
+        entry = f"{key} {self._map_value(value)};"
+        entries = self._map_entries.get(variable)
+        if entries is None:
+            entries = self._map_entries[variable] = {d.name: d for d in block.children}
+        existing = entries.get(key)
+
+        if (variable, key) in self._queued_entries:
+            index = self._queued_entries[(variable, key)]
+            start, end, old = self.edits[index]
+            new = f"    {entry}\n" if start == end else entry
+            self.edits[index] = (start, end, new)
+            return new != old
+
+        if existing is None:
+            # New entry on its own line just before the closing brace
+            close = block.end - 1
+            line_start = self.text.rfind("\n", 0, close) + 1
+            at = line_start if not self.text[line_start:close].strip() else close
+            self._queued_entries[(variable, key)] = len(self.edits)
+            self.edits.append((at, at, f"    {entry}\n"))
+            return True
+
+        if self.text[existing.start:existing.end] == entry:
+            return False
+        self._queued_entries[(variable, key)] = len(self.edits)
+        self.edits.append((existing.start, existing.end, entry))
+        return True
+
+    @staticmethod
+    def _unquote(word: str) -> str:
+        return word[1:-1] if len(word) > 1 and word[0] == word[-1] and word[0] in "'\"" else word
+
+    def upsert_directive(self, location: str, name: str, match: List[str], text: str, marker: str) -> bool:
+        """
+        Set a simple directive inside an existing location of the marker's
+        server. The directive is identified by name and its leading args
+        (compared unquoted), e.g. ('sub_filter', ['<head>']); it is replaced in
+        place, or added after the last directive of the same name.
+        Returns True if anything changed.
+        """
+        at = self.text.find(marker)
+        if at == -1:
+            raise ValueError(f"[X] Marker not found: {marker}")
+        server = self.server_at(at)
+
+        if (server, location) in self._queued:
+            # Inserted or rewritten earlier in this session, its directives only exist in the edits
+            self._reparse()
+
+        block = self.locations.get((server, location))
+        if block is None:
+            raise ValueError(f"[X] Location not found: {location}")
+
+        key = (server, f"{location}\0{name}\0" + "\0".join(match))
+        wanted = [self._unquote(m) for m in match]
+
+        if key in self._queued:
+            index = self._queued[key]
+            start, end, old = self.edits[index]
+            new = old[:len(old) - len(old.lstrip())] + text if start == end else text
+            self.edits[index] = (start, end, new)
+            return new != old
+
+        same_name = [
+            d for d in block.children if d.name == name and not isinstance(d, Block)
+        ]
+        existing = next(
+            (d for d in same_name if [self._unquote(a) for a in d.args[:len(wanted)]] == wanted), None
+        )
+
+        if existing is not None:
+            if self.text[existing.start:existing.end] == text:
+                return False
+            self._queued[key] = len(self.edits)
+            self.edits.append((existing.start, existing.end, text))
+            return True
+
+        # New directive on its own line, indented like its siblings
+        anchor = same_name[-1] if same_name else (block.children[-1] if block.children else None)
+        if anchor is not None:
+            line_start = self.text.rfind("\n", 0, anchor.start) + 1
+            indent = self.text[line_start:anchor.start]
+            pos = anchor.end
+        else:
+            line_start = self.text.rfind("\n", 0, block.start) + 1
+            indent = self.text[line_start:block.start] + "    "
+            pos = self.text.index("{", block.start) + 1
+        if indent.strip():
+            indent = "    "
+
+        self._queued[key] = len(self.edits)
+        self.edits.append((pos, pos, f"\n{indent}{text}"))
+        return True
+
+    def _reparse(self) -> None:
+        """Apply the queued edits and parse the result as the new starting text."""
+        self.__init__(self.render())
+
+    def remove_location(self, key: str, server: int = 0) -> bool:
+        """Queue removal of a location block together with its own line(s)."""
+        if (server, key) in self._queued:
+            raise ValueError(f"[X] Location already edited in this session: {key}")
+
+        block = self.locations.pop((server, key), None)
+        if block is None:
+            return False
+
+        start = self.text.rfind("\n", 0, block.start) + 1
+        if self.text[start:block.start].strip():
+            start = block.start
+
+        end = block.end
+        nl = self.text.find("\n", end)
+        if nl != -1 and not self.text[end:nl].strip():
+            end = nl + 1
+
+        self.edits.append((start, end, ""))
+        return True
+
+    def render(self) -> str:
+        """Apply every queued edit in one pass."""
+        if not self.edits:
+            return self.text
+
+        parts = []
+        pos = 0
+        for start, end, value in sorted(self.edits, key=lambda e: (e[0], e[1])):
+            if start < pos:
+                raise ValueError("[X] Overlapping nginx config edits")
+            parts.append(self.text[pos:start])
+            parts.append(value)
+            pos = end
+        parts.append(self.text[pos:])
+
+        return "".join(parts)
@@ -0,0 +1,230 @@
+from typing import Dict, List, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # optional, only palette derivation needs it
+    np = None
+
+# WCAG 2.x thresholds: body text, and UI components / large text
+TEXT_CONTRAST = 4.5
+UI_CONTRAST = 3.0
+
+DEFAULT_BACKGROUND = "#0f1115"
+
+# Preferred text colours (the stock theme's), black/white only as a fallback
+LIGHT_TEXT = "#e5e7eb"
+DARK_TEXT = "#0b0f16"
+
+STATUS_SEEDS = {
+    "--tb-success": "#22c55e",
+    "--tb-warning": "#f59e0b",
+    "--tb-danger": "#ef4444",
+    "--tb-info": "#3b82f6",
+}
+
+# Mix amounts tried, in order, when a derived colour must reach a contrast
+_MUTED_STEPS = (0.35, 0.25, 0.15, 0.0)
+_STATUS_STEPS = (0.0, 0.15, 0.3, 0.45, 0.6, 0.75, 0.9, 1.0)
+# Card lift; negative steps move away from the text on mid-grey bases
+_CARD_STEPS = (0.04, 0.02, 0.0, -0.03, -0.06)
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("[X] NumPy is required for palette derivation: pip install numpy")
+
+
+def parse_hex(colors: Sequence[str]) -> "np.ndarray":
+    """(N, 3) float array in 0..1 from #rgb / #rrggbb / #rrggbbaa strings (alpha dropped)."""
+    _require_numpy()
+    digits = []
+    for c in colors:
+        d = c.strip().lstrip("#").lower()
+        if len(d) == 3:
+            d = "".join(ch * 2 for ch in d)
+        digits.append(d[:6] if len(d) in (6, 8) else "!")
+    try:
+        raw = bytes.fromhex("".join(digits))
+    except ValueError:
+        bad = next(i for i, d in enumerate(digits) if len(d) != 6 or not _is_hex(d))
+        raise ValueError(f"[X] Not a hex colour: {colors[bad]!r} (row {bad})") from None
+    return np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3) / 255.0
+
+
+def _is_hex(digits: str) -> bool:
+    try:
+        bytes.fromhex(digits)
+    except ValueError:
+        return False
+    return True
+
+
+def to_hex(rgb: "np.ndarray") -> List[str]:
+    """#rrggbb strings for an (N, 3) array in 0..1."""
+    hexed = _to_255(rgb).tobytes().hex()
+    return [f"#{hexed[i:i + 6]}" for i in range(0, len(hexed), 6)]
+
+
+def to_rgba(rgb: "np.ndarray", alpha: float) -> List[str]:
+    """rgba(r,g,b,.aa) strings, in the short form the stock theme uses."""
+    a = f"{alpha:.2f}".lstrip("0")
+    return [f"rgba({r},{g},{b},{a})" for r, g, b in _to_255(rgb).tolist()]
+
+
+def _to_255(rgb: "np.ndarray") -> "np.ndarray":
+    return np.rint(np.clip(rgb, 0.0, 1.0) * 255).astype(np.uint8)
+
+
+def relative_luminance(rgb: "np.ndarray") -> "np.ndarray":
+    """WCAG relative luminance of (..., 3) sRGB colours."""
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    return linear @ np.array([0.2126, 0.7152, 0.0722])
+
+
+def contrast_ratio(a: "np.ndarray", b: "np.ndarray") -> "np.ndarray":
+    """WCAG contrast ratio between colours a and b, elementwise, 1..21."""
+    la, lb = relative_luminance(a), relative_luminance(b)
+    return (np.maximum(la, lb) + 0.05) / (np.minimum(la, lb) + 0.05)
+
+
+def mix(a: "np.ndarray", b: "np.ndarray", t) -> "np.ndarray":
+    """Linear blend from a (t=0) to b (t=1); t broadcasts per row or per step."""
+    return a + (b - a) * np.asarray(t, dtype=float)[..., None]
+
+
+def _first_passing(candidates: "np.ndarray", against: "np.ndarray", minimum: float) -> "np.ndarray":
+    """
+    candidates is (steps, N, 3); pick per row the first step reaching
+    minimum contrast against (N, 3), or the best step when none does.
+    """
+    ratios = contrast_ratio(candidates, against[None])
+    passing = ratios >= minimum
+    step = np.where(passing.any(axis=0), passing.argmax(axis=0), ratios.argmax(axis=0))
+    return candidates[step, np.arange(candidates.shape[1])]
+
+
+def pick_text(*backgrounds: "np.ndarray", minimum: float = TEXT_CONTRAST) -> "np.ndarray":
+    """
+    Text colour for each row, readable on every one of backgrounds: the
+    theme's light/dark text if its worst contrast meets minimum, else white/black.
+    """
+    colours = parse_hex([LIGHT_TEXT, DARK_TEXT, "#ffffff", "#000000"])
+    n = len(backgrounds[0])
+    candidates = np.broadcast_to(colours[:, None], (4, n, 3))
+    # Worst case over the backgrounds the text sits on
+    ratios = np.min([contrast_ratio(candidates, bg[None]) for bg in backgrounds], axis=0)
+    # Prefer the theme colours, in order of contrast
+    preferred = np.where(ratios[0] >= ratios[1], 0, 1)
+    fallback = np.where(ratios[2] >= ratios[3], 2, 3)
+    ok = ratios[preferred, np.arange(n)] >= minimum
+    return candidates[np.where(ok, preferred, fallback), np.arange(n)]
+
+
+class PaletteSet:
+    """
+    Derived theme variables for many tenants at once. Every colour is an
+    (N, 3) array; overrides() renders them to the CSS values that go
+    straight into update_tb_batch.
+    """
+
+    def __init__(self, brand: Sequence[str], background: Sequence[str | None] | None = None,
+                 brand_2: Sequence[str | None] | None = None):
+        _require_numpy()
+        n = len(brand)
+        self.brand = parse_hex(brand)
+        self.base = parse_hex([b or DEFAULT_BACKGROUND for b in background] if background else [DEFAULT_BACKGROUND] * n)
+
+        # Surfaces lift toward white on dark themes and toward black on light ones
+        # (0.18 is where white and black text have equal contrast)
+        dark = relative_luminance(self.base) < 0.18
+        lift = np.broadcast_to(dark[:, None], (n, 3)).astype(float)
+        sink = 1.0 - lift
+
+        seed_2 = list(brand_2) if brand_2 else [None] * n
+        has_2 = np.array([bool(c) for c in seed_2])
+        self.brand_2 = np.where(
+            has_2[:, None],
+            parse_hex([c or "#000000" for c in seed_2]),
+            mix(self.brand, lift, np.full(n, 0.35)),
+        )
+
+        self.main_bg = self.base
+        self.sidebar_bg = mix(self.base, sink, np.full(n, 0.25))
+        self.topbar_bg = mix(self.base, sink, np.full(n, 0.1))
+        # Cards lift toward the text colour on most bases, so step back until text stays readable
+        steps = np.array(_CARD_STEPS)[:, None]
+        lifted = mix(self.base[None], lift[None], steps)
+        sunk = mix(self.base[None], sink[None], -steps)
+        cards = mix(np.where(steps[..., None] >= 0, lifted, sunk), self.brand[None], np.full((1, n), 0.02))
+        self.card_bg = _first_passing(cards, pick_text(self.main_bg), TEXT_CONTRAST)
+        self.card_bg_hover = mix(self.card_bg, self.brand, np.full(n, 0.06))
+        self.input_bg = mix(self.base, sink, np.full(n, 0.05))
+        self.border = mix(self.base, lift, np.full(n, 0.12))
+        self.border_strong = mix(self.base, lift, np.full(n, 0.2))
+
+        self.text = pick_text(self.main_bg, self.card_bg)
+        self.text_invert = pick_text(self.brand)
+
+        muted = mix(self.text[None], self.base[None], np.array(_MUTED_STEPS)[:, None])
+        self.text_muted = _first_passing(muted, self.main_bg, TEXT_CONTRAST)
+
+        # Status colours keep their hue, lightened/darkened until visible on cards
+        self.status = {}
+        for name, seed in STATUS_SEEDS.items():
+            colour = np.broadcast_to(parse_hex([seed]), (n, 3))
+            steps = mix(colour[None], lift[None], np.array(_STATUS_STEPS)[:, None])
+            self.status[name] = _first_passing(steps, self.card_bg, UI_CONTRAST)
+
+    def __len__(self) -> int:
+        return len(self.brand)
+
+    def contrast(self) -> Dict[str, "np.ndarray"]:
+        """Contrast ratio per tenant for the pairs the UI relies on."""
+        report = {
+            "text/main-bg": contrast_ratio(self.text, self.main_bg),
+            "text-muted/main-bg": contrast_ratio(self.text_muted, self.main_bg),
+            "text-invert/brand": contrast_ratio(self.text_invert, self.brand),
+            "text/card-bg": contrast_ratio(self.text, self.card_bg),
+        }
+        for name, colour in self.status.items():
+            report[f"{name[5:]}/card-bg"] = contrast_ratio(colour, self.card_bg)
+        return report
+
+    def failing(self) -> Dict[str, "np.ndarray"]:
+        """pair -> indices of tenants below the WCAG threshold for that pair."""
+        out = {}
+        for pair, ratios in self.contrast().items():
+            minimum = TEXT_CONTRAST if pair.startswith("text") else UI_CONTRAST
+            bad = np.flatnonzero(ratios < minimum)
+            if bad.size:
+                out[pair] = bad
+        return out
+
+    def overrides(self) -> List[Dict[str, str]]:
+        """One {variable: value} dict per tenant."""
+        columns = {
+            "--tb-brand": to_hex(self.brand),
+            "--tb-brand-2": to_hex(self.brand_2),
+            "--tb-accent": to_hex(self.brand_2),
+            "--tb-main-bg": to_hex(self.main_bg),
+            "--tb-sidebar-bg": to_hex(self.sidebar_bg),
+            "--tb-topbar-bg": to_hex(self.topbar_bg),
+            "--tb-card-bg": to_hex(self.card_bg),
+            "--tb-card-bg-hover": to_hex(self.card_bg_hover),
+            "--tb-input-bg": to_hex(self.input_bg),
+            "--tb-border": to_hex(self.border),
+            "--tb-border-strong": to_hex(self.border_strong),
+            "--tb-text": to_hex(self.text),
+            "--tb-text-muted": to_hex(self.text_muted),
+            "--tb-text-invert": to_hex(self.text_invert),
+            "--tb-hover-bg": to_rgba(self.brand, 0.12),
+            "--tb-selected-bg": to_rgba(self.brand, 0.18),
+            "--tb-divider": to_rgba(self.text, 0.08),
+            **{name: to_hex(colour) for name, colour in self.status.items()},
+        }
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+
+def derive_palette(brand: str, background: str | None = None, brand_2: str | None = None) -> Dict[str, str]:
+    """Full variable set for a single tenant."""
+    return PaletteSet([brand], [background], [brand_2]).overrides()[0]
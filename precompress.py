@@ -0,0 +1,104 @@
+import gzip
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List
+
+from staging import write_atomic
+
+try:
+    import brotli
+except ImportError:  # optional, .br variants are skipped without it
+    brotli = None
+
+MANIFEST = ".precompress.json"
+
+
+def _load_manifest(directory: Path) -> Dict[str, str]:
+    try:
+        return json.loads((directory / MANIFEST).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_manifest(directory: Path, manifest: Dict[str, str]) -> None:
+    write_atomic(directory / MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+
+
+def variant_paths(path: str | Path) -> List[Path]:
+    """Variants precompress() keeps next to path."""
+    path = Path(path)
+    suffixes = [".gz", ".br"] if brotli is not None else [".gz"]
+    return [path.with_name(path.name + suffix) for suffix in suffixes]
+
+
+def compressed_variants(path: str | Path, data: bytes) -> Dict[Path, bytes]:
+    """Contents of path's variants for data."""
+    compressed = {}
+    for variant in variant_paths(path):
+        if variant.suffix == ".gz":
+            compressed[variant] = gzip.compress(data, compresslevel=9, mtime=0)
+        else:
+            compressed[variant] = brotli.compress(data, quality=11)
+    return compressed
+
+
+def stage_variants(staging, path: str | Path) -> List[Path]:
+    """
+    Stage the variants and manifest entry of a staged file, ahead of the
+    file itself, so commit() swaps them in first and rollback() restores
+    them with it. Returns the staged variants.
+    """
+    path = Path(path)
+    data = staging.read_bytes(path)
+
+    manifest_path = path.parent / MANIFEST
+    try:
+        manifest = json.loads(staging.read(manifest_path))
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    manifest[path.name] = hashlib.sha256(data).hexdigest()
+
+    variants = compressed_variants(path, data)
+    for variant, compressed in variants.items():
+        staging.stage(variant, compressed)
+    staging.stage(manifest_path, json.dumps(manifest, indent=2, sort_keys=True))
+    # Commit writes in staging order, so the file itself goes last
+    staging.stage(path, staging.pending.pop(path))
+    return list(variants)
+
+
+def precompress(path: str | Path) -> List[Path]:
+    """
+    Write .gz (and .br when brotli is installed) next to path for
+    gzip_static/brotli_static. Variants are only regenerated when the
+    source hash differs from the one recorded in the directory manifest.
+    Returns the variants that were (re)written.
+    """
+    path = Path(path)
+
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"[X] Asset not present: {path}") from e
+
+    digest = hashlib.sha256(data).hexdigest()
+    manifest = _load_manifest(path.parent)
+
+    if manifest.get(path.name) == digest and all(v.is_file() for v in variant_paths(path)):
+        return []
+
+    written = []
+    for variant, compressed in compressed_variants(path, data).items():
+        write_atomic(variant, compressed)
+        written.append(variant)
+
+    manifest[path.name] = digest
+    _save_manifest(path.parent, manifest)
+    return written
+
+
+def is_variant(path: str | Path) -> bool:
+    """True for files precompress() generates itself."""
+    name = Path(path).name
+    return name.endswith((".gz", ".br", ".tmp")) or name == MANIFEST
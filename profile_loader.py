@@ -0,0 +1,114 @@
+import json
+import tomllib
+from pathlib import Path
+from typing import Dict
+
+
+def load_profile(path: str | Path) -> Dict:
+    """
+    Load a declarative overrides profile from JSON or TOML.
+    Returns {"variables": {selector: value}, "logo": path | None, "host": str | None,
+    "fonts": {"family": name, "faces": [(path, weight, style)]} | None,
+    "images": {variable: path} | None,
+    "bundles": [(path, {pattern: replacement}, url | None)] | None}.
+    """
+    path = Path(path)
+
+    try:
+        raw = path.read_bytes()
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"[X] Profile not present: {path}") from e
+
+    if path.suffix == ".toml":
+        data = tomllib.loads(raw.decode("utf-8"))
+    else:
+        data = json.loads(raw)
+
+    if not isinstance(data, dict):
+        raise ValueError(f"[X] Profile must be a table/object: {path}")
+
+    variables = data.get("variables", {})
+    if not isinstance(variables, dict):
+        raise ValueError(f"[X] Profile 'variables' must be a table/object: {path}")
+
+    logo = data.get("logo")
+    host = data.get("host")
+    fonts = data.get("fonts")
+    images = data.get("images")
+    bundles = data.get("bundles")
+
+    return {
+        "variables": {str(k): str(v) for k, v in variables.items()},
+        "logo": Path(logo) if logo else None,
+        "host": str(host) if host else None,
+        "fonts": _load_fonts(fonts, path) if fonts else None,
+        "images": _load_images(images, path) if images else None,
+        "bundles": _load_bundles(bundles, path) if bundles else None,
+    }
+
+
+_WEIGHTS = {str(w) for w in range(100, 1000, 100)} | {"normal", "bold"}
+_STYLES = {"normal", "italic", "oblique"}
+
+
+def _load_fonts(fonts, path: Path) -> Dict:
+    """
+    [fonts]
+    family = "Acme Sans"
+
+    [[fonts.faces]]
+    file = "/srv/brand/AcmeSans-Regular.ttf"
+    weight = 400            # default 400
+    style = "normal"        # default normal
+    """
+    if not isinstance(fonts, dict) or not fonts.get("family") or not isinstance(fonts.get("faces"), list):
+        raise ValueError(f"[X] Profile 'fonts' needs a 'family' and a 'faces' list: {path}")
+
+    faces = []
+    for i, face in enumerate(fonts["faces"]):
+        if not isinstance(face, dict) or not face.get("file"):
+            raise ValueError(f"[X] Font face #{i + 1} needs a 'file': {path}")
+        weight = str(face.get("weight", "400"))
+        style = str(face.get("style", "normal"))
+        if weight not in _WEIGHTS or style not in _STYLES:
+            raise ValueError(f"[X] Font face #{i + 1} has an invalid weight/style ({weight}/{style}): {path}")
+        faces.append((Path(face["file"]), weight, style))
+
+    return {"family": str(fonts["family"]), "faces": faces}
+
+
+def _load_images(images, path: Path) -> Dict:
+    """
+    [images]
+    "--tb-login-bg-image" = "/srv/brand/login-bg.jpg"
+    "--tb-header-icon-image" = "/srv/brand/icon.svg"
+    """
+    if not isinstance(images, dict) or not all(isinstance(v, str) and v for v in images.values()):
+        raise ValueError(f"[X] Profile 'images' must map image variables to file paths: {path}")
+
+    return {str(k): Path(v) for k, v in images.items()}
+
+
+def _load_bundles(bundles, path: Path) -> list:
+    """
+    [[bundles]]
+    file = "/usr/share/tb-node/web/public/main.abc123.js"
+    url = "main.abc123.js"  # how index.html refers to it, default file name
+
+    [bundles.replace]
+    "ThingsBoard" = "Acme"
+    """
+    if not isinstance(bundles, list):
+        raise ValueError(f"[X] Profile 'bundles' must be a list of tables/objects: {path}")
+
+    loaded = []
+    for i, bundle in enumerate(bundles):
+        if not isinstance(bundle, dict) or not bundle.get("file"):
+            raise ValueError(f"[X] Bundle #{i + 1} needs a 'file': {path}")
+        replace = bundle.get("replace")
+        if not isinstance(replace, dict) or not replace or not all(isinstance(v, str) for v in replace.values()):
+            raise ValueError(f"[X] Bundle #{i + 1} needs a 'replace' table of strings: {path}")
+        url = bundle.get("url")
+        loaded.append((Path(bundle["file"]), {str(k): v for k, v in replace.items()}, str(url) if url else None))
+
+    return loaded
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+# Rebuild a full object after this many deltas so materialising stays cheap
+MAX_DELTA_CHAIN = 8
+
+# zlib only looks back this far, so a longer preset dictionary is wasted
+_ZDICT_WINDOW = 32 * 1024
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _is_text(data: bytes) -> bool:
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        return False
+    return b"\0" not in data
+
+
+class RevisionStore:
+    """
+    Local content-addressed history of the files an apply produced.
+
+    objects/   deduplicated blobs by sha256; text is zlib-compressed with the
+               previous version of the same file as preset dictionary, so
+               small edits to a large CSS/conf cost a few bytes
+    plain/     materialised copies for recent revisions, so a rollback is a
+               copy-and-rename of ready files instead of a replay
+    revisions/ one JSON manifest per apply: path -> object hash
+    """
+
+    def __init__(self, root: str | Path, keep_plain: int = 3):
+        self.root = Path(root)
+        self.keep_plain = keep_plain
+
+        self.objects = self.root / "objects"
+        self.plain = self.root / "plain"
+        self.revisions = self.root / "revisions"
+
+    # Objects
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest[2:]
+
+    def _read_object(self, digest: str) -> tuple[str | None, int, bytes]:
+        """Return (base digest, chain depth, compressed payload)."""
+        raw = self._object_path(digest).read_bytes()
+        header, _, payload = raw.partition(b"\n")
+        kind, *rest = header.decode("ascii").split()
+        if kind == "full":
+            return None, 0, payload
+        return rest[0], int(rest[1]), payload
+
+    def _put(self, data: bytes, base: str | None) -> str:
+        digest = _digest(data)
+        path = self._object_path(digest)
+        if path.exists():
+            return digest
+
+        header = b"full\n"
+        if base and base != digest and self._object_path(base).exists() and _is_text(data):
+            _, depth, _ = self._read_object(base)
+            base_data = self.load(base)
+            if depth < MAX_DELTA_CHAIN and _is_text(base_data):
+                compressor = zlib.compressobj(9, zdict=base_data[-_ZDICT_WINDOW:])
+                payload = compressor.compress(data) + compressor.flush()
+                header = f"delta {base} {depth + 1}\n".encode("ascii")
+        if header == b"full\n":
+            payload = zlib.compress(data, 9)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(header + payload)
+        os.replace(tmp, path)
+        return digest
+
+    def load(self, digest: str) -> bytes:
+        """Contents of an object, following its delta chain."""
+        plain = self.plain / digest
+        if plain.is_file():
+            return plain.read_bytes()
+
+        base, _, payload = self._read_object(digest)
+        if base is None:
+            return zlib.decompress(payload)
+        decompressor = zlib.decompressobj(zdict=self.load(base)[-_ZDICT_WINDOW:])
+        return decompressor.decompress(payload) + decompressor.flush()
+
+    def _materialise(self, digest: str, data: bytes | None = None) -> Path:
+        plain = self.plain / digest
+        if not plain.is_file():
+            plain.parent.mkdir(parents=True, exist_ok=True)
+            tmp = plain.with_name(plain.name + ".tmp")
+            tmp.write_bytes(self.load(digest) if data is None else data)
+            os.replace(tmp, plain)
+        return plain
+
+    # Revisions
+
+    def history(self) -> List[Dict]:
+        """Every revision manifest, oldest first."""
+        if not self.revisions.is_dir():
+            return []
+        return [json.loads(p.read_text(encoding="utf-8")) for p in sorted(self.revisions.glob("*.json"))]
+
+    def get(self, rev_id: str) -> Dict:
+        path = self.revisions / f"{rev_id}.json"
+        if not path.is_file():
+            raise ValueError(f"[X] Revision not found: {rev_id}")
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def head(self) -> Dict | None:
+        history = self.history()
+        return history[-1] if history else None
+
+    def record(self, paths: Iterable[str | Path], message: str = "") -> str | None:
+        """
+        Snapshot paths plus every file the latest revision tracked (missing
+        files are recorded as absent), so each revision is complete. Returns
+        the new revision id, or None if nothing differs from the latest one.
+        """
+        head = self.head()
+        previous = head["files"] if head else {}
+
+        files: Dict[str, str | None] = {}
+        contents: Dict[str, bytes] = {}
+        for path in dict.fromkeys([*previous, *(str(Path(p).resolve()) for p in paths)]):
+            path = Path(path)
+            try:
+                data = path.read_bytes()
+            except FileNotFoundError:
+                files[str(path)] = None
+                continue
+            digest = self._put(data, previous.get(str(path)))
+            files[str(path)] = digest
+            contents[digest] = data
+
+        if files == previous:
+            return None
+
+        seq = int(head["id"].split("-")[1]) + 1 if head else 1
+        rev_id = f"rev-{seq:06d}"
+        manifest = {"id": rev_id, "created": time.time(), "message": message, "files": files}
+
+        self.revisions.mkdir(parents=True, exist_ok=True)
+        tmp = self.revisions / f"{rev_id}.json.tmp"
+        tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.revisions / f"{rev_id}.json")
+
+        for digest, data in contents.items():
+            self._materialise(digest, data)
+        self._prune_plain()
+        return rev_id
+
+    def previous(self) -> Dict | None:
+        """The revision before head, the usual rollback target."""
+        history = self.history()
+        return history[-2] if len(history) > 1 else None
+
+    def checkout(self, rev_id: str) -> List[Path]:
+        """
+        Put every file of a revision back in place. Copies are prepared next
+        to their targets first and then renamed over them, so the swap itself
+        is a handful of atomic renames. Returns the paths that changed.
+        """
+        files = self.get(rev_id)["files"]
+
+        swaps: List[tuple[Path | None, Path]] = []
+        try:
+            for name, digest in files.items():
+                path = Path(name)
+                if digest is None:
+                    if path.exists():
+                        swaps.append((None, path))
+                    continue
+                if path.is_file() and _digest(path.read_bytes()) == digest:
+                    continue
+                tmp = path.with_name(f".{path.name}.tbov-rev")
+                path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(self._materialise(digest), tmp)
+                swaps.append((tmp, path))
+        except BaseException:
+            for tmp, _ in swaps:
+                if tmp is not None:
+                    tmp.unlink(missing_ok=True)
+            raise
+
+        for tmp, path in swaps:
+            if tmp is None:
+                path.unlink(missing_ok=True)
+            else:
+                os.replace(tmp, path)
+            print(f"- Restored: {path}")
+        return [path for _, path in swaps]
+
+    # Garbage collection
+
+    def _prune_plain(self) -> None:
+        """Keep materialised copies only for the newest keep_plain revisions."""
+        if not self.plain.is_dir():
+            return
+        wanted = {d for rev in self.history()[-self.keep_plain:] for d in rev["files"].values() if d}
+        for plain in self.plain.iterdir():
+            if plain.name not in wanted:
+                plain.unlink(missing_ok=True)
+
+    def gc(self, keep: int = 20, max_age_days: float | None = 90) -> tuple[int, int]:
+        """
+        Drop revisions beyond the newest keep, and those older than
+        max_age_days (the latest revision always survives), then every
+        object no kept revision needs. Returns (revisions, objects) removed.
+        """
+        history = self.history()
+        cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+
+        kept, dropped = [], []
+        for i, rev in enumerate(history):
+            newest = len(history) - i <= max(keep, 1)
+            expired = cutoff is not None and rev["created"] < cutoff and i != len(history) - 1
+            (dropped if not newest or expired else kept).append(rev)
+
+        for rev in dropped:
+            (self.revisions / f"{rev['id']}.json").unlink(missing_ok=True)
+
+        # Mark every object a kept revision needs, delta bases included
+        live = set()
+        for rev in kept:
+            for digest in rev["files"].values():
+                while digest and digest not in live and self._object_path(digest).exists():
+                    live.add(digest)
+                    digest = self._read_object(digest)[0]
+
+        removed = 0
+        if self.objects.is_dir():
+            for path in self.objects.glob("*/*"):
+                if path.parent.name + path.name not in live:
+                    path.unlink()
+                    removed += 1
+        self._prune_plain()
+        return len(dropped), removed
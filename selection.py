@@ -102,21 +102,35 @@ class Selection:
         
         return path
     
-    def enter_input(self, var: dict) -> str:
-        '''Enter a value for the variable'''
-        value_type = list(var.values())[0]["type"]
+    def enter_input(self, var: dict) -> str | None:
+        '''Enter a value for the variable, asking again until it is valid. None if cancelled'''
+        var_name, meta = list(var.items())[0]
+        value_type = meta["type"]
         
-        if value_type == "px":
-            value = questionary.text("Enter a value").ask()
-            
-        elif value_type == "hex":
+        if value_type == "hex":
             print("Visit https://www.google.com/search?q=google+color+picker\nPick a color and paste it here!")
-            value = questionary.text("Enter the hexcode").ask()
-            return None if not value.startswith("#") or len(value.replace("#", "")) != 6 else value
-        else:
-            value = questionary.text(f"Enter a value")
         
-        return value
+        while True:
+            if value_type == "px":
+                value = questionary.text("Enter a value").ask()
+            elif value_type == "hex":
+                value = questionary.text("Enter the hexcode").ask()
+            elif value_type == "enum":
+                value = questionary.select(
+                    "Select a value",
+                    choices=list(VAR_REGISTRY[var_name]["allowed"]),
+                ).ask()
+            else:
+                value = questionary.text(f"Enter a value").ask()
+            
+            # Ctrl-C / Esc
+            if value is None:
+                return None
+            
+            try:
+                return validate_value(var_name, value)
+            except ValueError as e:
+                print(e)
 
 if __name__ == "__main__":
     s = Selection()
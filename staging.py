@@ -0,0 +1,93 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict
+
+
+def write_atomic(path: str | Path, data: bytes) -> None:
+    """
+    Write data to a temp file next to path and rename it over path, so
+    readers holding the old file (open_file_cache, sendfile) never see it
+    truncated or half written. Symlinks are followed and the mode is kept.
+    """
+    path = Path(os.path.realpath(path))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        mode = path.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o644
+
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class StagedChanges:
+    """
+    Collect file writes in memory, flush them together and undo them together.
+    Reads go through the stage so later overrides see earlier staged edits.
+    """
+
+    def __init__(self):
+        # Text files and binary assets (logos, favicons) alike
+        self.pending: Dict[Path, str | bytes] = {}
+
+        # Original contents of every flushed file, None if it did not exist
+        self.backups: Dict[Path, bytes | None] = {}
+
+    def read(self, path: str | Path) -> str:
+        """Return staged contents of path, or what is on disk."""
+        path = Path(path)
+        if path in self.pending:
+            data = self.pending[path]
+            return data.decode("utf-8") if isinstance(data, bytes) else data
+        return path.read_text(encoding="utf-8")
+
+    def read_bytes(self, path: str | Path) -> bytes:
+        """Return staged contents of path as bytes, or what is on disk."""
+        path = Path(path)
+        if path in self.pending:
+            data = self.pending[path]
+            return data if isinstance(data, bytes) else data.encode("utf-8")
+        return path.read_bytes()
+
+    def stage(self, path: str | Path, data: str | bytes) -> None:
+        """Queue data to be written to path on commit()."""
+        self.pending[Path(path)] = data
+
+    def commit(self) -> None:
+        """Write every staged file, remembering the originals."""
+        try:
+            for path, data in self.pending.items():
+                data = data if isinstance(data, bytes) else data.encode("utf-8")
+                original = path.read_bytes() if path.is_file() else None
+
+                # Leave files whose contents would not change untouched
+                if data == original:
+                    continue
+
+                if path not in self.backups:
+                    self.backups[path] = original
+                write_atomic(path, data)
+        except OSError:
+            self.rollback()
+            raise
+
+        self.pending.clear()
+
+    def rollback(self) -> None:
+        """Restore every flushed file to its original contents."""
+        for path, data in self.backups.items():
+            if data is None:
+                path.unlink(missing_ok=True)
+            else:
+                write_atomic(path, data)
+            print(f"- Rolled back: {path}")
+
+        self.backups.clear()
@@ -1,53 +1,200 @@
+import contextlib
+import gzip
 import subprocess
 from pathlib import Path
 import re
 import os
 import sys
-from typing import Dict
+import tempfile
+from typing import Dict, Iterable, NamedTuple
+
+from asset_optimizer import IMAGE_TYPES, AssetOptimizer, data_uri
+from bundle_patcher import BundlePatcher
+from changes import ChangeTracker
+from conf_check import ConfCheckError, checker
+from css_build import build_production_css, built_from, source_digest
+from css_model import VarsBlock, short_value
+from nginx_conf import NginxConf
+from fonts import DEFAULT_UNICODE_RANGES, FontFace, FontPipeline, font_face_rules, font_stack
+from fingerprint import (file_hash, fingerprinted_name, hashed_name, rewrite_css_urls, stylesheet_href_re,
+                         write_fingerprinted)
+from precompress import is_variant, precompress, stage_variants
+from revisions import RevisionStore
+from staging import StagedChanges, write_atomic
+from telemetry import tracer
+from var_graph import VarGraph
+from variables import VAR_REGISTRY, validate_overrides, validate_value
 
 class FileIO:
-    def __init__(self, conf_path: str | Path, css_path: str | Path):
+    def __init__(self, conf_path: str | Path, css_path: str | Path, staging: StagedChanges | None = None):
         self.CONF = Path(conf_path)
 
         self.CSS_FILE = Path(css_path)
 
+        # When set, writes are queued here instead of hitting the disk
+        self.staging = staging
+
+        # Parsed config shared by nested edit_conf() sessions
+        self._conf_session: NginxConf | None = None
+
         self.VARS_BEGIN = ">>> TB_CUSTOM_THEME_VARS_BEGIN"
         self.VARS_END = "<<< TB_CUSTOM_THEME_VARS_END"
 
+        # Generated @font-face rules, right after the vars block
+        self.FONTS_BEGIN = ">>> TB_CUSTOM_FONTS_BEGIN"
+        self.FONTS_END = "<<< TB_CUSTOM_FONTS_END"
+
     def read_file(self) -> str:
         """Return config file contents."""
+        if self._conf_session is not None:
+            return self._conf_session.render()
         try:
-            return self.CONF.read_text(encoding="utf-8")
+            return self._read(self.CONF)
         except FileNotFoundError as e:
             raise FileNotFoundError(f"[X] Config file not present: {self.CONF}") from e
 
     def write_file(self, data: str) -> None:
         """Write config file contents."""
+        if self._conf_session is not None:
+            self._conf_session = NginxConf(data)
+            return
         try:
-            self.CONF.write_text(data, encoding="utf-8")
+            self._write(self.CONF, data)
         except OSError as e:
             raise OSError(f"[X] Failed to write config: {self.CONF}") from e
 
-    def insert_block(self, marker: str, data: str) -> bool:
-        """Insert a block into the config once, right after marker."""
-        text = self.read_file()
+    def read_css(self) -> str:
+        """Return CSS file contents."""
+        try:
+            return self._read(self.CSS_FILE)
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"[X] CSS file not present: {self.CSS_FILE}") from e
+
+    def write_css(self, data: str) -> None:
+        """Write CSS file contents."""
+        try:
+            self._write(self.CSS_FILE, data)
+        except OSError as e:
+            raise OSError(f"[X] Failed to write CSS: {self.CSS_FILE}") from e
+
+    def has_css(self) -> bool:
+        """True if the CSS file exists on disk or is staged."""
+        return self.exists(self.CSS_FILE)
+
+    def exists(self, path: str | Path) -> bool:
+        """True if path exists on disk or is staged."""
+        path = Path(path)
+        if self.staging is not None and path in self.staging.pending:
+            return True
+        return path.is_file()
+
+    def read_path(self, path: str | Path) -> str:
+        """Return another text file's contents, through the stage."""
+        try:
+            return self._read(Path(path))
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"[X] File not present: {path}") from e
 
-        if marker not in text:
-            raise ValueError(f"[X] Marker not found: {marker}")
+    def write_path(self, path: str | Path, data: str) -> None:
+        """Write another generated text file, skipping it if unchanged."""
+        path = Path(path)
+        try:
+            if self.staging is None and path.is_file() and path.read_text(encoding="utf-8") == data:
+                return
+            self._write(path, data)
+        except OSError as e:
+            raise OSError(f"[X] Failed to write: {path}") from e
 
-        insertion = f"{marker}\n{data}"
+    def read_binary(self, path: str | Path) -> bytes:
+        """Return a binary asset's contents, through the stage."""
+        if self.staging is not None:
+            return self.staging.read_bytes(path)
+        return Path(path).read_bytes()
 
-        # Prevent duplicates
-        if insertion in text:
+    def write_binary(self, path: str | Path, data: bytes) -> bool:
+        """Write a binary asset through the stage. Returns False if it already has these bytes."""
+        path = Path(path)
+        current = self.read_binary(path) if self.exists(path) else None
+        if current == data:
             return False
 
-        updated = text.replace(marker, insertion, 1)
-        self.write_file(updated)
+        if tracer.enabled:
+            tracer.add(bytes_written=len(data))
+        if self.staging is not None:
+            self.staging.stage(path, data)
+        else:
+            write_atomic(path, data)
         return True
 
+    def _read(self, path: Path) -> str:
+        if self.staging is not None:
+            data = self.staging.read(path)
+        else:
+            data = path.read_text(encoding="utf-8")
+        if tracer.enabled:
+            tracer.add(bytes_read=len(data.encode("utf-8")))
+        return data
+
+    def _write(self, path: Path, data: str) -> None:
+        if tracer.enabled:
+            tracer.add(bytes_written=len(data.encode("utf-8")))
+        if self.staging is not None:
+            self.staging.stage(path, data)
+        else:
+            write_atomic(path, data.encode("utf-8"))
+
+    @contextlib.contextmanager
+    def edit_conf(self):
+        """
+        Batch config edits: the conf is read and parsed once, and every
+        upsert/removal inside the session is written in a single pass on exit.
+        Nested sessions join the outermost one.
+        """
+        if self._conf_session is not None:
+            yield self._conf_session
+            return
+
+        original = self.read_file()
+        self._conf_session = NginxConf(original)
+        try:
+            yield self._conf_session
+            updated = self._conf_session.render()
+        finally:
+            self._conf_session = None
+
+        if updated != original:
+            self.write_file(updated)
+
+    def insert_block(self, marker: str, data: str) -> bool:
+        """Insert the location block(s) in data after marker, or update them in place."""
+        with self.edit_conf() as conf:
+            return conf.upsert_location(data, marker)
+
+    def upsert_map_entry(self, marker: str, source: str, variable: str, key: str, value: str,
+                         default: str | None = None) -> bool:
+        """Set one entry of a top-level nginx map, creating the map after marker if needed."""
+        with self.edit_conf() as conf:
+            return conf.upsert_map_entry(source, variable, key, value, marker, default=default)
+
+    def upsert_directive(self, marker: str, location: str, name: str, match: list[str], text: str) -> bool:
+        """Set one directive inside an existing location of the marker's server."""
+        with self.edit_conf() as conf:
+            return conf.upsert_directive(location, name, match, text, marker)
+
+    def vars_values(self) -> Dict[str, str]:
+        """Current values in the CSS vars block, {} if there is no CSS yet."""
+        if not self.has_css():
+            return {}
+        css = self.read_css()
+        start = css.find(self.VARS_BEGIN)
+        end = css.find(self.VARS_END)
+        if start == -1 or end <= start:
+            return {}
+        return VarsBlock(css[start:end]).values()
+
     def override_css_value(self, old_file: str, css_selectors: Dict[str, str]) -> str:
         """
-        Replace values of CSS vars inside var_block only.
+        Replace values of CSS vars inside var_block only, in a single pass.
         css_selectors example: {"--tb-logo-w":"150px", "--tb-topbar-bg":"#ffd900"}
         """
         # Find index of the VARS bloc
@@ -63,47 +210,412 @@ class FileIO:
         if len(vars_block) == 0:
             raise ValueError("[X] VARS Block not present")
         
-        new_vars_block = vars_block
-        
-        for selector, new_value in css_selectors.items():
-            _value_regex = rf"(?m)^(?!\s*/\*)\s*(?P<line>{re.escape(selector)}\s*:\s*#?(?P<val>.+?)(?:px)?;)"
-            m = re.search(_value_regex, new_vars_block)
-            
-            if m:
-                old_full_line = m.group("line")
-                old_value = m.group("val")
-            else:
-                raise ValueError(f"[X] Regex failed to find variable: {selector}")
-            
-            # Append a unit if needed
-            if f"#{old_value}" in old_full_line:
-                old_value = f"#{old_value}"
-                new_value = f"#{new_value}" if "#" not in new_value else new_value
-            elif f"{old_value}px" in old_full_line:
-                old_value = f"{old_value}px"
-                new_value = f"{new_value}px" if "px" not in new_value else new_value
-            
-            if old_value != new_value:
-                print(f"Overriding: {old_value} -> {new_value}")
-                
-                # Apply the replacement value
-                new_full_line = old_full_line.replace(old_value, new_value, 1)
-                
-                new_vars_block = new_vars_block.replace(old_full_line, new_full_line, 1)
-            else:
-                continue
-        
+        block = VarsBlock(vars_block)
+        new_vars_block = block.render(css_selectors)
+        tracer.add(vars_changed=block.changed)
         return new_vars_block
             
 
+_HOST_RE = re.compile(r"(?:\*\.)?[A-Za-z0-9_-]+(?:\.[A-Za-z0-9_-]+)*(?:\.\*)?")
+_FAMILY_BAD_RE = re.compile(r"[\"'\\;{}\n]")
+
+class BrandProfile(NamedTuple):
+    """One site to rebrand in a batch apply."""
+    conf_path: str | Path
+    css_path: str | Path
+    overrides: Dict[str, str]
+    logo: str | Path | None = None
+    assets_dir: str | Path = Path("/opt/custom_assets")
+    # Host-keyed tenant: files go to <assets_dir>/tenants/<host>, css_path only names the file
+    host: str | None = None
+    # Brand font: {"family": name, "faces": [(file, weight, style), ...]}
+    fonts: Dict | None = None
+    # Theme images: {image variable: file}, inlined into the CSS when small
+    images: Dict[str, str | Path] | None = None
+    # UI bundles to patch: [(file, {pattern: replacement}, url or None), ...]
+    bundles: list | None = None
+
+    def site(self, staging: StagedChanges | None = None) -> "TBOverride":
+        """TBOverride for this profile, pointed at the tenant dir for host profiles."""
+        if not self.host:
+            return TBOverride(conf_path=self.conf_path, css_path=self.css_path, staging=staging,
+                              assets_dir=self.assets_dir)
+        
+        tenant_dir = Path(self.assets_dir) / "tenants" / self.host
+        tbov = TBOverride(conf_path=self.conf_path, css_path=tenant_dir / Path(self.css_path).name,
+                          staging=staging, assets_dir=tenant_dir)
+        tbov.use_host_map(self.host, default_dir=self.assets_dir)
+        return tbov
+
+
 class TBOverride:
-    def __init__(self, conf_path: str, css_path: str):
-        self.fileio = FileIO(conf_path=conf_path, css_path=css_path)
+    def __init__(self, conf_path: str, css_path: str, staging: StagedChanges | None = None,
+                 assets_dir: str | Path = Path("/opt/custom_assets")):
+        self.fileio = FileIO(conf_path=conf_path, css_path=css_path, staging=staging)
 
-        self.CUSTOM_ASSETS = Path("/opt/custom_assets")
+        self.CUSTOM_ASSETS = Path(assets_dir)
         self.FILE_MAIN_LOGO = Path("logo_title_white.svg")
+        self.FAVICON_DIR = Path("favicons")
+        self.FAVICON_URL = "/thingsboard.ico"
+
+        # Uploaded logos above this size (after optimisation) are rejected
+        self.LOGO_SIZE_BUDGET = 50 * 1024
 
         self.MARKER_MAIN_LOGO = "$MAIN_LOGO$"
+        self.MARKER_BUNDLES = "$BUNDLES$"
+        # Patched UI bundles, content-hashed and cached for a year
+        self.BUNDLES_DIR = Path("bundles")
+        self.MARKER_FINGERPRINT = "$FINGERPRINTED$"
+        self.MARKER_FAVICON = "$FAVICON$"
+
+        # Fingerprint mode: serve content-hashed copies with immutable caching
+        self.FINGERPRINT = False
+        self.FINGERPRINT_DIR = Path("tbov")
+        self.FINGERPRINT_URL = "/assets/tbov/"
+
+        # Needs the ngx_brotli module, nginx -t fails without it
+        self.BROTLI_STATIC = False
+
+        # Files served through generated locations, precompressed after apply
+        self.served_assets: list[Path] = []
+
+        # Production build: nginx serves a minified copy, the annotated CSS stays the source
+        self.MINIFY_CSS = False
+
+        # Serve a copy of the CSS with var() chains resolved to literals
+        self.FLATTEN_VARS = False
+
+        # var() dependency graph, kept between override_theme calls
+        self.var_graph: VarGraph | None = None
+        self._graph_block: str | None = None
+
+        # History of applied files, for rollback without replaying overrides
+        self.REVISIONS_DIR = Path(".revisions")
+
+        # Theme vars in the HTML response: None, "inline" (<style> via sub_filter)
+        # or "preload" (Link header), both set on the proxied location
+        self.INLINE_VARS: str | None = None
+        self.INLINE_VARS_LOCATION = "/"
+        self.INLINE_VARS_ANCHOR = "<head>"
+
+        # Host-keyed themes: one `map $host $tb_theme_dir` entry per tenant and
+        # shared locations aliasing into the mapped directory
+        self.THEME_HOST: str | None = None
+        self.THEME_MAP_DEFAULT: Path | None = None
+        self.THEME_MAP_VAR = "$tb_theme_dir"
+        self.MARKER_THEME_MAP = "$THEME_MAP$"
+        self.MARKER_THEME_CSS = "$CUSTOM_THEME_CSS$"
+
+        # Brand fonts: subset to these glyphs, content-hashed and cached for a year
+        self.FONTS_DIR = Path("fonts")
+        self.FONT_UNICODE_RANGES = DEFAULT_UNICODE_RANGES
+        self.MARKER_FONTS = "$FONTS$"
+
+        # Theme images up to this many bytes become data URIs in the vars block,
+        # larger ones are content-hashed files cached for a year
+        self.INLINE_IMAGE_MAX = 4 * 1024
+        self.IMAGES_DIR = Path("images")
+        self.MARKER_IMAGES = "$IMAGES$"
+    
+    def location_block(self, url: str, alias: str | Path, cache_control: str = "no-store") -> str:
+        """Render a generated static location block, a prefix block if url ends in /."""
+        brotli = "        brotli_static on;\n" if self.BROTLI_STATIC else ""
+        modifier = "^~" if url.endswith("/") else "="
+        alias = f"{alias}/" if url.endswith("/") else alias
+        return (
+            f"    location {modifier} {url} {{\n"
+            f"        alias {alias};\n"
+            f"        gzip_static on;\n"
+            f"{brotli}"
+            f"        open_file_cache max=64 inactive=60s;\n"
+            f"        open_file_cache_valid 30s;\n"
+            f"        etag on;\n"
+            f'        add_header Cache-Control "{cache_control}";\n'
+            f"    }}\n"
+        )
+
+    def use_host_map(self, host: str, default_dir: str | Path) -> None:
+        """Serve this site's assets only for host, through the shared theme map."""
+        if not _HOST_RE.fullmatch(host):
+            raise ValueError(f"[X] Not a valid host name for the theme map: {host!r}")
+        self.THEME_HOST = host
+        self.THEME_MAP_DEFAULT = Path(default_dir)
+
+    def served_alias(self, name: str | Path) -> str | Path:
+        """Alias target of an asset: the mapped tenant dir in host mode, else the assets dir."""
+        if self.THEME_HOST:
+            return f"{self.THEME_MAP_VAR}/{name}"
+        return self.CUSTOM_ASSETS / name
+
+    def shared_dir(self, name: str | Path) -> Path:
+        """Directory for content-hashed files. Hashed names never collide, so host-keyed tenants share one."""
+        return (self.THEME_MAP_DEFAULT if self.THEME_HOST else self.CUSTOM_ASSETS) / name
+
+    @property
+    def production_css(self) -> Path:
+        """custom-theme.css -> custom-theme.min.css, next to the source."""
+        return self.fileio.CSS_FILE.with_name(f"{self.fileio.CSS_FILE.stem}.min.css")
+
+    @property
+    def flat_css(self) -> Path:
+        """custom-theme.css -> custom-theme.flat.css, next to the source."""
+        return self.fileio.CSS_FILE.with_name(f"{self.fileio.CSS_FILE.stem}.flat.css")
+
+    def served_css(self) -> str:
+        """Name of the CSS file nginx serves at /assets/<source name>."""
+        if self.MINIFY_CSS:
+            return self.production_css.name
+        if self.FLATTEN_VARS:
+            return self.flat_css.name
+        return self.fileio.CSS_FILE.name
+
+    def register_host(self) -> None:
+        """Point the theme map at this tenant and serve its CSS through the mapped dir."""
+        changed = self.fileio.upsert_map_entry(
+            self.MARKER_THEME_MAP, "$host", self.THEME_MAP_VAR, self.THEME_HOST, str(self.CUSTOM_ASSETS),
+            default=str(self.THEME_MAP_DEFAULT),
+        )
+        print(f"- Theme map entry {'updated' if changed else 'already present'}: {self.THEME_HOST}")
+
+        # Locations are shared by every host, so a tenant without its own logo gets the default one
+        default_logo = self.THEME_MAP_DEFAULT / self.FILE_MAIN_LOGO
+        if self.fileio.exists(default_logo) and not self.fileio.exists(self.CUSTOM_ASSETS / self.FILE_MAIN_LOGO):
+            self.fileio.write_binary(self.CUSTOM_ASSETS / self.FILE_MAIN_LOGO, self.fileio.read_binary(default_logo))
+
+        conf = self.fileio.read_file()
+        marker = self.MARKER_THEME_CSS if self.MARKER_THEME_CSS in conf else self.MARKER_MAIN_LOGO
+        css = self.fileio.CSS_FILE.name
+        self.fileio.insert_block(marker=marker, data=self.location_block(f"/assets/{css}", self.served_alias(self.served_css())))
+
+    def inline_theme_vars(self, vars_block: str) -> None:
+        """Inject the vars into index.html (or preload the CSS) from the proxied location."""
+        marker = self.MARKER_MAIN_LOGO
+        location = self.INLINE_VARS_LOCATION
+
+        if self.INLINE_VARS == "inline":
+            if self.THEME_HOST:
+                # location / is shared by every host, each tenant would overwrite the others' snippet
+                raise ValueError("[X] Inlining theme vars is not supported with host-keyed themes, use preload")
+            # Compact :root rule, ahead of the stylesheet so the first paint is branded
+            rule = ":root{" + ";".join(f"{k}:{v}" for k, v in VarsBlock(vars_block).values().items()) + "}"
+            if "$" in rule:
+                raise ValueError("[X] Theme values with '$' cannot be inlined through sub_filter")
+            anchor = self.INLINE_VARS_ANCHOR
+            snippet = f'{anchor}<style id="tb-theme-vars">{rule}</style>'
+            text = f"sub_filter '{self._nginx_quote(anchor)}' '{self._nginx_quote(snippet)}';"
+            changed = self.fileio.upsert_directive(marker, location, "sub_filter", [anchor], text)
+        elif self.INLINE_VARS == "preload":
+            # Preload exactly the href the page links, so the browser reuses the response
+            conf = self.fileio.read_file()
+            href = stylesheet_href_re("/assets/", self.fileio.CSS_FILE.name, self.FINGERPRINT_URL).search(conf)
+            url = href.group(0) if href else f"/assets/{self.fileio.CSS_FILE.name}"
+            text = f'add_header Link "<{url}>; rel=preload; as=style";'
+            changed = self.fileio.upsert_directive(marker, location, "add_header", ["Link"], text)
+        else:
+            raise ValueError(f"[X] Unknown INLINE_VARS mode: {self.INLINE_VARS!r}")
+
+        # sub_filter only sees uncompressed upstream HTML
+        if self.INLINE_VARS == "inline":
+            self.fileio.upsert_directive(marker, location, "proxy_set_header", ["Accept-Encoding"],
+                                         'proxy_set_header Accept-Encoding "";')
+
+        if changed:
+            print(f"- Theme vars {self.INLINE_VARS} updated in {location} location.")
+
+    @staticmethod
+    def _nginx_quote(value: str) -> str:
+        """Escape for a single-quoted nginx string."""
+        return value.replace("\\", "\\\\").replace("'", "\\'")
+
+    def revision_store(self) -> RevisionStore:
+        return RevisionStore(self.CUSTOM_ASSETS / self.REVISIONS_DIR)
+
+    @tracer.traced("record_revision")
+    def record_revision(self, message: str = "apply") -> str | None:
+        """Snapshot the conf, CSS and served assets after a successful apply."""
+        rev_id = self.revision_store().record(
+            [self.fileio.CONF, self.fileio.CSS_FILE, *self.served_assets], message=message
+        )
+        if rev_id:
+            print(f"[+] Recorded revision {rev_id}.")
+        if self.FINGERPRINT or (self.CUSTOM_ASSETS / self.BUNDLES_DIR).is_dir():
+            self.prune_fingerprinted()
+        return rev_id
+
+    def prune_fingerprinted(self) -> list[Path]:
+        """
+        Delete hashed copies and patched bundles that no recorded revision
+        links to, from its conf or CSS or through another hashed file.
+        Returns the deleted files.
+        """
+        dirs = [d for d in (self.CUSTOM_ASSETS / self.FINGERPRINT_DIR, self.CUSTOM_ASSETS / self.BUNDLES_DIR) if d.is_dir()]
+        if not dirs:
+            return []
+        hashed = [p for d in dirs for p in d.iterdir() if p.is_file() and not is_variant(p)]
+        
+        # Hashed files are snapshotted too, only what links to them keeps them alive
+        store = self.revision_store()
+        resolved = {d.resolve() for d in dirs}
+        roots = {d for rev in store.history() for name, d in rev["files"].items() if d and Path(name).parent not in resolved}
+        texts = [store.load(digest).decode("utf-8", errors="ignore") for digest in roots]
+        
+        # Whatever this apply wrote stays, linked or not
+        live = {p for p in self.served_assets if p in hashed}
+        texts += [path.read_bytes().decode("utf-8", errors="ignore") for path in live]
+        while texts:
+            text = texts.pop()
+            for path in hashed:
+                if path not in live and path.name in text:
+                    live.add(path)
+                    texts.append(path.read_bytes().decode("utf-8", errors="ignore"))
+        
+        pruned = []
+        for path in hashed:
+            if path in live:
+                continue
+            for stale in (path, path.with_name(path.name + ".gz"), path.with_name(path.name + ".br")):
+                stale.unlink(missing_ok=True)
+            pruned.append(path)
+            print(f"- Pruned unreferenced: {path.name}")
+        return pruned
+
+    @tracer.traced("fingerprint_assets")
+    def fingerprint_assets(self) -> None:
+        """Copy served assets to content-hashed names and point the conf and CSS at them."""
+        if self.THEME_HOST:
+            # The injected link is shared by every host, a per-tenant hash cannot go in it
+            raise ValueError("[X] Fingerprinting is not supported with host-keyed themes")
+        print("[+] Fingerprinting assets...")
+        dest = self.CUSTOM_ASSETS / self.FINGERPRINT_DIR
+        
+        # Images first, so the CSS copy can reference their hashed URLs
+        
+        url_map = {}
+        logo = self.CUSTOM_ASSETS / self.FILE_MAIN_LOGO
+        if self.fileio.exists(logo):
+            hashed = write_fingerprinted(self.fileio.read_binary(logo), logo.name, dest)
+            url_map[f"/assets/{logo.name}"] = f"{self.FINGERPRINT_URL}{hashed.name}"
+            self.served_assets.append(hashed)
+            print(f"- {logo.name} -> {hashed.name}")
+        
+        # Hash what the stylesheet location serves: the build, the flattened copy or the source
+        source = self.fileio.read_path(self.fileio.CSS_FILE.with_name(self.served_css()))
+        css = rewrite_css_urls(source, url_map)
+        hashed_css = write_fingerprinted(css.encode("utf-8"), self.fileio.CSS_FILE.name, dest)
+        self.served_assets.append(hashed_css)
+        print(f"- {self.fileio.CSS_FILE.name} -> {hashed_css.name}")
+        
+        # Point the injected stylesheet link at the hashed CSS
+        
+        conf = self.fileio.read_file()
+        href = stylesheet_href_re("/assets/", self.fileio.CSS_FILE.name, self.FINGERPRINT_URL)
+        new_conf, count = href.subn(f"{self.FINGERPRINT_URL}{hashed_css.name}", conf)
+        
+        if count == 0:
+            print("- Stylesheet link not found in config (skipped).")
+        elif new_conf != conf:
+            self.fileio.write_file(new_conf)
+            print("- Stylesheet link updated.")
+        
+        if self.INLINE_VARS == "preload":
+            self.inline_theme_vars("")
+        
+        OVERRIDE = self.location_block(self.FINGERPRINT_URL, dest, cache_control="public, max-age=31536000, immutable")
+        
+        inserted = self.fileio.insert_block(marker=self.MARKER_FINGERPRINT, data=OVERRIDE)
+        if inserted:
+            print("- Fingerprinted location block inserted.")
+        else:
+            print("- Fingerprinted location block already present (skipped).")
+    
+    @tracer.traced("build_css")
+    def build_css(self) -> None:
+        """Write the minified production CSS next to the source and serve it in its place."""
+        print("[+] Building Production CSS...")
+        source = self.fileio.read_css()
+        out = self.production_css
+        
+        try:
+            built = self.fileio.read_path(out)
+        except FileNotFoundError:
+            built = ""
+        
+        # Flattening changes the output, so it is part of what the build was made from
+        digest = source_digest(source, flatten=self.FLATTEN_VARS)
+        if built_from(built) == digest:
+            print(f"- {out.name} already built from this source (skipped).")
+        else:
+            with tracer.span("minify_css"):
+                body = self.flatten_css(source) if self.FLATTEN_VARS else source
+                built = build_production_css(body, digest=digest)
+            self.fileio.write_path(out, built)
+            before, after = len(source.encode("utf-8")), len(built.encode("utf-8"))
+            print(f"- {self.fileio.CSS_FILE.name} -> {out.name}: {before} -> {after} bytes "
+                  f"({100 * (before - after) / before:.0f}% smaller)")
+        self.served_assets.append(out)
+        
+        if self.serve_css():
+            print("- Stylesheet location now serves the production CSS.")
+        else:
+            print("- Stylesheet location already serves the production CSS (skipped).")
+    
+    def flatten_css(self, source: str) -> str:
+        """source with var() chains in its vars block resolved to literals."""
+        b = source.find(self.fileio.VARS_BEGIN)
+        e = source.find(self.fileio.VARS_END)
+        if b == -1 or e == -1 or e <= b:
+            raise ValueError("[X] Vars block markers not found or out of order in CSS.")
+        
+        block = source[b:e]
+        graph = self.var_graph if self._graph_block == block else self.resolve_vars(block, block)
+        return source[:b] + graph.flatten(block) + source[e:]
+    
+    def build_flat_css(self) -> None:
+        """Write the CSS with var() chains resolved next to the source and serve it in its place."""
+        print("[+] Flattening Theme Variables...")
+        out = self.flat_css
+        self.fileio.write_path(out, self.flatten_css(self.fileio.read_css()))
+        self.served_assets.append(out)
+        
+        if self.serve_css():
+            print("- Stylesheet location now serves the flattened CSS.")
+        else:
+            print("- Stylesheet location already serves the flattened CSS (skipped).")
+    
+    def serve_source_css(self) -> None:
+        """Point the stylesheet location back at the source if an earlier apply left it on a derived copy."""
+        conf = self.fileio.read_file()
+        derived = (self.production_css.name, self.flat_css.name)
+        if not any(f"alias {self.served_alias(name)};" in conf for name in derived):
+            return
+        if self.serve_css():
+            print("- Stylesheet location serves the source CSS again, the derived copy is no longer used.")
+    
+    def serve_css(self) -> bool:
+        """Alias /assets/<css name> to the file served_css() names. Returns True if the conf changed."""
+        # Same URL either way, so the injected link and any preload keep working
+        conf = self.fileio.read_file()
+        marker = self.MARKER_THEME_CSS if self.MARKER_THEME_CSS in conf else self.MARKER_MAIN_LOGO
+        css = self.fileio.CSS_FILE.name
+        OVERRIDE = self.location_block(f"/assets/{css}", self.served_alias(self.served_css()))
+        return self.fileio.insert_block(marker=marker, data=OVERRIDE)
+    
+    def stage_precompressed(self) -> None:
+        """Stage fresh .gz/.br variants for every served asset with a staged change."""
+        staging = self.fileio.staging
+        for asset in dict.fromkeys(self.served_assets):
+            if staging is not None and asset in staging.pending:
+                for variant in stage_variants(staging, asset):
+                    print(f"- Precompressed: {variant}")
+    
+    @tracer.traced("precompress_assets")
+    def precompress_assets(self) -> None:
+        """Refresh .gz/.br variants of every served asset whose source changed."""
+        for asset in dict.fromkeys(self.served_assets):
+            if not asset.is_file():
+                continue
+            for variant in precompress(asset):
+                print(f"- Precompressed: {variant}")
     
     def check_sudo(self):
         '''Check if the script is running as sudo'''
@@ -113,11 +625,12 @@ class TBOverride:
         else:
             return False
     
+    @tracer.traced("override_main_logo")
     def override_main_logo(self, path: str | Path) -> None:
         """Override the main logo in TB."""
         print("[+] Overriding Default TB Logo")
         if not path:
-            exist = (self.CUSTOM_ASSETS / self.FILE_MAIN_LOGO).is_file()
+            exist = self.fileio.exists(self.CUSTOM_ASSETS / self.FILE_MAIN_LOGO)
         else:
             print(path)
             exist = Path(path).is_file()
@@ -127,12 +640,14 @@ class TBOverride:
         
         print(f"- Found logo: {self.CUSTOM_ASSETS / self.FILE_MAIN_LOGO}")
 
-        OVERRIDE = (
-            f"    location = /assets/{self.FILE_MAIN_LOGO} {{\n"
-            f"        alias {self.CUSTOM_ASSETS / self.FILE_MAIN_LOGO};\n"
-            f'        add_header Cache-Control "no-store";\n'
-            f"    }}\n"
-        )
+        if path:
+            with tracer.span("install_logo"):
+                self.install_logo(path)
+
+        # The bundle requests the logo at a fixed URL, so revalidate it by ETag
+        cache_control = "no-cache" if self.FINGERPRINT else "no-store"
+        OVERRIDE = self.location_block(f"/assets/{self.FILE_MAIN_LOGO}", self.served_alias(self.FILE_MAIN_LOGO), cache_control)
+        self.served_assets.append(self.CUSTOM_ASSETS / self.FILE_MAIN_LOGO)
 
         inserted = self.fileio.insert_block(marker=self.MARKER_MAIN_LOGO, data=OVERRIDE)
         if inserted:
@@ -140,12 +655,238 @@ class TBOverride:
         else:
             print("- Logo location block already present (skipped).")
 
+        if self.THEME_HOST:
+            self.register_host()
+
+    def install_logo(self, path: str | Path) -> None:
+        """Optimise an uploaded logo, install it and generate the favicon set."""
+        optimizer = AssetOptimizer(self.CUSTOM_ASSETS / ".cache", size_budget=self.LOGO_SIZE_BUDGET)
+        
+        self._install(optimizer.optimize_logo(path), self.CUSTOM_ASSETS / self.FILE_MAIN_LOGO)
+        
+        favicons = optimizer.favicons(path)
+        if not favicons:
+            return
+        
+        for name, cached in favicons.items():
+            self._install(cached, self.CUSTOM_ASSETS / self.FAVICON_DIR / name)
+        
+        if self.MARKER_FAVICON not in self.fileio.read_file():
+            print(f"- Marker {self.MARKER_FAVICON} not in config, favicon locations skipped.")
+            return
+        
+        favicon_dir = self.CUSTOM_ASSETS / self.FAVICON_DIR
+        OVERRIDE = (
+            self.location_block(self.FAVICON_URL, self.served_alias(self.FAVICON_DIR / "favicon.ico"))
+            + self.location_block(f"/assets/{self.FAVICON_DIR}/", self.served_alias(self.FAVICON_DIR))
+        )
+        self.served_assets.extend(favicon_dir / name for name in favicons)
+        
+        inserted = self.fileio.insert_block(marker=self.MARKER_FAVICON, data=OVERRIDE)
+        if inserted:
+            print("- Favicon location blocks inserted.")
+        else:
+            print("- Favicon location blocks already present (skipped).")
+    
+    @tracer.traced("override_fonts")
+    def override_fonts(self, family: str, faces: Iterable[tuple[str | Path, str, str]]) -> None:
+        """Subset and install a brand font family, serve it with long caching and declare it in the CSS."""
+        print("[+] Installing Brand Font...")
+        if not family or _FAMILY_BAD_RE.search(family):
+            raise ValueError(f"[X] Not a valid font family name: {family!r}")
+        
+        dest = self.shared_dir(self.FONTS_DIR)
+        pipeline = FontPipeline(self.CUSTOM_ASSETS / ".cache", self.FONT_UNICODE_RANGES)
+        slug = re.sub(r"[^a-z0-9]+", "-", family.lower()).strip("-")
+        
+        declared = []
+        for src, weight, style in faces:
+            built = pipeline.build(src)
+            hashed = write_fingerprinted(built.read_bytes(), f"{slug}-{weight}-{style}{built.suffix.lower()}", dest)
+            subset = built != Path(src)
+            declared.append(FontFace(f"/assets/{self.FONTS_DIR}/{hashed.name}", str(weight), style,
+                                     self.FONT_UNICODE_RANGES if subset else None))
+            print(f"- {Path(src).name} -> {hashed.name}")
+        
+        if not declared:
+            raise ValueError(f"[X] No font files given for {family!r}")
+        
+        # @font-face block in the CSS, replaced as a whole on every apply
+        
+        css = self.fileio.read_css()
+        block = (
+            f"/* {self.fileio.FONTS_BEGIN} (generated, edit the profile's [fonts] instead) */\n"
+            f"{font_face_rules(family, declared)}\n"
+            f"/* {self.fileio.FONTS_END} */"
+        )
+        
+        b = css.find(self.fileio.FONTS_BEGIN)
+        e = css.find(self.fileio.FONTS_END)
+        if b != -1 and e > b:
+            new_css = css[:css.rfind("/*", 0, b)] + block + css[css.find("*/", e) + 2:]
+        else:
+            v = css.find(self.fileio.VARS_END)
+            after = css.find("*/", v) if v != -1 else -1
+            if after == -1:
+                raise ValueError("[X] Vars block end marker not found in CSS.")
+            new_css = css[:after + 2] + "\n\n" + block + css[after + 2:]
+        
+        self.served_assets.append(self.fileio.CSS_FILE)
+        if new_css != css:
+            self.fileio.write_css(new_css)
+            print("- @font-face rules updated in CSS.")
+        
+        # Names change with the content, so the files can be cached for good
+        
+        conf = self.fileio.read_file()
+        marker = self.MARKER_FONTS if self.MARKER_FONTS in conf else self.MARKER_MAIN_LOGO
+        OVERRIDE = self.location_block(f"/assets/{self.FONTS_DIR}/", dest, cache_control="public, max-age=31536000, immutable")
+        
+        inserted = self.fileio.insert_block(marker=marker, data=OVERRIDE)
+        if inserted:
+            print("- Font location block inserted.")
+        else:
+            print("- Font location block already present (skipped).")
+    
+    @tracer.traced("inline_images")
+    def inline_images(self, images: Dict[str, str | Path]) -> Dict[str, str]:
+        """
+        Turn theme images into values for their CSS variables, to be applied by
+        override_theme: data URIs up to INLINE_IMAGE_MAX bytes, long-cached files above.
+        """
+        print("[+] Inlining Theme Images...")
+        optimizer = AssetOptimizer(self.CUSTOM_ASSETS / ".cache")
+        dest = self.shared_dir(self.IMAGES_DIR)
+        
+        values = {}
+        inlined = []
+        changed = 0
+        current = self.fileio.vars_values()
+        for var_name, src in images.items():
+            src = Path(src)
+            if src.suffix.lower() not in IMAGE_TYPES:
+                raise ValueError(f"[X] Unsupported image type {src.suffix!r} for {var_name}: {src}")
+            
+            data = optimizer.optimize_image(src).read_bytes()
+            name = re.sub(r"[^A-Za-z0-9._-]+", "-", src.name)
+            served_url = f'url("/assets/{self.IMAGES_DIR}/{fingerprinted_name(name, data)}")'
+            
+            if len(data) <= self.INLINE_IMAGE_MAX:
+                values[var_name] = validate_value(var_name, f'url("{data_uri(data, src.suffix)}")')
+                inlined.append((values[var_name], served_url))
+                how = "inlined"
+            else:
+                hashed = write_fingerprinted(data, name, dest)
+                values[var_name] = validate_value(var_name, served_url)
+                if src.suffix.lower() == ".svg":
+                    self.served_assets.append(hashed)
+                how = f"served as {hashed.name}"
+            
+            if current.get(var_name) == values[var_name]:
+                print(f"- {src.name}: already applied (skipped)")
+                continue
+            changed += 1
+            print(f"- {src.name}: {len(data)} bytes, {how}")
+        
+        # Growth is measured against the url() the image would get as a file
+        
+        if inlined and changed:
+            as_data = "".join(v for v, _ in inlined).encode("utf-8")
+            as_url = "".join(u for _, u in inlined).encode("utf-8")
+            grew = len(as_data) - len(as_url)
+            grew_gz = len(gzip.compress(as_data, mtime=0)) - len(gzip.compress(as_url, mtime=0))
+            print(f"[+] Inlined {len(inlined)} image(s): {len(inlined)} fewer request(s) per cold load, "
+                  f"CSS +{grew} bytes (+{grew_gz} gzipped).")
+        
+        if len(inlined) == len(values):
+            return values
+        
+        # Names change with the content, so the files can be cached for good
+        
+        conf = self.fileio.read_file()
+        marker = self.MARKER_IMAGES if self.MARKER_IMAGES in conf else self.MARKER_MAIN_LOGO
+        OVERRIDE = self.location_block(f"/assets/{self.IMAGES_DIR}/", dest, cache_control="public, max-age=31536000, immutable")
+        
+        inserted = self.fileio.insert_block(marker=marker, data=OVERRIDE)
+        if inserted:
+            print("- Image location block inserted.")
+        else:
+            print("- Image location block already present (skipped).")
+        
+        return values
+    
+    def _install(self, src: Path, dst: Path) -> None:
+        """Copy src over dst through the stage, so a failed apply rolls it back too."""
+        if self.fileio.write_binary(dst, src.read_bytes()):
+            print(f"- Installed: {dst}")
+
+    @tracer.traced("override_bundle")
+    def override_bundle(self, path: str | Path, replacements: Dict[str, str], url: str | None = None) -> Dict[str, int]:
+        """
+        Patch hard-coded strings in a compiled UI bundle and serve the patched
+        copy under a content-hashed name. url is how index.html refers to the
+        bundle (its file name by default), pointed at the copy through sub_filter.
+        """
+        if self.THEME_HOST:
+            # location / is shared by every host, so is the sub_filter pointing at the copy
+            raise ValueError("[X] Bundle patching is not supported with host-keyed themes")
+        print("[+] Patching TB UI Bundle...")
+        path = Path(path)
+        
+        if not path.is_file():
+            raise FileNotFoundError(f"[X] Bundle not found: {path}")
+        
+        print(f"- Found bundle: {path}")
+        
+        # Streamed to a scratch copy, then staged under a name taken from its content
+        dest = self.CUSTOM_ASSETS / self.BUNDLES_DIR
+        with tempfile.TemporaryDirectory() as scratch:
+            tmp = Path(scratch) / path.name
+            hits = BundlePatcher(replacements).patch(path, tmp)
+            patched = dest / hashed_name(path.name, file_hash(tmp))
+            self.fileio.write_binary(patched, tmp.read_bytes())
+        self.served_assets.append(patched)
+        
+        for pattern, count in hits.items():
+            print(f"- {pattern!r}: {count} replacement(s)")
+        print(f"- {path.name} -> {patched.name}")
+        
+        url = url or path.name
+        served_url = f"/assets/{self.BUNDLES_DIR}/{patched.name}"
+        
+        OVERRIDE = self.location_block(f"/assets/{self.BUNDLES_DIR}/", dest, cache_control="public, max-age=31536000, immutable")
+        inserted = self.fileio.insert_block(marker=self.MARKER_BUNDLES, data=OVERRIDE)
+        if inserted:
+            print("- Bundle location block inserted.")
+        else:
+            print("- Bundle location block already present (skipped).")
+        
+        # New content, new URL: the page is what changes, the bundle never has to be revalidated
+        location = self.INLINE_VARS_LOCATION
+        anchor = f'"{url}"'
+        replacement = f'"{served_url}"'
+        text = f"sub_filter '{self._nginx_quote(anchor)}' '{self._nginx_quote(replacement)}';"
+        # Matched as written, the anchor's own quotes are part of it
+        if self.fileio.upsert_directive(self.MARKER_BUNDLES, location, "sub_filter", [f"'{anchor}'"], text):
+            print(f"- Bundle reference updated in {location} location.")
+        self.fileio.upsert_directive(self.MARKER_BUNDLES, location, "proxy_set_header", ["Accept-Encoding"],
+                                     'proxy_set_header Accept-Encoding "";')
+        
+        return hits
+
+    @tracer.traced("override_theme")
     def override_theme(self, elements: Dict[str, str]) -> None:
         """Replace vars inside the TB_CUSTOM_THEME_VARS block in the CSS file."""
         print(f"[+] Overriding Default TB Theme...")
         
         css_path = self.fileio.CSS_FILE
-        old_full_text = css_path.read_text(encoding="utf-8")
+        if self.THEME_HOST and not self.fileio.has_css():
+            # A new tenant starts from the default theme
+            self.fileio.write_css(self.fileio.read_path(self.THEME_MAP_DEFAULT / css_path.name))
+            print(f"- New tenant CSS seeded from {self.THEME_MAP_DEFAULT / css_path.name}")
+        
+        with tracer.span("read_css"):
+            old_full_text = self.fileio.read_css()
         
         if len(old_full_text) == 0:
             raise ValueError("[X] CSS File Empty")
@@ -158,17 +899,58 @@ class TBOverride:
         if b == -1 or e == -1 or e <= b:
             raise ValueError("[X] Vars block markers not found or out of order in CSS.")
 
-        new_var_block = self.fileio.override_css_value(old_file=old_full_text, css_selectors=elements)
+        with tracer.span("rewrite_vars"):
+            new_var_block = self.fileio.override_css_value(old_file=old_full_text, css_selectors=elements)
+        self.served_assets.append(css_path)
 
         new_full_text = old_full_text[:b] + new_var_block + old_full_text[e:]
         
-        css_path.write_text(new_full_text, encoding="utf-8")
+        with tracer.span("resolve_vars"):
+            graph = self.resolve_vars(old_full_text[b:e], new_var_block)
+        
+        if self.THEME_HOST:
+            self.register_host()
+        
+        if self.INLINE_VARS:
+            self.inline_theme_vars(new_var_block)
+        
+        if new_full_text == old_full_text:
+            print("- Theme variables already up to date (skipped).")
+            return
+
+        with tracer.span("write_css"):
+            self.fileio.write_css(new_full_text)
         print("[+] Theme variables updated in CSS.")
 
-def update_tb(conf_path: str, css_path: str, overrides: dict) -> None:
+    def resolve_vars(self, old_var_block: str, new_var_block: str) -> VarGraph:
+        """Update the var() graph for the new block, rejecting cycles."""
+        graph = self.var_graph
+        
+        if graph is not None and self._graph_block == old_var_block:
+            # Only recompute what depends on the changed variables
+            new_values = VarsBlock(new_var_block).values()
+            graph.update({k: v for k, v in new_values.items() if graph.raw.get(k) != v})
+        else:
+            graph = VarGraph.from_block(new_var_block)
+        
+        if graph.cycles:
+            self.var_graph = None
+            cycles = "; ".join(" -> ".join(c + c[:1]) for c in graph.cycles)
+            raise ValueError(f"[X] var() cycle in theme variables: {cycles}")
+        
+        for name, missing in graph.dangling.items():
+            print(f"- Warning: {name} references undeclared {', '.join(sorted(missing))}")
+        
+        self.var_graph = graph
+        self._graph_block = new_var_block
+        return graph
+
+@tracer.traced("update_tb")
+def update_tb(conf_path: str, css_path: str, overrides: dict, fingerprint: bool = False) -> None:
     '''Run the program'''
     
     tbov = TBOverride(conf_path=conf_path, css_path=css_path)
+    tbov.FINGERPRINT = fingerprint
     
     # Check sudo
     
@@ -176,21 +958,217 @@ def update_tb(conf_path: str, css_path: str, overrides: dict) -> None:
         print(f"Run script as sudo!")
         sys.exit(1)
     
+    # Same checks as the headless paths, nothing is written if any value is bad
+    
+    overrides, errors = validate_overrides(overrides)
+    if errors:
+        raise ValueError("[X] Invalid overrides:\n" + "\n".join(errors))
+    
     # Overrides
     
+    tracker = ChangeTracker(conf_paths=[conf_path], asset_paths=[css_path])
+    
     # print("\n")
     # tbov.override_main_logo()
     print("\n")
-    tbov.override_theme(elements=overrides)
+    with tbov.fileio.edit_conf():
+        tbov.override_theme(elements=overrides)
+        if fingerprint:
+            tbov.fingerprint_assets()
     print("\n")
     
-    # Check + reload nginx
+    # Check + reload nginx, only if the config itself changed
+    
+    apply_changes(tracker)
+    tbov.precompress_assets()
+    tbov.record_revision()
+
+NGINX_TEST_CMD = ["nginx", "-t"]
+NGINX_RELOAD_CMD = ["systemctl", "reload", "nginx"]
+
+def apply_changes(tracker: ChangeTracker, validate_cmd: list[str] | None = None,
+                  reload_cmd: list[str] | None = None, timeout: float | None = None) -> bool:
+    '''Validate and reload nginx if the tracked config changed. Returns True if reloaded'''
+    changes = tracker.classify()
+    print(f"[+] Apply result: {changes.describe()}")
+    
+    if not changes.needs_reload:
+        print("- NGINX reload not needed (skipped).")
+        return False
     
-    subprocess.run(["nginx", "-t"], capture_output=True, text=True, check=True)
+    # Cheap in-process checks first, only a plausible config reaches nginx -t
+    with tracer.span("precheck"):
+        for path in tracker.conf_paths:
+            if path in changes.changed_files:
+                checker.require(path)
+    print("[+] Pre-validation passed.")
+    
+    validate_nginx(validate_cmd, timeout=timeout)
+    reload_nginx(reload_cmd, timeout=timeout)
+    return True
+
+@tracer.traced("nginx_test")
+def validate_nginx(cmd: list[str] | None = None, timeout: float | None = None) -> None:
+    '''Validate the nginx config, raises CalledProcessError on failure'''
+    subprocess.run(list(cmd or NGINX_TEST_CMD), capture_output=True, text=True, check=True, timeout=timeout)
     print("[+] NGINX Tests Passed!")
-    subprocess.run(["systemctl", "reload", "nginx"], capture_output=True, text=True, check=True)
+
+@tracer.traced("nginx_reload")
+def reload_nginx(cmd: list[str] | None = None, timeout: float | None = None) -> None:
+    '''Reload nginx workers with the current config'''
+    subprocess.run(list(cmd or NGINX_RELOAD_CMD), capture_output=True, text=True, check=True, timeout=timeout)
     print("[+] Reloaded NGINX.")
 
+@tracer.traced("update_tb_batch")
+def update_tb_batch(profiles: Iterable[BrandProfile | tuple], fingerprint: bool = False,
+                    validate_cmd: list[str] | None = None, reload_cmd: list[str] | None = None,
+                    timeout: float | None = None, inline_vars: str | None = None,
+                    inline_image_max: int | None = None, minify_css: bool = False,
+                    flatten_vars: bool = False, require_root: bool = True) -> None:
+    '''Apply many brand profiles with one nginx validation and one reload. require_root=False is for stubbed nginx commands'''
+    
+    staging = StagedChanges()
+    profiles = [BrandProfile(*profile) for profile in profiles]
+    
+    if not profiles:
+        return
+    
+    sites = [profile.site(staging) for profile in profiles]
+    
+    asset_paths = {tbov.fileio.CSS_FILE for tbov in sites}
+    if minify_css:
+        asset_paths |= {tbov.production_css for tbov in sites}
+    elif flatten_vars:
+        asset_paths |= {tbov.flat_css for tbov in sites}
+    tracker = ChangeTracker(conf_paths={Path(p.conf_path) for p in profiles}, asset_paths=asset_paths)
+    
+    # Check sudo
+    
+    if require_root and os.geteuid() != 0:
+        print(f"Run script as sudo!")
+        sys.exit(1)
+    
+    # Validate every override up front, reporting all errors at once
+    
+    errors = []
+    for i, profile in enumerate(profiles):
+        overrides = dict(profile.overrides or {})
+        if profile.fonts:
+            overrides.setdefault("--tb-font-family", font_stack(profile.fonts["family"]))
+        normalised, profile_errors = validate_overrides(overrides)
+        profiles[i] = profile._replace(overrides=normalised)
+        errors.extend(f"{profile.css_path}: {e}" for e in profile_errors)
+        for var_name in profile.images or {}:
+            if VAR_REGISTRY.get(var_name, {}).get("type") != "image":
+                errors.append(f"{profile.css_path}: [X] {var_name}: not an image variable")
+    
+    if errors:
+        raise ValueError("[X] Invalid overrides:\n" + "\n".join(errors))
+    
+    # Stage every override in memory first
+    
+    for profile, tbov in zip(profiles, sites):
+        tbov.FINGERPRINT = fingerprint
+        tbov.INLINE_VARS = inline_vars
+        tbov.MINIFY_CSS = minify_css
+        tbov.FLATTEN_VARS = flatten_vars
+        if inline_image_max is not None:
+            tbov.INLINE_IMAGE_MAX = inline_image_max
+        
+        print("\n")
+        with tbov.fileio.edit_conf():
+            overrides = dict(profile.overrides)
+            if profile.images:
+                overrides.update(tbov.inline_images(profile.images))
+            if overrides:
+                tbov.override_theme(elements=overrides)
+            if profile.fonts:
+                tbov.override_fonts(profile.fonts["family"], profile.fonts["faces"])
+            if profile.logo:
+                tbov.override_main_logo(profile.logo)
+            if minify_css:
+                tbov.build_css()
+            elif flatten_vars:
+                tbov.build_flat_css()
+            else:
+                tbov.serve_source_css()
+            if fingerprint:
+                tbov.fingerprint_assets()
+            for bundle, replacements, url in profile.bundles or []:
+                tbov.override_bundle(bundle, replacements, url)
+    
+    # Variants go out with their asset, gzip_static never pairs a new file with a stale .gz
+    for tbov in sites:
+        tbov.stage_precompressed()
+    
+    print("\n")
+    print(f"[+] Writing {len(staging.pending)} staged file(s)...")
+    with tracer.span("commit"):
+        if tracer.enabled:
+            tracer.add(bytes_written=sum(len(d if isinstance(d, bytes) else d.encode("utf-8")) for d in staging.pending.values()))
+        staging.commit()
+    
+    # Check once, roll everything back together on failure
+    
+    try:
+        apply_changes(tracker, validate_cmd, reload_cmd, timeout=timeout)
+    except subprocess.CalledProcessError as e:
+        print(f"[X] NGINX Tests Failed:\n{e.stderr}")
+        staging.rollback()
+        raise
+    except subprocess.TimeoutExpired as e:
+        print(f"[X] NGINX command timed out after {e.timeout}s: {' '.join(e.cmd)}")
+        staging.rollback()
+        raise
+    except ConfCheckError as e:
+        print(e)
+        staging.rollback()
+        raise
+    
+    for tbov in sites:
+        tbov.precompress_assets()
+        tbov.record_revision()
+
+@tracer.traced("rollback")
+def rollback_revision(conf_path: str | Path, assets_dir: str | Path, rev_id: str | None = None,
+                      validate_cmd: list[str] | None = None, reload_cmd: list[str] | None = None) -> str:
+    '''Swap a recorded revision back in place and reload once. Defaults to the revision before the latest'''
+    store = RevisionStore(Path(assets_dir) / ".revisions")
+    
+    if rev_id is None:
+        target = store.previous()
+        if target is None:
+            raise ValueError("[X] No earlier revision to roll back to")
+        rev_id = target["id"]
+    files = [Path(p) for p in store.get(rev_id)["files"]]
+    
+    if os.geteuid() != 0:
+        print(f"Run script as sudo!")
+        sys.exit(1)
+    
+    # Snapshot what is live now, so a failed rollback can be undone the same way
+    store.record(files, message=f"before rollback to {rev_id}")
+    current = store.head()["id"]
+    
+    conf_path = Path(conf_path).resolve()
+    tracker = ChangeTracker(conf_paths=[conf_path], asset_paths=[p for p in files if p != conf_path])
+    store.checkout(rev_id)
+    
+    try:
+        apply_changes(tracker, validate_cmd, reload_cmd)
+    except (subprocess.CalledProcessError, ConfCheckError) as e:
+        print(f"[X] Rollback to {rev_id} failed validation, restoring {current}")
+        store.checkout(current)
+        raise
+    
+    for path in files:
+        if path.is_file() and path != conf_path:
+            precompress(path)
+    
+    store.record(files, message=f"rollback to {rev_id}")
+    print(f"[+] Rolled back to {rev_id}.")
+    return rev_id
+
 if __name__ == "__main__":
     conf_path = Path("/etc/nginx/sites-available/tb-proxy")
     css_path = Path("/opt/custom_assets/custom-theme.css")
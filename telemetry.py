@@ -0,0 +1,203 @@
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Span:
+    """One timed phase with its counters."""
+
+    __slots__ = ("name", "parent", "start", "duration", "bytes_read", "bytes_written", "vars_changed", "error")
+
+    def __init__(self, name: str, parent: str | None):
+        self.name = name
+        self.parent = parent
+        self.start = time.time()
+        self.duration = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.vars_changed = 0
+        self.error: str | None = None
+
+    def as_dict(self) -> Dict:
+        return {
+            "span": self.name,
+            "parent": self.parent,
+            "start": round(self.start, 6),
+            "duration_s": round(self.duration, 6),
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "vars_changed": self.vars_changed,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    """
+    Times apply phases as nested spans. Finished spans are logged as JSON
+    lines and aggregated into Prometheus histograms/counters written as a
+    node_exporter textfile. Disabled (and nearly free) until configured.
+    """
+
+    def __init__(self):
+        self.json_log: Path | None = None
+        self.textfile: Path | None = None
+
+        # Open spans are per thread, so concurrent applies nest independently
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.finished: List[Span] = []
+
+    @property
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @property
+    def enabled(self) -> bool:
+        return self.json_log is not None or self.textfile is not None
+
+    def configure(self, json_log: str | Path | None = None, textfile: str | Path | None = None) -> None:
+        """json_log '-' logs to stderr. Defaults come from TBOV_TRACE_JSON / TBOV_PROM_TEXTFILE."""
+        json_log = json_log or os.environ.get("TBOV_TRACE_JSON")
+        textfile = textfile or os.environ.get("TBOV_PROM_TEXTFILE")
+        self.json_log = Path(json_log) if json_log else None
+        self.textfile = Path(textfile) if textfile else None
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        if not self.enabled:
+            yield None
+            return
+
+        span = Span(name, self._stack[-1].name if self._stack else None)
+        self._stack.append(span)
+        t0 = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - t0
+            self._stack.pop()
+            with self._lock:
+                self.finished.append(span)
+                self._log(span)
+
+            # Outermost span done: publish the metrics
+            if not self._stack:
+                self.flush()
+
+    def traced(self, name: str):
+        """Decorator running the function inside span(name)."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add(self, bytes_read: int = 0, bytes_written: int = 0, vars_changed: int = 0) -> None:
+        """Credit counters to every open span, so parents include their children."""
+        if not self._stack:
+            return
+        for span in self._stack:
+            span.bytes_read += bytes_read
+            span.bytes_written += bytes_written
+            span.vars_changed += vars_changed
+
+    def _log(self, span: Span) -> None:
+        if self.json_log is None:
+            return
+        line = json.dumps(span.as_dict(), sort_keys=True)
+        if str(self.json_log) == "-":
+            print(line, file=sys.stderr)
+        else:
+            with open(self.json_log, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def flush(self) -> None:
+        """Fold finished spans into the cumulative metrics and rewrite the textfile."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self.textfile is None or not self.finished:
+            self.finished.clear()
+            return
+
+        state_path = self.textfile.with_name(self.textfile.name + ".state.json")
+        try:
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            state = {}
+
+        for span in self.finished:
+            phase = state.setdefault(span.name, {
+                "buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0,
+                "bytes_read": 0, "bytes_written": 0, "vars_changed": 0, "errors": 0,
+            })
+            for i, le in enumerate(BUCKETS):
+                if span.duration <= le:
+                    phase["buckets"][i] += 1
+            phase["sum"] += span.duration
+            phase["count"] += 1
+            phase["bytes_read"] += span.bytes_read
+            phase["bytes_written"] += span.bytes_written
+            phase["vars_changed"] += span.vars_changed
+            phase["errors"] += span.error is not None
+        self.finished.clear()
+
+        self._write_atomic(state_path, json.dumps(state, indent=2, sort_keys=True))
+        self._write_atomic(self.textfile, render_textfile(state))
+
+    @staticmethod
+    def _write_atomic(path: Path, data: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(data, encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def render_textfile(state: Dict[str, Dict]) -> str:
+    """Prometheus text exposition format for the cumulative phase metrics."""
+    lines = [
+        "# HELP tbov_phase_duration_seconds Duration of TBOverride apply phases.",
+        "# TYPE tbov_phase_duration_seconds histogram",
+    ]
+    for phase, m in sorted(state.items()):
+        for le, count in zip(BUCKETS, m["buckets"]):
+            lines.append(f'tbov_phase_duration_seconds_bucket{{phase="{phase}",le="{le}"}} {count}')
+        lines.append(f'tbov_phase_duration_seconds_bucket{{phase="{phase}",le="+Inf"}} {m["count"]}')
+        lines.append(f'tbov_phase_duration_seconds_sum{{phase="{phase}"}} {m["sum"]:.6f}')
+        lines.append(f'tbov_phase_duration_seconds_count{{phase="{phase}"}} {m["count"]}')
+
+    counters = [
+        ("tbov_phase_bytes_read_total", "Bytes read during TBOverride apply phases.", "bytes_read"),
+        ("tbov_phase_bytes_written_total", "Bytes written during TBOverride apply phases.", "bytes_written"),
+        ("tbov_phase_vars_changed_total", "Theme variables changed during TBOverride apply phases.", "vars_changed"),
+        ("tbov_phase_errors_total", "TBOverride apply phases that raised.", "errors"),
+    ]
+    for name, help_text, key in counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for phase, m in sorted(state.items()):
+            lines.append(f'{name}{{phase="{phase}"}} {m[key]}')
+
+    return "\n".join(lines) + "\n"
+
+
+# Shared tracer used by tb_override, configured from the environment
+tracer = Tracer()
+tracer.configure()
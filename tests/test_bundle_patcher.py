@@ -0,0 +1,16 @@
+from bundle_patcher import BundlePatcher
+
+
+def test_patch_streams_all_patterns_in_one_pass(tmp_path):
+    src = tmp_path / "main.abc123.js"
+    src.write_bytes(b'title:"ThingsBoard",footer:"ThingsBoard Inc",c:"#305680";' * 1000)
+
+    patcher = BundlePatcher({"ThingsBoard": "Acme", "ThingsBoard Inc": "Acme Corp", "#305680": "#ff7a00"})
+    hits = patcher.patch(src)
+
+    out = BundlePatcher.sibling(src)
+    assert out.name == "main.abc123.patched.js"
+    assert out.read_bytes() == b'title:"Acme",footer:"Acme Corp",c:"#ff7a00";' * 1000
+    assert hits == {"ThingsBoard": 1000, "ThingsBoard Inc": 1000, "#305680": 1000}
+    # Source is untouched
+    assert src.read_bytes().startswith(b'title:"ThingsBoard"')
@@ -0,0 +1,82 @@
+import subprocess
+
+import pytest
+
+import tb_override
+from conf_check import ConfChecker, ConfCheckError
+
+
+def test_checker_reports_syntax_duplicates_and_aliases(tmp_path):
+    logo = tmp_path / "logo.svg"
+    logo.write_text("<svg/>")
+    conf = (
+        "server {\n"
+        "    listen 8080;\n"
+        f"    location = /assets/logo.svg {{ alias {logo}; gzip_static on; }}\n"
+        f"    location = /assets/logo.svg {{ alias {logo}; }}\n"
+        f"    location ^~ /assets/favicons/ {{ alias {tmp_path}/missing/; }}\n"
+        "    location /x { etag maybe; add_header Cache-Control; }\n"
+        "}\n"
+    )
+    errors = ConfChecker().check_text(conf)
+    assert len(errors) == 4
+    assert "line 4: duplicate location '= /assets/logo.svg' (first at line 3)" in errors
+    assert "line 6: invalid value 'maybe' for 'etag'" in errors
+    assert "line 6: wrong number of arguments for 'add_header' (1)" in errors
+    assert errors[-1].startswith("alias target is not a directory")
+
+    assert ConfChecker().check_text("server { listen 80;\n") == ["Unexpected end of nginx config (unbalanced braces?)"]
+
+
+def test_upstream_servers_are_simple_directives():
+    conf = (
+        "upstream backend {\n"
+        "    server 127.0.0.1:8080 weight=5;\n"
+        "    server 127.0.0.1:8081 backup;\n"
+        "}\n"
+        "server {\n"
+        "    listen 8080;\n"
+        "    location / { proxy_pass http://backend; }\n"
+        "}\n"
+    )
+    assert ConfChecker().check_text(conf) == []
+
+    # Still a block everywhere else, and an upstream server still needs an address
+    errors = ConfChecker().check_text("upstream b { server; }\nhttp { server 127.0.0.1; }\n")
+    assert errors == ["line 1: wrong number of arguments for 'server' (0)", "line 2: 'server' must be a block"]
+
+
+def test_checker_caches_by_hash_but_rechecks_aliases(tmp_path):
+    logo = tmp_path / "logo.svg"
+    conf = f"server {{ location = /logo.svg {{ alias {logo}; }} }}\n"
+    checker = ConfChecker()
+
+    assert checker.check_text(conf) == [f"alias target does not exist: {logo}"]
+    logo.write_text("<svg/>")
+    assert checker.check_text(conf) == []
+    assert (checker.misses, checker.hits) == (1, 1)
+
+
+def test_failed_precheck_rolls_back_without_nginx(tmp_path, monkeypatch):
+    conf = tmp_path / "tb-proxy"
+    css = tmp_path / "custom-theme.css"
+    conf.write_text(
+        "server {\n    # $MAIN_LOGO$\n"
+        "    location / { proxy_pass http://localhost:8081/; }\n"
+        "    location / { proxy_pass http://localhost:8082/; }\n}\n"
+    )
+    css.write_text(open("tests/example_css.css").read())
+    logo = tmp_path / "logo.svg"
+    logo.write_text("<svg/>")
+    original = conf.read_text()
+
+    calls = []
+    monkeypatch.setattr(tb_override.os, "geteuid", lambda: 0)
+    monkeypatch.setattr(tb_override.subprocess, "run",
+                        lambda cmd, **kw: calls.append(cmd) or subprocess.CompletedProcess(cmd, 0, "", ""))
+
+    with pytest.raises(ConfCheckError, match="duplicate location '/'"):
+        tb_override.update_tb_batch([(conf, css, {}, logo, tmp_path)])
+
+    assert conf.read_text() == original
+    assert calls == []
@@ -0,0 +1,80 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import tb_override
+from css_build import build_production_css, built_from, minify_css, source_digest, used_vars
+
+css_file = Path("tests/example_css.css")
+conf_file = Path("tb-proxy")
+
+
+def test_minify_keeps_strings_urls_and_calc_spacing():
+    css = """
+    /* comment with { braces } */
+    @media (min-width: calc(600px + 1em)) {
+      .a > b ,  c:hover { color : red !important ; }
+      .empty { }
+    }
+    .q { width: calc( 100% - 2px ); background: url(data:image/png;base64,AA==) ; content: ' { ; } ' }
+    [style*="logo.svg"] { margin: 0 }
+    """
+    assert minify_css(css) == (
+        "@media (min-width: calc(600px + 1em)){.a>b,c:hover{color:red!important}}"
+        ".q{width:calc(100% - 2px);background:url(data:image/png;base64,AA==);content:' { ; } '}"
+        '[style*="logo.svg"]{margin:0}'
+    )
+
+
+def test_unused_vars_are_dropped_through_var_chains():
+    css = """
+    :root{ --a: var(--b, var(--c)); --b: 1px; --c: 2px; --d: var(--a); --e: 3px; }
+    .x{ padding: var(--a) }
+    .y{ --e: 4px; }
+    """
+    assert used_vars(css) == {"--a", "--b", "--c"}
+    assert minify_css(css, used_vars(css)) == ":root{--a:var(--b,var(--c));--b:1px;--c:2px}.x{padding:var(--a)}"
+
+
+def test_production_css_is_served_and_rebuilt_only_on_change(tmp_path, monkeypatch, capsys):
+    conf = tmp_path / "tb-proxy"
+    css = tmp_path / "custom-theme.css"
+    shutil.copy(conf_file, conf)
+    shutil.copy(css_file, css)
+
+    calls = []
+    monkeypatch.setattr(tb_override.os, "geteuid", lambda: 0)
+    monkeypatch.setattr(tb_override.subprocess, "run", lambda cmd, **kw: calls.append(cmd) or subprocess.CompletedProcess(cmd, 0))
+
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#111111"}, None, tmp_path)], minify_css=True)
+
+    source = css.read_text()
+    built = (tmp_path / "custom-theme.min.css").read_text()
+    assert "TB_CUSTOM_THEME_VARS_BEGIN" in source and "--tb-brand:        #111111;" in source
+    assert built_from(built) == source_digest(source)
+    assert "/* " not in built and "--tb-brand:#111111" in built
+    # Declared but used by no rule
+    assert "--tb-accent" in source and "--tb-accent" not in built
+    assert len(built) < len(source) * 0.7
+
+    conf_text = conf.read_text()
+    assert f"alias {tmp_path / 'custom-theme.min.css'};" in conf_text
+    assert conf_text.count("location = /assets/custom-theme.css {") == 1
+    assert calls == [["nginx", "-t"], ["systemctl", "reload", "nginx"]]
+
+    capsys.readouterr()
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#111111"}, None, tmp_path)], minify_css=True)
+    assert "already built from this source (skipped)" in capsys.readouterr().out
+    assert len(calls) == 2
+
+    # A hand edit to the source is picked up by the next build
+    css.write_text(source.replace("#111111", "#222222"))
+    tb_override.update_tb_batch([(conf, css, {}, None, tmp_path)], minify_css=True)
+    assert "--tb-brand:#222222" in (tmp_path / "custom-theme.min.css").read_text()
+    assert build_production_css(css.read_text()) == (tmp_path / "custom-theme.min.css").read_text()
+
+    # Dropping --minify serves the source again, which is a conf change
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#333333"}, None, tmp_path)])
+    assert f"alias {css};" in conf.read_text()
+    assert "min.css" not in conf.read_text()
+    assert calls[-1] == ["systemctl", "reload", "nginx"]
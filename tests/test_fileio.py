@@ -1,4 +1,7 @@
 from pathlib import Path
+
+import pytest
+
 from tb_override import FileIO
 
 css_file = Path("tests/example_css.css")
@@ -7,3 +10,55 @@ conf_file = Path("tests/example_tb_proxy")
 fileio = FileIO(conf_path=conf_file, css_path=css_file)
 
 
+def test_override_css_value_keeps_units_and_hash():
+    text = css_file.read_text(encoding="utf-8")
+
+    block = fileio.override_css_value(
+        old_file=text,
+        css_selectors={"--tb-logo-w": "200", "--tb-topbar-bg": "123456", "--tb-logo-align": "center"},
+    )
+
+    assert "--tb-logo-w:       200px;" in block
+    assert "--tb-topbar-bg:    #123456;" in block
+    assert "--tb-logo-align:   center;" in block
+    # Untouched declarations are reproduced as-is
+    assert "--tb-logo-h:       36px;" in block
+
+
+def test_override_css_value_ignores_commented_declarations():
+    text = (
+        "/* >>> TB_CUSTOM_THEME_VARS_BEGIN */\n"
+        ":root{\n"
+        "  /* --tb-brand: #000000; */\n"
+        "  --tb-brand: #ff7a00;\n"
+        "}\n"
+        "/* <<< TB_CUSTOM_THEME_VARS_END */\n"
+    )
+
+    block = fileio.override_css_value(old_file=text, css_selectors={"--tb-brand": "#00ff00"})
+
+    assert "/* --tb-brand: #000000; */" in block
+    assert "--tb-brand: #00ff00;" in block
+
+
+def test_override_css_value_edits_the_declaration_in_effect():
+    text = (
+        "/* >>> TB_CUSTOM_THEME_VARS_BEGIN */\n"
+        ":root{\n"
+        "  --tb-brand: #000000;\n"
+        "  --tb-brand: #ff7a00;\n"
+        "}\n"
+        "/* <<< TB_CUSTOM_THEME_VARS_END */\n"
+    )
+
+    block = fileio.override_css_value(old_file=text, css_selectors={"--tb-brand": "#00ff00"})
+
+    # The later duplicate is the one the browser uses
+    assert "--tb-brand: #000000;\n  --tb-brand: #00ff00;" in block
+
+
+def test_override_css_value_missing_variable():
+    text = css_file.read_text(encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        fileio.override_css_value(old_file=text, css_selectors={"--tb-missing": "1px"})
@@ -0,0 +1,98 @@
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+import tb_override
+from fleet import apply_fleet, load_inventory, summary_table
+
+css_file = Path("tests/example_css.css")
+conf_file = Path("tb-proxy")
+
+
+def stub(path: Path, body: str) -> str:
+    path.write_text(f"#!/bin/sh\n{body}\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture
+def inventory(tmp_path, monkeypatch):
+    """Three deployments: healthy, failing nginx -t, hanging nginx -t."""
+    monkeypatch.setattr(tb_override.os, "geteuid", lambda: 0)
+    log = tmp_path / "calls.log"
+    ok = stub(tmp_path / "ok.sh", f'echo "$0 $1" >> {log}')
+    bad = stub(tmp_path / "bad.sh", 'echo "emerg: broken" >&2; exit 1')
+    hang = stub(tmp_path / "hang.sh", "exec sleep 5")
+
+    lines = ["[defaults]", f'validate = "{ok} validate"', f'reload = "{ok} reload"', "timeout = 1", ""]
+    for name, validate in (("good", None), ("broken", bad), ("hung", hang)):
+        root = tmp_path / name
+        root.mkdir()
+        shutil.copy(conf_file, root / "tb-proxy")
+        shutil.copy(css_file, root / "custom-theme.css")
+        lines += ["[[targets]]", f'name = "{name}"', f'conf = "{root / "tb-proxy"}"', f'assets = "{root}"']
+        if validate:
+            lines.append(f'validate = "{validate}"')
+        lines.append("")
+
+    inv = tmp_path / "fleet.toml"
+    inv.write_text("\n".join(lines))
+    return inv, log
+
+
+def test_fleet_applies_concurrently_with_per_target_results(inventory, tmp_path, capsys):
+    inv, log = inventory
+    targets = load_inventory(inv)
+    assert [t.name for t in targets] == ["good", "broken", "hung"]
+    assert targets[0].css_path == tmp_path / "good" / "custom-theme.css"
+
+    logo = tmp_path / "logo.svg"
+    logo.write_text("<svg/>")
+    profile = {"variables": {"--tb-brand": "#111111"}, "logo": logo}
+
+    results = apply_fleet(targets, profile, workers=3)
+    assert [r.status for r in results] == ["ok", "failed", "timeout"]
+    assert results[1].detail == "emerg: broken"
+    # Each target's output is captured on its own
+    assert "Rolled back" not in results[0].log and "Rolled back" in results[1].log
+    assert str(tmp_path / "hung") in results[2].log and str(tmp_path / "good") not in results[2].log
+
+    # Only the healthy target keeps its changes and reloads
+    assert "--tb-brand:        #111111;" in (tmp_path / "good" / "custom-theme.css").read_text()
+    for name in ("broken", "hung"):
+        assert (tmp_path / name / "custom-theme.css").read_text() == css_file.read_text()
+        assert (tmp_path / name / "tb-proxy").read_text() == conf_file.read_text()
+    assert log.read_text().split() == [str(tmp_path / "ok.sh"), "validate", str(tmp_path / "ok.sh"), "reload"]
+
+    assert "Overriding:" not in capsys.readouterr().out and "Overriding:" in results[0].log
+
+    table = summary_table(results)
+    assert "1/3 target(s) applied, 2 failed" in table
+
+
+def test_inventory_requires_conf_and_assets(tmp_path):
+    inv = tmp_path / "fleet.json"
+    inv.write_text('{"targets": [{"name": "x", "conf": "/tmp/tb-proxy"}]}')
+    with pytest.raises(ValueError):
+        load_inventory(inv)
+
+
+def test_stuck_worker_is_terminated_and_reported_as_timeout(inventory, tmp_path, monkeypatch):
+    import fleet
+
+    inv, log = inventory
+    targets = [t._replace(timeout=0.1) for t in load_inventory(inv)][:1]
+
+    def stuck(*args):
+        time.sleep(60)
+
+    monkeypatch.setattr(fleet, "_apply_target", stuck)
+    monkeypatch.setattr(fleet, "STALL_GRACE", 0.2)
+
+    t0 = time.perf_counter()
+    [result] = apply_fleet(targets, {"variables": {}, "logo": None})
+    assert time.perf_counter() - t0 < 5
+    assert result.status == "timeout" and result.detail == "apply exceeded 0.1s, worker terminated"
+    assert "0/1 target(s) applied, 1 failed" in summary_table([result])
@@ -0,0 +1,107 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import tb_override
+from fonts import FontFace, FontPipeline, font_face_rules, parse_unicode_ranges
+
+css_file = Path("tests/example_css.css")
+conf_file = Path("tb-proxy")
+
+
+def make_font(path: Path) -> Path:
+    """A tiny TrueType font with a Latin and a CJK glyph, or stand-in bytes without fontTools."""
+    try:
+        from fontTools.fontBuilder import FontBuilder
+        from fontTools.pens.ttGlyphPen import TTGlyphPen
+    except ImportError:
+        path.write_bytes(b"\0\1\0\0 not a real font")
+        return path
+
+    def triangle():
+        pen = TTGlyphPen(None)
+        pen.moveTo((0, 0))
+        pen.lineTo((0, 500))
+        pen.lineTo((500, 0))
+        pen.closePath()
+        return pen.glyph()
+
+    glyphs = [".notdef", "A", "uni4E00"]
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(glyphs)
+    fb.setupCharacterMap({0x41: "A", 0x4E00: "uni4E00"})
+    fb.setupGlyf({g: triangle() for g in glyphs})
+    fb.setupHorizontalMetrics({g: (600, 0) for g in glyphs})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable({"familyName": "Acme Sans", "styleName": "Regular"})
+    fb.setupOS2()
+    fb.setupPost()
+    fb.save(str(path))
+    return path
+
+
+def test_unicode_ranges_and_font_face_rules():
+    assert parse_unicode_ranges("U+0000-00FF, U+0131,") == [(0, 0xFF), (0x131, 0x131)]
+    with pytest.raises(ValueError):
+        parse_unicode_ranges("U+00FF-0000")
+
+    css = font_face_rules("Acme Sans", [
+        FontFace("/assets/fonts/acme-sans-400-normal.0123456789ab.woff2", unicode_range="U+0000-00FF,U+0131"),
+        FontFace("/assets/fonts/acme-sans-700-italic.0123456789ab.ttf", "700", "italic"),
+    ])
+    assert css.count("@font-face{") == 2
+    assert css.count("font-display: swap;") == 2
+    assert 'format("woff2");\n  unicode-range: U+0000-00FF, U+0131;' in css
+    assert 'format("truetype");\n}' in css
+
+
+def test_subset_to_configured_ranges_is_cached(tmp_path):
+    pytest.importorskip("fontTools")
+    from fontTools.ttLib import TTFont
+
+    src = make_font(tmp_path / "AcmeSans-Regular.ttf")
+    pipeline = FontPipeline(tmp_path / "cache", "U+0041")
+
+    out = pipeline.build(src)
+    assert out.suffix in (".woff2", ".woff")
+    assert set(TTFont(str(out)).getBestCmap()) == {0x41}
+    assert pipeline.build(src) == out
+
+
+def test_brand_font_is_served_with_long_caching(tmp_path, monkeypatch):
+    conf = tmp_path / "tb-proxy"
+    css = tmp_path / "custom-theme.css"
+    shutil.copy(conf_file, conf)
+    shutil.copy(css_file, css)
+    font = make_font(tmp_path / "AcmeSans-Regular.ttf")
+
+    calls = []
+    monkeypatch.setattr(tb_override.os, "geteuid", lambda: 0)
+    monkeypatch.setattr(tb_override.subprocess, "run", lambda cmd, **kw: calls.append(cmd) or subprocess.CompletedProcess(cmd, 0))
+
+    fonts = {"family": "Acme Sans", "faces": [(font, "400", "normal")]}
+    profile = tb_override.BrandProfile(conf, css, {}, None, tmp_path, None, fonts)
+    tb_override.update_tb_batch([profile])
+
+    installed = [p.name for p in (tmp_path / "fonts").iterdir()]
+    assert len(installed) == 1 and installed[0].startswith("acme-sans-400-normal.")
+
+    text = css.read_text()
+    assert '--tb-font-family:  "Acme Sans", Roboto, "Helvetica Neue", sans-serif;' in text
+    assert f'src: url("/assets/fonts/{installed[0]}")' in text
+    assert "font-display: swap;" in text
+    # The rules go between the vars block and the theme rules
+    assert text.index("TB_CUSTOM_THEME_VARS_END") < text.index("@font-face") < text.index("TB_CUSTOM_THEME_RULES_BEGIN")
+
+    conf_text = conf.read_text()
+    assert "location ^~ /assets/fonts/ {" in conf_text
+    assert 'add_header Cache-Control "public, max-age=31536000, immutable";' in conf_text
+    assert calls == [["nginx", "-t"], ["systemctl", "reload", "nginx"]]
+
+    # Unchanged font: nothing to write, nothing to reload
+    tb_override.update_tb_batch([profile])
+    assert css.read_text() == text
+    assert conf.read_text() == conf_text
+    assert len(calls) == 2
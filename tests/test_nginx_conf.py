@@ -0,0 +1,89 @@
+from pathlib import Path
+
+import pytest
+
+from nginx_conf import NginxConf, parse
+
+LOGO = (
+    "    location = /assets/logo.svg {\n"
+    "        alias /opt/custom_assets/logo.svg;\n"
+    "    }\n"
+)
+
+
+def make_conf(servers: int) -> str:
+    return "".join(
+        f"server {{\n"
+        f"    listen {8000 + i};\n"
+        f"    server_name site{i}.example.com; # tenant {i}\n"
+        f"    # $MAIN_LOGO_{i}$\n"
+        f"    location / {{\n"
+        f"        proxy_pass http://localhost:8081/;\n"
+        f"        sub_filter '</head>' '<link href=\"/a.css\"></head>';\n"
+        f"    }}\n"
+        f"}}\n"
+        for i in range(servers)
+    )
+
+
+def test_roundtrip_is_byte_for_byte():
+    for text in (Path("tb-proxy").read_text(), Path("tests/example_tb_proxy").read_text(), make_conf(300)):
+        assert NginxConf(text).render() == text
+
+
+def test_upsert_inserts_then_updates_in_place():
+    text = make_conf(300)
+    conf = NginxConf(text)
+    assert len(conf.servers) == 300
+
+    assert conf.upsert_location(LOGO, "$MAIN_LOGO_250$")
+    inserted = conf.render()
+    assert inserted.count("location = /assets/logo.svg") == 1
+    assert inserted.replace(LOGO, "", 1) == text
+
+    # Same block again is a no-op, a changed block replaces the old one
+    conf = NginxConf(inserted)
+    assert not conf.upsert_location(LOGO, "$MAIN_LOGO_250$")
+    assert conf.upsert_location(LOGO.replace("logo.svg;", "logo2.svg;"), "$MAIN_LOGO_250$")
+    updated = conf.render()
+    assert "alias /opt/custom_assets/logo2.svg;" in updated
+    assert updated.count("location = /assets/logo.svg") == 1
+
+
+def test_batched_upserts_and_removal():
+    conf = NginxConf(make_conf(3))
+    conf.upsert_location(LOGO, "$MAIN_LOGO_0$")
+    conf.upsert_location(LOGO, "$MAIN_LOGO_2$")
+    conf.remove_location("/", server=1)
+    text = conf.render()
+
+    assert text.count("location = /assets/logo.svg") == 2
+    assert text.count("location / {") == 2
+    assert len(parse(text).children) == 3
+
+
+def test_unbalanced_braces():
+    with pytest.raises(ValueError):
+        NginxConf("server {\n    location / {\n}\n")
+
+
+def test_upsert_directive_in_location_inserted_this_session():
+    conf = NginxConf(make_conf(2))
+    snippet = (
+        "    location ^~ /assets/bundles/ {\n"
+        "        alias /opt/custom_assets/bundles/;\n"
+        "    }\n"
+    )
+    assert conf.upsert_location(snippet, "# $MAIN_LOGO_1$")
+    assert conf.upsert_directive("^~ /assets/bundles/", "expires", [], "expires max;", "# $MAIN_LOGO_1$")
+    assert not conf.upsert_directive("^~ /assets/bundles/", "expires", [], "expires max;", "# $MAIN_LOGO_1$")
+
+    # Rewriting the location later in the session keeps working too
+    assert conf.upsert_location(snippet.replace("bundles/;", "bundles-v2/;"), "# $MAIN_LOGO_1$")
+    assert conf.upsert_directive("^~ /assets/bundles/", "expires", [], "expires 1y;", "# $MAIN_LOGO_1$")
+
+    text = conf.render()
+    assert text.count("location ^~ /assets/bundles/ {") == 1
+    assert "        alias /opt/custom_assets/bundles-v2/;\n        expires 1y;\n    }" in text
+    server0 = text[:text.index("server {", 1)]
+    assert "/assets/bundles/" not in server0
@@ -0,0 +1,116 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+import page_load
+from page_load import ProxyRules, _cache_policy, compare
+
+CONF = """
+server {
+    listen 80;
+    server_name tb.example.com;
+    add_header X-Frame-Options "SAMEORIGIN";
+
+    location / {
+        proxy_pass http://127.0.0.1:8080;
+    }
+    location ^~ /assets/ {
+        alias /opt/custom_assets/;
+    }
+    location ^~ /assets/tbov/ {
+        alias /opt/custom_assets/tbov/;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+    location = /assets/logo_title_white.svg {
+        alias /opt/custom_assets/logo_title_white.svg;
+        etag off;
+    }
+    location ~ \\.js$ {
+        proxy_pass http://127.0.0.1:8080;
+    }
+}
+"""
+
+
+def test_exact_match_beats_longest_prefix():
+    rules = ProxyRules(CONF, "tb.example.com")
+
+    exact = rules.match("/assets/logo_title_white.svg")
+    assert exact.modifier == "=" and not exact.etag
+    assert rules.file_for(exact, "/assets/logo_title_white.svg") == Path("/opt/custom_assets/logo_title_white.svg")
+
+    # Longest prefix wins, whatever the order in the file
+    hashed = rules.match("/assets/tbov/custom-theme.0123456789.css")
+    assert hashed.path == "/assets/tbov/"
+    assert hashed.headers == [("Cache-Control", "public, max-age=31536000, immutable")]
+    assert rules.match("/assets/custom-theme.css").path == "/assets/"
+    assert rules.match("/assets/logo_title_white.svg.gz").path == "/assets/"
+    assert rules.match("/login").proxied
+
+    # Regex locations are not simulated
+    assert all(l.modifier != "~" for l in rules.locations)
+    assert rules.server_headers == [("X-Frame-Options", "SAMEORIGIN")]
+
+
+def test_no_matching_location():
+    rules = ProxyRules("server {\n    location ^~ /assets/ {\n        alias /srv/;\n    }\n}\n")
+    assert rules.match("/index.html") is None
+
+
+def test_cache_policy_classification():
+    # Fresh for max-age, stored but revalidated, or not stored at all
+    assert _cache_policy("public, max-age=31536000, immutable", None) == 31536000.0
+    assert _cache_policy('max-age="60"', None) == 60.0
+    assert _cache_policy("no-cache", '"abc"') == 0.0
+    assert _cache_policy("no-store", '"abc"') is None
+    assert _cache_policy("no-store, max-age=60", None) is None
+    assert _cache_policy("max-age=soon", None) == 0.0
+
+    # Without freshness, only an ETag makes the response worth keeping
+    assert _cache_policy(None, '"abc"') == 0.0
+    assert _cache_policy(None, None) is None
+    assert _cache_policy("public", None) is None
+
+
+def _report(requests, bytes_, cache_hits):
+    load = {"requests": requests, "bytes": bytes_, "cache_hits": cache_hits, "revalidated": 0, "not_found": 0}
+    return {"cold": dict(load), "warm": dict(load)}
+
+
+def test_compare_flags_growth_beyond_threshold_and_lost_cache_hits():
+    baseline = _report(10, 1000, 5)
+
+    assert compare(_report(11, 1100, 5), baseline, 0.1) == []
+    assert compare(_report(9, 500, 6), baseline, 0.1) == []
+
+    regressions = compare(_report(12, 1101, 4), baseline, 0.1)
+    assert regressions == [
+        "cold requests: 10 -> 12", "cold bytes: 1000 -> 1101", "cold cache_hits: 5 -> 4",
+        "warm requests: 10 -> 12", "warm bytes: 1000 -> 1101", "warm cache_hits: 5 -> 4",
+    ]
+
+    # Any growth from zero is a regression, loads missing from the baseline are skipped
+    zero = _report(0, 0, 0)
+    del zero["warm"]
+    assert compare(_report(1, 0, 0), zero, 0.1) == ["cold requests: 0 -> 1"]
+
+
+def test_before_after_applies_fonts_and_images(tmp_path, monkeypatch):
+    conf = tmp_path / "tb-proxy"
+    conf.write_text(CONF)
+    css = tmp_path / "custom-theme.css"
+    css.write_text(":root {}\n")
+    profile = tmp_path / "brand.toml"
+    profile.write_text('[images]\n"--tb-login-bg-image" = "/srv/brand/login-bg.jpg"\n\n'
+                       '[fonts]\nfamily = "Acme Sans"\n\n[[fonts.faces]]\nfile = "/srv/brand/AcmeSans.ttf"\n')
+
+    applied = []
+    monkeypatch.setattr(page_load, "update_tb_batch", lambda profiles, **kwargs: applied.extend(profiles))
+    monkeypatch.setattr(page_load, "simulate", lambda *args: {})
+
+    page_load.before_after(conf, tmp_path / "assets", profile, css)
+
+    [brand] = applied
+    assert brand.fonts["family"] == "Acme Sans"
+    assert brand.images == {"--tb-login-bg-image": Path("/srv/brand/login-bg.jpg")}
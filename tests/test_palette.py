@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from palette import PaletteSet, contrast_ratio, derive_palette, parse_hex, to_hex
+from variables import validate_overrides
+
+
+def test_hex_round_trip_and_contrast():
+    rgb = parse_hex(["#fff", "#000000", "#FF7A00cc"])
+    assert to_hex(rgb) == ["#ffffff", "#000000", "#ff7a00"]
+    assert contrast_ratio(rgb[:1], rgb[1:2])[0] == pytest.approx(21.0)
+
+    with pytest.raises(ValueError, match="row 1"):
+        parse_hex(["#123456", "#12345g"])
+
+
+def test_single_palette_matches_stock_theme_shape():
+    palette = derive_palette("#ff7a00")
+    assert palette["--tb-hover-bg"] == "rgba(255,122,0,.12)"
+    assert palette["--tb-selected-bg"] == "rgba(255,122,0,.18)"
+    assert palette["--tb-text"] == "#e5e7eb"
+    assert palette["--tb-text-invert"] == "#0b0f16"
+
+    normalised, errors = validate_overrides(palette)
+    assert errors == []
+
+
+def test_many_tenants_meet_wcag():
+    rng = np.random.default_rng(0)
+    brands = to_hex(rng.random((2000, 3)))
+    backgrounds = to_hex(rng.random((2000, 3)))
+    palettes = PaletteSet(brands, backgrounds)
+
+    assert palettes.failing() == {}
+    for pair in ("text/main-bg", "text/card-bg", "text-invert/brand", "text-muted/main-bg"):
+        assert (palettes.contrast()[pair] >= 4.5).all()
+    assert len(palettes.overrides()) == 2000
@@ -0,0 +1,34 @@
+import gzip
+
+from precompress import precompress
+
+
+def test_precompress_only_when_source_changes(tmp_path):
+    css = tmp_path / "custom-theme.css"
+    css.write_text(":root{--tb-brand:#ff7a00;}")
+
+    written = precompress(css)
+    gz = tmp_path / "custom-theme.css.gz"
+    assert gz in written
+    assert gzip.decompress(gz.read_bytes()) == css.read_bytes()
+
+    # Unchanged source: nothing regenerated
+    assert precompress(css) == []
+
+    css.write_text(":root{--tb-brand:#000000;}")
+    assert gz in precompress(css)
+    assert gzip.decompress(gz.read_bytes()) == css.read_bytes()
+
+
+def test_concurrent_precompress_writes_whole_variants(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    css = tmp_path / "custom-theme.css"
+    css.write_text(":root{--tb-brand:#ff7a00;}" * 2000)
+
+    # Each writer has its own temp file, none can rename another's away
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: precompress(css), range(16)))
+
+    assert gzip.decompress((tmp_path / "custom-theme.css.gz").read_bytes()) == css.read_bytes()
+    assert not list(tmp_path.glob("*.tmp")) and not list(tmp_path.glob(".*.tmp"))
@@ -0,0 +1,120 @@
+import shutil
+import subprocess
+import time
+import zlib
+from pathlib import Path
+
+import pytest
+
+import tb_override
+from revisions import RevisionStore
+
+css_file = Path("tests/example_css.css")
+conf_file = Path("tb-proxy")
+
+
+def test_store_dedups_and_delta_compresses(tmp_path):
+    store = RevisionStore(tmp_path / "store", keep_plain=1)
+    css = tmp_path / "custom-theme.css"
+    big = "".join(f"  --tb-var-{i}: #{i:06x};\n" for i in range(1000))
+    css.write_text(big)
+
+    first = store.record([css])
+    assert store.record([css]) is None  # unchanged, no revision
+
+    css.write_text(big.replace("--tb-var-999: #0003e7", "--tb-var-999: #123456"))
+    second = store.record([css])
+    assert [r["id"] for r in store.history()] == [first, second]
+
+    # The second version is stored as a small delta against the first
+    digest = store.get(second)["files"][str(css.resolve())]
+    base, depth, payload = store._read_object(digest)
+    assert base == store.get(first)["files"][str(css.resolve())] and depth == 1
+    assert len(payload) < len(zlib.compress(big.encode())) / 10
+
+    # The first revision lost its plain copy but still checks out
+    assert store.checkout(first) == [css.resolve()]
+    assert css.read_text() == big
+
+
+def test_gc_by_count_and_age(tmp_path):
+    store = RevisionStore(tmp_path / "store")
+    css = tmp_path / "custom-theme.css"
+    logo = tmp_path / "logo.png"
+    for i in range(5):
+        css.write_text(f":root{{--tb-brand:#00000{i};}}")
+        logo.write_bytes(b"\x89PNG\0" + bytes([i]))
+        store.record([css, logo])
+
+    # Binary objects are stored whole and go with their revisions; text
+    # objects of dropped revisions stay while a kept delta builds on them
+    assert store.gc(keep=3, max_age_days=None) == (2, 2)
+    assert [r["id"] for r in store.history()] == ["rev-000003", "rev-000004", "rev-000005"]
+    assert len(list(store.plain.iterdir())) == 6
+    store.checkout("rev-000003")
+    assert css.read_text() == ":root{--tb-brand:#000002;}"
+    assert logo.read_bytes() == b"\x89PNG\0\x02"
+
+    # Everything is expired, the latest revision still survives
+    time.sleep(0.01)
+    assert store.gc(keep=10, max_age_days=0)[0] == 2
+    assert [r["id"] for r in store.history()] == ["rev-000005"]
+
+
+def test_apply_records_and_rollback_reloads_once(tmp_path, monkeypatch):
+    conf = tmp_path / "tb-proxy"
+    css = tmp_path / "custom-theme.css"
+    shutil.copy(conf_file, conf)
+    shutil.copy(css_file, css)
+    logo = tmp_path / "logo.svg"
+    logo.write_text("<svg/>")
+
+    calls = []
+    monkeypatch.setattr(tb_override.os, "geteuid", lambda: 0)
+    monkeypatch.setattr(tb_override.subprocess, "run",
+                        lambda cmd, **kw: calls.append(cmd) or subprocess.CompletedProcess(cmd, 0, "", ""))
+
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#111111"}, logo, tmp_path)])
+    applied_conf = conf.read_text()
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#222222"}, None, tmp_path)])
+    assert "--tb-brand:        #222222;" in css.read_text()
+
+    calls.clear()
+    assert tb_override.rollback_revision(conf, tmp_path) == "rev-000001"
+    assert "--tb-brand:        #111111;" in css.read_text()
+    assert conf.read_text() == applied_conf
+    # Only the CSS changed, served via alias, so no reload was needed
+    assert calls == []
+
+    # Rolling back past the logo changes the conf: validated and reloaded once
+    (tmp_path / "logo_title_white.svg").unlink()
+    conf.write_text(conf_file.read_text())
+    store = RevisionStore(tmp_path / ".revisions")
+    rev = store.record([conf], message="manual edit")
+    tb_override.rollback_revision(conf, tmp_path, "rev-000001")
+    assert conf.read_text() == applied_conf
+    assert (tmp_path / "logo_title_white.svg").is_file()
+    assert calls == [["nginx", "-t"], ["systemctl", "reload", "nginx"]]
+    assert rev in [r["id"] for r in store.history()]
+
+
+def test_rollback_restores_live_files_when_validation_fails(tmp_path, monkeypatch):
+    conf = tmp_path / "tb-proxy"
+    css = tmp_path / "custom-theme.css"
+    shutil.copy(conf_file, conf)
+    shutil.copy(css_file, css)
+    store = RevisionStore(tmp_path / ".revisions")
+    store.record([conf, css])
+
+    conf.write_text(conf_file.read_text().replace("listen 8080", "listen 9090"))
+    live = conf.read_text()
+
+    def failing_run(cmd, **kwargs):
+        raise subprocess.CalledProcessError(1, cmd, "", "emerg")
+
+    monkeypatch.setattr(tb_override.os, "geteuid", lambda: 0)
+    monkeypatch.setattr(tb_override.subprocess, "run", failing_run)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        tb_override.rollback_revision(conf, tmp_path, "rev-000001")
+    assert conf.read_text() == live
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+# Cold import of the headless path must stay under this many seconds
+IMPORT_BUDGET = 0.5
+
+PROBE = """
+import sys, time
+t0 = time.perf_counter()
+import main
+elapsed = time.perf_counter() - t0
+heavy = [m for m in ("questionary", "rich", "selection", "PIL", "cairosvg") if m in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+
+def test_headless_import_is_lazy_and_fast():
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, check=True
+    ).stdout.split()
+
+    elapsed = float(out[0])
+    heavy = out[1] if len(out) > 1 else ""
+
+    assert heavy == "", f"TUI/imaging modules imported eagerly: {heavy}"
+    assert elapsed < IMPORT_BUDGET, f"headless import took {elapsed:.3f}s"
@@ -0,0 +1,467 @@
+import gzip
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import tb_override
+from changes import ChangeTracker
+from precompress import precompress
+from revisions import RevisionStore
+
+css_file = Path("tests/example_css.css")
+conf_file = Path("tb-proxy")
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    """Copy the example files into tmp_path and fake root + nginx."""
+    conf = tmp_path / "tb-proxy"
+    css = tmp_path / "custom-theme.css"
+    shutil.copy(conf_file, conf)
+    shutil.copy(css_file, css)
+
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+    monkeypatch.setattr(tb_override.os, "geteuid", lambda: 0)
+    monkeypatch.setattr(tb_override.subprocess, "run", fake_run)
+    return conf, css, calls
+
+
+def test_update_tb_batch_reloads_once(site, tmp_path):
+    conf, css, calls = site
+    css2 = tmp_path / "custom-theme-2.css"
+    shutil.copy(css_file, css2)
+    logo = tmp_path / "logo.svg"
+    logo.write_text("<svg/>")
+
+    tb_override.update_tb_batch([
+        (conf, css, {"--tb-brand": "#111111"}, logo, tmp_path),
+        (conf, css2, {"--tb-brand": "#222222"}, logo, tmp_path),
+    ])
+
+    assert "--tb-brand:        #111111;" in css.read_text()
+    assert "--tb-brand:        #222222;" in css2.read_text()
+    assert conf.read_text().count("location = /assets/logo_title_white.svg") == 1
+    assert calls == [["nginx", "-t"], ["systemctl", "reload", "nginx"]]
+
+
+def test_update_tb_batch_css_only_skips_reload(site, tmp_path):
+    conf, css, calls = site
+    conf_before = conf.read_bytes()
+
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#111111"}, None, tmp_path)])
+
+    assert "--tb-brand:        #111111;" in css.read_text()
+    assert conf.read_bytes() == conf_before
+    assert calls == []
+
+
+def test_update_tb_batch_rolls_back_on_failed_validation(site, monkeypatch, tmp_path):
+    conf, css, calls = site
+    original = css.read_text()
+    original_conf = conf.read_text()
+    live_logo = tmp_path / "logo_title_white.svg"
+    live_logo.write_text("<svg>old</svg>")
+    logo = tmp_path / "logo.svg"
+    logo.write_text("<svg/>")
+
+    def failing_run(cmd, **kwargs):
+        calls.append(cmd)
+        raise subprocess.CalledProcessError(1, cmd, "", "emerg")
+
+    monkeypatch.setattr(tb_override.subprocess, "run", failing_run)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#111111"}, logo, tmp_path)])
+
+    assert css.read_text() == original
+    assert conf.read_text() == original_conf
+    # The logo is staged with the CSS and conf, so it is rolled back with them
+    assert live_logo.read_text() == "<svg>old</svg>"
+    assert ["systemctl", "reload", "nginx"] not in calls
+
+
+def test_served_css_is_swapped_in_with_fresh_variants(site, monkeypatch, tmp_path):
+    conf, css, calls = site
+    gz = tmp_path / "custom-theme.css.gz"
+    precompress(css)
+    old_inode = css.stat().st_ino
+    old_gz = gz.read_bytes()
+
+    with css.open() as served:
+        tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#111111"}, None, tmp_path)])
+        # The file nginx already holds open is left intact, the new one replaces it
+        assert "#111111" not in served.read()
+    assert css.stat().st_ino != old_inode
+    assert gzip.decompress(gz.read_bytes()) == css.read_bytes()
+    assert not list(tmp_path.glob("*.tmp"))
+
+    # A failed apply restores the variants together with the CSS
+    before, before_gz = css.read_bytes(), gz.read_bytes()
+    assert before_gz != old_gz
+    logo = tmp_path / "logo.svg"
+    logo.write_text("<svg/>")
+    monkeypatch.setattr(tb_override.subprocess, "run",
+                        lambda cmd, **kw: (_ for _ in ()).throw(subprocess.CalledProcessError(1, cmd, "", "emerg")))
+    with pytest.raises(subprocess.CalledProcessError):
+        tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#222222"}, logo, tmp_path)])
+    assert css.read_bytes() == before and gz.read_bytes() == before_gz
+
+
+def test_flatten_vars_serves_resolved_copy(site, tmp_path, capsys):
+    conf, css, calls = site
+    css.write_text(css.read_text().replace("--tb-accent:       #22c55e;", "--tb-accent:       var(--tb-brand);"))
+
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#111111"}, None, tmp_path)], flatten_vars=True)
+
+    flat = (tmp_path / "custom-theme.flat.css").read_text()
+    assert "--tb-accent:       #111111;" in flat
+    assert "--tb-accent:       var(--tb-brand);" in css.read_text()
+    assert f"alias {tmp_path / 'custom-theme.flat.css'};" in conf.read_text()
+    assert calls == [["nginx", "-t"], ["systemctl", "reload", "nginx"]]
+    # Only the override itself is logged, flattening is silent
+    assert capsys.readouterr().out.count("Overriding:") == 1
+
+    # Without the flag the source is served again
+    tb_override.update_tb_batch([(conf, css, {}, None, tmp_path)])
+    assert f"alias {css};" in conf.read_text() and "flat.css" not in conf.read_text()
+
+
+def test_flatten_vars_reaches_fingerprinted_and_minified_css(site, tmp_path):
+    conf, css, calls = site
+    css.write_text(css.read_text().replace("--tb-text:         #e5e7eb;", "--tb-text:         var(--tb-brand);"))
+    conf.write_text(conf.read_text().replace(
+        "proxy_pass http://localhost:8081/;",
+        """proxy_pass http://localhost:8081/;\n        sub_filter '</head>' '<link rel="stylesheet" href="/assets/custom-theme.css"></head>';""",
+    ))
+
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#111111"}, None, tmp_path)],
+                                fingerprint=True, flatten_vars=True)
+    hashed = next((tmp_path / "tbov").glob("custom-theme.*.css"))
+    assert f"/assets/tbov/{hashed.name}" in conf.read_text()
+    assert "--tb-text:         #111111;" in hashed.read_text()
+
+    # Same source, flag toggled: the production build is redone both ways
+    minified = tmp_path / "custom-theme.min.css"
+    tb_override.update_tb_batch([(conf, css, {}, None, tmp_path)], minify_css=True)
+    assert "--tb-text:var(--tb-brand)" in minified.read_text()
+    tb_override.update_tb_batch([(conf, css, {}, None, tmp_path)], minify_css=True, flatten_vars=True)
+    assert "--tb-text:#111111" in minified.read_text()
+    tb_override.update_tb_batch([(conf, css, {}, None, tmp_path)], minify_css=True)
+    assert "--tb-text:var(--tb-brand)" in minified.read_text()
+
+
+def test_override_bundle_serves_hashed_copy_with_immutable_caching(tmp_path):
+    conf = tmp_path / "tb-proxy"
+    shutil.copy(conf_file, conf)
+    bundle = tmp_path / "ui" / "main.abc123.js"
+    bundle.parent.mkdir()
+    bundle.write_bytes(b'title:"ThingsBoard",c:"#305680";')
+
+    tbov = tb_override.TBOverride(conf, tmp_path / "custom-theme.css", assets_dir=tmp_path)
+    with tbov.fileio.edit_conf():
+        hits = tbov.override_bundle(bundle, {"ThingsBoard": "Acme"})
+    assert hits == {"ThingsBoard": 1}
+
+    served = list((tmp_path / "bundles").iterdir())
+    assert len(served) == 1 and served[0].name.startswith("main.abc123.") and served[0].name != bundle.name
+    assert served[0].read_bytes() == b'title:"Acme",c:"#305680";'
+    # The original bundle is left alone
+    assert bundle.read_bytes().startswith(b'title:"ThingsBoard"')
+
+    text = conf.read_text()
+    assert "location ^~ /assets/bundles/ {" in text
+    assert f"alias {tmp_path / 'bundles'}/;" in text
+    assert 'add_header Cache-Control "public, max-age=31536000, immutable";' in text
+    assert f"""sub_filter '"main.abc123.js"' '"/assets/bundles/{served[0].name}"';""" in text
+    assert 'proxy_set_header Accept-Encoding "";' in text
+
+    # New replacements, new name: the reference moves, nothing is rewritten under an old URL
+    with tbov.fileio.edit_conf():
+        tbov.override_bundle(bundle, {"ThingsBoard": "Acme Corp"})
+    newest = next(p for p in (tmp_path / "bundles").iterdir() if p != served[0])
+    assert served[0].read_bytes() == b'title:"Acme",c:"#305680";'
+    assert conf.read_text().count("sub_filter '\"main.abc123.js\"'") == 1
+    assert f'"/assets/bundles/{newest.name}"' in conf.read_text()
+
+
+def test_profile_bundles_are_staged_and_stale_copies_pruned(site, tmp_path, monkeypatch):
+    from profile_loader import load_profile
+
+    conf, css, calls = site
+    bundle = tmp_path / "ui" / "main.abc123.js"
+    bundle.parent.mkdir()
+    bundle.write_bytes(b'title:"ThingsBoard";')
+    profile_path = tmp_path / "brand.toml"
+
+    def apply(name):
+        profile_path.write_text(f'[[bundles]]\nfile = "{bundle}"\n\n[bundles.replace]\n"ThingsBoard" = "{name}"\n')
+        profile = load_profile(profile_path)
+        tb_override.update_tb_batch([tb_override.BrandProfile(conf, css, {}, None, tmp_path, bundles=profile["bundles"])])
+        return [p for p in (tmp_path / "bundles").iterdir() if p.suffix == ".js"]
+
+    [first] = apply("Acme")
+    assert first.read_bytes() == b'title:"Acme";'
+    assert f'"/assets/bundles/{first.name}"' in conf.read_text()
+
+    # A failed check leaves no copy behind
+    def failing_run(cmd, **kwargs):
+        raise subprocess.CalledProcessError(1, cmd, "", "nginx: [emerg] unknown directive")
+
+    monkeypatch.setattr(tb_override.subprocess, "run", failing_run)
+    with pytest.raises(subprocess.CalledProcessError):
+        apply("Broken")
+    assert [p for p in (tmp_path / "bundles").iterdir() if p.suffix == ".js"] == [first]
+
+    # The old copy is still referenced by a recorded revision, so only unreferenced ones go
+    monkeypatch.setattr(tb_override.subprocess, "run", lambda cmd, **kw: subprocess.CompletedProcess(cmd, 0, "", ""))
+    second = next(p for p in apply("Acme Corp") if p != first)
+    assert f'"/assets/bundles/{second.name}"' in conf.read_text()
+    stray = tmp_path / "bundles" / "main.abc123.0000000000.js"
+    stray.write_bytes(b"unreferenced")
+    apply("Acme Corp")
+    assert not stray.exists() and first.exists() and second.exists()
+
+
+def test_update_tb_rejects_invalid_values_before_writing(site):
+    conf, css, calls = site
+    original = css.read_text()
+
+    with pytest.raises(ValueError, match="--tb-logo-align"):
+        tb_override.update_tb(conf, css, {"--tb-brand": "#111111", "--tb-logo-align": "sideways"})
+    assert css.read_text() == original
+
+
+def test_menu_skips_cancelled_input_and_resets_to_the_default(tmp_path):
+    from main import Menu
+
+    class Answers:
+        def __init__(self):
+            self.menus = iter(["Edit Theme Variables", "Edit Theme Variables", "Exit"])
+            self.actions = iter(["Set new value", "Back", "Reset to default", "Back"])
+
+            self.vars = iter([{"--tb-brand": {"type": "hex", "default": "#ff7a00"}},
+                              {"--tb-logo-align": {"type": "enum", "default": "left"}}])
+
+        select_menu = lambda self: next(self.menus)
+        select_category = lambda self: "layout"
+        select_var = lambda self, category: next(self.vars)
+        select_action = lambda self: next(self.actions)
+        enter_input = lambda self, var: None
+
+    menu = Menu.__new__(Menu)
+    menu.s = Answers()
+    # The cancelled --tb-brand prompt stores nothing
+    assert menu.prompt() == {"--tb-logo-align": "left"}
+
+
+def test_conf_comment_edits_do_not_need_reload(tmp_path):
+    conf = tmp_path / "tb-proxy"
+    conf.write_text('server {\n    listen 80; # http\n    add_header X-A "a # b";\n}\n')
+    tracker = ChangeTracker(conf_paths=[conf])
+
+    conf.write_text('server {\n    # edited comment\n    listen   80;\n    add_header X-A "a # b";\n}\n')
+    changes = tracker.classify()
+
+    assert changes.changed_files == [conf]
+    assert not changes.needs_reload
+
+
+def test_fingerprint_assets_rewrites_stylesheet_link(tmp_path):
+    conf = tmp_path / "tb-proxy"
+    css = tmp_path / "custom-theme.css"
+    shutil.copy("tests/example_tb_proxy", conf)
+    shutil.copy(css_file, css)
+    (tmp_path / "logo_title_white.svg").write_text("<svg/>")
+
+    tbov = tb_override.TBOverride(conf, css)
+    tbov.CUSTOM_ASSETS = tmp_path
+    tbov.FINGERPRINT = True
+    tbov.fingerprint_assets()
+
+    hashed = sorted(p.name for p in (tmp_path / "tbov").iterdir())
+    assert len(hashed) == 2
+    css_name = next(n for n in hashed if n.endswith(".css"))
+
+    text = conf.read_text()
+    assert f'href="/assets/tbov/{css_name}"' in text
+    assert "?v=11" not in text
+    # The plain CSS location is not mistaken for the link
+    assert "location = /assets/custom-theme.css {" in text
+    assert "alias /opt/custom_assets/custom-theme.css;" in text
+    assert "location ^~ /assets/tbov/ {" in text
+    assert 'Cache-Control "public, max-age=31536000, immutable"' in text
+
+    # Re-running with unchanged assets changes nothing
+    tbov.fingerprint_assets()
+    assert conf.read_text() == text
+
+
+def test_unreferenced_fingerprinted_files_are_pruned(site, tmp_path):
+    conf, css, calls = site
+    link = """sub_filter '</head>' '<link rel="stylesheet" href="/assets/custom-theme.css"></head>';"""
+    conf.write_text(conf.read_text().replace("proxy_pass http://localhost:8081/;", "proxy_pass http://localhost:8081/;\n        " + link))
+    hashed_css = lambda: sorted(p.name for p in (tmp_path / "tbov").glob("custom-theme.*.css"))
+
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#111111"}, None, tmp_path)], fingerprint=True)
+    first = hashed_css()
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#222222"}, None, tmp_path)], fingerprint=True)
+    # The first copy is still what the earlier revision links to
+    assert len(hashed_css()) == 2 and first[0] in hashed_css()
+
+    RevisionStore(tmp_path / ".revisions").gc(keep=1)
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#333333"}, None, tmp_path)], fingerprint=True)
+
+    assert first[0] not in hashed_css() and len(hashed_css()) == 2
+    assert not (tmp_path / "tbov" / (first[0] + ".gz")).exists()
+    assert sum(f"/assets/tbov/{name}" in conf.read_text() for name in hashed_css()) == 1
+
+
+def test_override_main_logo_installs_optimised_logo(tmp_path):
+    conf = tmp_path / "tb-proxy"
+    shutil.copy(conf_file, conf)
+    upload = tmp_path / "upload.svg"
+    upload.write_text(
+        '<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="x" inkscape:version="1">\n'
+        "  <!-- exported -->\n"
+        "  <metadata>editor junk</metadata>\n"
+        '  <path d="M 0.123456,10.000000 L 20.5,-3.25 Z"/>\n'
+        "</svg>\n"
+    )
+
+    tbov = tb_override.TBOverride(conf, tmp_path / "custom-theme.css", assets_dir=tmp_path)
+    tbov.override_main_logo(upload)
+
+    installed = (tmp_path / "logo_title_white.svg").read_text()
+    assert installed == '<svg xmlns="http://www.w3.org/2000/svg"><path d="M.12 10L20.5-3.25Z"/></svg>'
+
+    # The optimised copy is cached, a lowered budget still applies to it
+    tbov.LOGO_SIZE_BUDGET = 10
+    with pytest.raises(ValueError, match="byte budget"):
+        tbov.override_main_logo(upload)
+
+    # Served as logo_title_white.svg, so a raster logo would not render
+    png = tmp_path / "upload.png"
+    png.write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(8))
+    with pytest.raises(ValueError, match="Unsupported image type '.png'"):
+        tbov.override_main_logo(png)
+
+
+def test_host_keyed_tenants_share_locations(site, tmp_path):
+    conf, css, calls = site
+    logo = tmp_path / "logo.svg"
+    logo.write_text("<svg/>")
+    default_logo = tmp_path / "default.svg"
+    default_logo.write_text("<svg id='default'/>")
+
+    # Shared logo location: the default dir needs a logo for unmapped hosts
+    tb_override.update_tb_batch([
+        (conf, css, {}, default_logo, tmp_path),
+        (conf, css, {"--tb-brand": "#111111"}, logo, tmp_path, "a.example.com"),
+        (conf, css, {"--tb-brand": "#222222"}, None, tmp_path, "b.example.com"),
+    ])
+
+    text = conf.read_text()
+    assert text.count("map $host $tb_theme_dir {") == 1
+    assert f"    default {tmp_path};" in text
+    assert f"    a.example.com {tmp_path}/tenants/a.example.com;" in text
+    assert text.count("location = /assets/custom-theme.css") == 1
+    assert "alias $tb_theme_dir/custom-theme.css;" in text
+    assert "alias $tb_theme_dir/logo_title_white.svg;" in text
+
+    # Tenant CSS is seeded from the default theme, which stays untouched
+    assert "--tb-brand:        #222222;" in (tmp_path / "tenants" / "b.example.com" / "custom-theme.css").read_text()
+    assert "#ff7a00" in css.read_text()
+    assert (tmp_path / "tenants" / "b.example.com" / "logo_title_white.svg").read_text() == "<svg id='default'/>"
+
+    # The thousandth tenant only adds its own map entry
+    before = text.splitlines()
+    tb_override.update_tb_batch([(conf, css, {"--tb-brand": "#333333"}, None, tmp_path, "c.example.com")])
+    after = conf.read_text().splitlines()
+    assert len(after) == len(before) + 1
+    assert set(after) - set(before) == {f"    c.example.com {tmp_path}/tenants/c.example.com;"}
+
+
+def test_inline_vars_follow_theme_changes(tmp_path):
+    conf = tmp_path / "tb-proxy"
+    css = tmp_path / "custom-theme.css"
+    shutil.copy("tests/example_tb_proxy", conf)
+    shutil.copy(css_file, css)
+
+    tbov = tb_override.TBOverride(conf, css, assets_dir=tmp_path)
+    tbov.INLINE_VARS = "inline"
+    with tbov.fileio.edit_conf():
+        tbov.override_theme({"--tb-brand": "#111111"})
+
+    text = conf.read_text()
+    assert "sub_filter '<head>' '<head><style id=\"tb-theme-vars\">:root{--tb-brand:#111111;--tb-accent:#22c55e;" in text
+    # The stylesheet link injection is left alone
+    assert "sub_filter '</head>'" in text
+
+    with tbov.fileio.edit_conf():
+        tbov.override_theme({"--tb-brand": "#222222"})
+    text = conf.read_text()
+    assert text.count("sub_filter '<head>'") == 1
+    assert ":root{--tb-brand:#222222;" in text
+
+    tbov.INLINE_VARS = "preload"
+    tbov.FINGERPRINT = True
+    with tbov.fileio.edit_conf():
+        tbov.override_theme({"--tb-brand": "#333333"})
+        tbov.fingerprint_assets()
+    text = conf.read_text()
+    hashed = next(p.name for p in (tmp_path / "tbov").iterdir() if p.suffix == ".css")
+    assert f'add_header Link "</assets/tbov/{hashed}>; rel=preload; as=style";' in text
+
+
+def test_inline_vars_refused_for_host_keyed_tenants(site, tmp_path):
+    conf, css, calls = site
+    original_conf = conf.read_text()
+
+    with pytest.raises(ValueError, match="host-keyed"):
+        tb_override.update_tb_batch([tb_override.BrandProfile(conf, css, {"--tb-brand": "#111111"}, None, tmp_path,
+                                                               "a.example.com")], inline_vars="inline")
+    assert conf.read_text() == original_conf
+    assert calls == []
+
+
+def test_small_images_are_inlined_and_large_ones_served(site, tmp_path, capsys):
+    conf, css, calls = site
+    icon = tmp_path / "icon.svg"
+    icon.write_text('<svg xmlns="http://www.w3.org/2000/svg">\n  <path fill="#fff" d="M0 0h1v1z"/>\n</svg>')
+    background = tmp_path / "login bg.png"
+    background.write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(5000))
+
+    images = {"--tb-header-icon-image": icon, "--tb-login-bg-image": background}
+    profile = tb_override.BrandProfile(conf, css, {}, None, tmp_path, images=images)
+    tb_override.update_tb_batch([profile])
+
+    text = css.read_text()
+    assert ("--tb-header-icon-image: url(\"data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg'%3E"
+            "%3Cpath fill='%23fff' d='M0 0h1v1z'/%3E%3C/svg%3E\");") in text
+    served = [p.name for p in (tmp_path / "images").iterdir()]
+    assert len(served) == 1 and served[0].startswith("login-bg.")
+    assert f'--tb-login-bg-image: url("/assets/images/{served[0]}");' in text
+    assert "location ^~ /assets/images/ {" in conf.read_text()
+    assert calls == [["nginx", "-t"], ["systemctl", "reload", "nginx"]]
+    out = capsys.readouterr().out
+    assert "Inlined 1 image(s): 1 fewer request(s) per cold load" in out
+    # Data URIs are cut short in the log
+    assert "Overriding: none -> url(\"data:image/svg+xml," in out and "... (" in out
+    assert "%3C/svg%3E" not in out
+
+    # Same images again: nothing to report
+    tb_override.update_tb_batch([profile])
+    out = capsys.readouterr().out
+    assert "Inlined" not in out and "Overriding:" not in out
+    assert "- icon.svg: already applied (skipped)" in out
+
+    # Files can only be given for image variables
+    with pytest.raises(ValueError, match="not an image variable"):
+        tb_override.update_tb_batch([profile._replace(images={"--tb-brand": icon})])
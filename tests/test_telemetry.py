@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from telemetry import Tracer
+
+
+def test_spans_nest_and_export_textfile(tmp_path):
+    tracer = Tracer()
+    log = tmp_path / "trace.jsonl"
+    prom = tmp_path / "tbov.prom"
+    tracer.configure(json_log=log, textfile=prom)
+
+    with tracer.span("update_tb"):
+        with tracer.span("write_css"):
+            tracer.add(bytes_written=10, vars_changed=2)
+        tracer.add(bytes_read=5)
+
+    spans = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [s["span"] for s in spans] == ["write_css", "update_tb"]
+    assert spans[0]["parent"] == "update_tb"
+    # Parents include the counters of their children
+    assert (spans[1]["bytes_read"], spans[1]["bytes_written"], spans[1]["vars_changed"]) == (5, 10, 2)
+
+    text = prom.read_text()
+    assert 'tbov_phase_duration_seconds_count{phase="update_tb"} 1' in text
+    assert 'tbov_phase_bytes_written_total{phase="write_css"} 10' in text
+
+    # Errors are recorded and metrics accumulate across runs
+    with pytest.raises(RuntimeError):
+        with tracer.span("update_tb"):
+            raise RuntimeError("boom")
+    text = prom.read_text()
+    assert 'tbov_phase_duration_seconds_count{phase="update_tb"} 2' in text
+    assert 'tbov_phase_errors_total{phase="update_tb"} 1' in text
+
+
+def test_disabled_tracer_records_nothing(monkeypatch):
+    monkeypatch.delenv("TBOV_TRACE_JSON", raising=False)
+    monkeypatch.delenv("TBOV_PROM_TEXTFILE", raising=False)
+    tracer = Tracer()
+    tracer.configure()
+
+    with tracer.span("update_tb") as span:
+        tracer.add(bytes_read=1)
+    assert span is None
+    assert tracer.finished == []
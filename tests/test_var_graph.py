@@ -0,0 +1,52 @@
+import pytest
+
+from var_graph import VarGraph, substitute
+
+BLOCK = """>>> TB_CUSTOM_THEME_VARS_BEGIN */
+:root{
+  --tb-brand: #ff7a00;
+  --tb-border: #262b36;
+  --tb-btn-bg: var(--tb-brand);
+  --tb-link: var(--tb-btn-bg);
+  --tb-input-border: var(--tb-border);
+  --tb-focus: var(--tb-missing, var(--tb-brand));
+  --tb-ghost: var(--tb-nowhere);
+}
+/* """
+
+
+def test_resolves_chains_fallbacks_and_dangling():
+    graph = VarGraph.from_block(BLOCK)
+
+    assert graph.resolved["--tb-link"] == "#ff7a00"
+    assert graph.resolved["--tb-focus"] == "#ff7a00"
+    assert graph.resolved["--tb-ghost"] == "var(--tb-nowhere)"
+    assert graph.dangling == {"--tb-focus": {"--tb-missing"}, "--tb-ghost": {"--tb-nowhere"}}
+    assert graph.cycles == []
+
+
+def test_update_recomputes_only_downstream():
+    graph = VarGraph.from_block(BLOCK)
+
+    assert graph.downstream(["--tb-brand"]) == {"--tb-brand", "--tb-btn-bg", "--tb-link", "--tb-focus"}
+    changed = graph.update({"--tb-brand": "#000000"})
+
+    assert changed == {"--tb-brand", "--tb-btn-bg", "--tb-link", "--tb-focus"}
+    assert graph.resolved["--tb-input-border"] == "#262b36"
+
+
+def test_detects_cycles():
+    graph = VarGraph({"--a": "var(--b)", "--b": "var(--c)", "--c": "var(--a)", "--d": "var(--d)", "--e": "1px"})
+    assert sorted(sorted(c) for c in graph.cycles) == [["--a", "--b", "--c"], ["--d"]]
+
+    graph.update({"--c": "red"})
+    assert graph.cycles == [["--d"]]
+    assert graph.resolved["--a"] == "red"
+
+
+def test_flatten_writes_literals():
+    flat = VarGraph.from_block(BLOCK).flatten(BLOCK)
+
+    assert "--tb-link: #ff7a00;" in flat
+    assert "--tb-ghost: var(--tb-nowhere);" in flat
+    assert substitute("calc(var(--x) * 2)", {"--x": "4px"}.get) == "calc(4px * 2)"
@@ -0,0 +1,25 @@
+from variables import TB_THEME_VARS_BY_CATEGORY, VAR_REGISTRY, lookup_var, validate_overrides
+
+
+def test_registry_flattens_every_category():
+    total = sum(len(items) for items in TB_THEME_VARS_BY_CATEGORY.values())
+    assert len(VAR_REGISTRY) == total
+    assert VAR_REGISTRY["--tb-logo-w"]["category"] == "logo"
+    assert lookup_var("--tb-brand")["--tb-brand"]["type"] == "hex"
+
+
+def test_validate_overrides_normalises_and_reports_every_error():
+    normalised, errors = validate_overrides({
+        "--tb-brand": "FF7A00",
+        "--tb-logo-w": "20",
+        "--tb-link": "var(--tb-brand)",
+        "--tb-logo-align": "middle",
+        "--tb-btn-radius": "big",
+        "--tb-nope": "1px",
+    })
+
+    assert normalised == {"--tb-brand": "#ff7a00", "--tb-logo-w": "20px", "--tb-link": "var(--tb-brand)"}
+    assert len(errors) == 3
+    assert any("--tb-logo-align" in e for e in errors)
+    assert any("--tb-btn-radius" in e for e in errors)
+    assert any("--tb-nope" in e for e in errors)
@@ -0,0 +1,84 @@
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import tb_override
+from watcher import Inotify, Watcher
+
+css_file = Path("tests/example_css.css")
+conf_file = Path("tests/example_tb_proxy")
+
+
+def test_watcher_coalesces_and_skips_unchanged(tmp_path, monkeypatch):
+    shutil.copy(conf_file, tmp_path / "tb-proxy")
+    shutil.copy(css_file, tmp_path / "custom-theme.css")
+    profile = tmp_path / "overrides.json"
+    profile.write_text(json.dumps({"variables": {"--tb-brand": "#123456"}}))
+
+    calls = []
+    monkeypatch.setattr(tb_override.subprocess, "run", lambda cmd, **kw: calls.append(cmd))
+
+    w = Watcher(tmp_path / "tb-proxy", tmp_path / "custom-theme.css", profile, assets_dir=tmp_path)
+
+    # CSS-only change is served from disk, no reload needed
+    assert w.apply({profile}) is False
+    assert "#123456" in (tmp_path / "custom-theme.css").read_text()
+
+    # Same profile again: nothing to do
+    assert w.apply({profile}) is False
+    assert w.counters == {"events_seen": 0, "applies": 1, "reloads": 0}
+    assert calls == []
+
+
+def test_watcher_rolls_back_failed_apply_and_retries(tmp_path, monkeypatch):
+    shutil.copy("tb-proxy", tmp_path / "tb-proxy")
+    shutil.copy(css_file, tmp_path / "custom-theme.css")
+    (tmp_path / "logo.svg").write_text("<svg/>")
+    profile = tmp_path / "overrides.json"
+    profile.write_text(json.dumps({"variables": {"--tb-brand": "#123456"}, "logo": str(tmp_path / "logo.svg")}))
+    original_css = (tmp_path / "custom-theme.css").read_text()
+    original_conf = (tmp_path / "tb-proxy").read_text()
+
+    def failing_run(cmd, **kwargs):
+        raise subprocess.CalledProcessError(1, cmd, "", "emerg")
+
+    monkeypatch.setattr(tb_override.subprocess, "run", failing_run)
+    w = Watcher(tmp_path / "tb-proxy", tmp_path / "custom-theme.css", profile, assets_dir=tmp_path)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        w.apply({profile})
+    assert (tmp_path / "custom-theme.css").read_text() == original_css
+    assert (tmp_path / "tb-proxy").read_text() == original_conf
+    assert w.applied_vars == {} and w.applied_logo is None
+
+    # Nothing was recorded as applied, so the next quiet window tries again
+    calls = []
+    monkeypatch.setattr(tb_override.subprocess, "run", lambda cmd, **kw: calls.append(cmd))
+    assert w.apply(set()) is True
+    assert "#123456" in (tmp_path / "custom-theme.css").read_text()
+    assert calls == [["nginx", "-t"], ["systemctl", "reload", "nginx"]]
+
+
+def test_watcher_rejects_invalid_profile_values(tmp_path):
+    shutil.copy(conf_file, tmp_path / "tb-proxy")
+    shutil.copy(css_file, tmp_path / "custom-theme.css")
+    profile = tmp_path / "overrides.json"
+    profile.write_text(json.dumps({"variables": {"--tb-brand": "#123456", "--tb-main-bg": "not-a-colour"}}))
+
+    w = Watcher(tmp_path / "tb-proxy", tmp_path / "custom-theme.css", profile, assets_dir=tmp_path)
+    with pytest.raises(ValueError, match="--tb-main-bg"):
+        w.apply({profile})
+    assert (tmp_path / "custom-theme.css").read_text() == css_file.read_text()
+
+
+def test_inotify_reports_written_paths(tmp_path):
+    inotify = Inotify()
+    inotify.add_watch(tmp_path)
+    try:
+        (tmp_path / "logo.svg").write_text("<svg/>")
+        assert tmp_path / "logo.svg" in inotify.read(timeout=1.0)
+    finally:
+        inotify.close()
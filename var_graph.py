@@ -0,0 +1,243 @@
+import re
+from typing import Callable, Dict, Iterable, List, Set
+
+from css_model import VarsBlock
+
+_VAR_OPEN_RE = re.compile(r"var\(\s*")
+_VAR_NAME_RE = re.compile(r"--[\w-]+")
+
+
+def _find_close(value: str, pos: int) -> int:
+    """Index of the ')' closing the paren group that starts before pos."""
+    depth = 1
+    quote = None
+    for i in range(pos, len(value)):
+        ch = value[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def substitute(value: str, lookup: Callable[[str], str | None]) -> str:
+    """
+    Replace every var(--name[, fallback]) in value. lookup returns the
+    resolved value of a name, or None to use the fallback; with no fallback
+    the var() expression is kept as-is.
+    """
+    out = []
+    pos = 0
+    for m in _VAR_OPEN_RE.finditer(value):
+        if m.start() < pos:
+            continue  # nested inside a fallback we already handled
+
+        close = _find_close(value, m.end())
+        name_m = _VAR_NAME_RE.match(value, m.end())
+        if close == -1 or name_m is None:
+            continue
+
+        out.append(value[pos:m.start()])
+
+        rest = value[name_m.end():close].strip()
+        fallback = rest[1:].strip() if rest.startswith(",") else None
+
+        resolved = lookup(name_m.group())
+        if resolved is None and fallback is not None:
+            resolved = substitute(fallback, lookup)
+        out.append(resolved if resolved is not None else value[m.start():close + 1])
+
+        pos = close + 1
+
+    out.append(value[pos:])
+    return "".join(out)
+
+
+def references(value: str) -> Set[str]:
+    """Every variable name referenced through var(), fallbacks included."""
+    return {m.group(1) for m in re.finditer(r"var\(\s*(--[\w-]+)", value)}
+
+
+class VarGraph:
+    """
+    Dependency graph of the vars block: who references whom through var().
+    Resolves effective values, finds cycles and dangling references, and
+    recomputes only the downstream variables when a value changes.
+    """
+
+    def __init__(self, values: Dict[str, str]):
+        self.raw: Dict[str, str] = dict(values)
+        self.deps: Dict[str, Set[str]] = {}
+        self.rdeps: Dict[str, Set[str]] = {}
+        self.resolved: Dict[str, str] = {}
+
+        self.cyclic: Set[str] = set()
+        self.cycles: List[List[str]] = []
+
+        for name, value in self.raw.items():
+            self._link(name, references(value))
+
+        self._find_cycles()
+        self._resolve(self._topo_order(self.raw))
+
+    @classmethod
+    def from_block(cls, vars_block: str) -> "VarGraph":
+        return cls(VarsBlock(vars_block).values())
+
+    @property
+    def dangling(self) -> Dict[str, Set[str]]:
+        """name -> referenced names that are not declared."""
+        out = {}
+        for name, refs in self.deps.items():
+            missing = {r for r in refs if r not in self.raw}
+            if missing:
+                out[name] = missing
+        return out
+
+    def _link(self, name: str, refs: Set[str]) -> None:
+        for ref in self.deps.get(name, ()):
+            self.rdeps.get(ref, set()).discard(name)
+        self.deps[name] = refs
+        for ref in refs:
+            self.rdeps.setdefault(ref, set()).add(name)
+
+    def _find_cycles(self) -> None:
+        """Tarjan's SCC, iterative so long chains cannot hit the recursion limit."""
+        index: Dict[str, int] = {}
+        low: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack: Set[str] = set()
+        self.cycles = []
+        counter = 0
+
+        for root in self.raw:
+            if root in index:
+                continue
+            work = [(root, iter(self.deps[root]))]
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+
+            while work:
+                node, it = work[-1]
+                advanced = False
+                for dep in it:
+                    if dep not in self.raw:
+                        continue
+                    if dep not in index:
+                        index[dep] = low[dep] = counter
+                        counter += 1
+                        stack.append(dep)
+                        on_stack.add(dep)
+                        work.append((dep, iter(self.deps[dep])))
+                        advanced = True
+                        break
+                    if dep in on_stack:
+                        low[node] = min(low[node], index[dep])
+                if advanced:
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in self.deps[node]:
+                        self.cycles.append(component[::-1])
+
+        self.cyclic = {name for cycle in self.cycles for name in cycle}
+
+    def _topo_order(self, names: Iterable[str]) -> List[str]:
+        """Dependencies-first order of names (restricted to names)."""
+        wanted = set(names)
+        order: List[str] = []
+        seen: Set[str] = set()
+
+        for root in wanted:
+            if root in seen:
+                continue
+            seen.add(root)
+            work = [(root, iter(self.deps.get(root, ())))]
+            while work:
+                node, it = work[-1]
+                for dep in it:
+                    if dep in wanted and dep not in seen:
+                        seen.add(dep)
+                        work.append((dep, iter(self.deps.get(dep, ()))))
+                        break
+                else:
+                    work.pop()
+                    order.append(node)
+        return order
+
+    def _lookup(self, name: str) -> str | None:
+        # Cyclic variables are invalid at computed-value time, like in the browser
+        if name in self.cyclic:
+            return None
+        return self.resolved.get(name)
+
+    def _resolve(self, order: List[str]) -> Set[str]:
+        changed = set()
+        for name in order:
+            if name not in self.raw:
+                continue
+            value = self.raw[name] if name in self.cyclic else substitute(self.raw[name], self._lookup)
+            if self.resolved.get(name) != value:
+                self.resolved[name] = value
+                changed.add(name)
+        return changed
+
+    def downstream(self, names: Iterable[str]) -> Set[str]:
+        """names plus every variable that depends on them, transitively."""
+        out = set(names)
+        queue = list(out)
+        while queue:
+            for dependent in self.rdeps.get(queue.pop(), ()):
+                if dependent not in out:
+                    out.add(dependent)
+                    queue.append(dependent)
+        return out
+
+    def update(self, changes: Dict[str, str]) -> Set[str]:
+        """Set new raw values and recompute only what depends on them. Returns changed names."""
+        relinked = False
+        for name, value in changes.items():
+            refs = references(value)
+            if refs != self.deps.get(name):
+                self._link(name, refs)
+                relinked = True
+            self.raw[name] = value
+
+        if relinked:
+            self._find_cycles()
+
+        affected = self.downstream(changes)
+        return self._resolve(self._topo_order(affected))
+
+    def flat_values(self) -> Dict[str, str]:
+        """Literal values for every variable whose var() chain fully resolves."""
+        return {
+            name: value for name, value in self.resolved.items()
+            if self.deps.get(name) and name not in self.cyclic and "var(" not in value
+        }
+
+    def flatten(self, vars_block: str) -> str:
+        """Return vars_block with every resolvable var() chain replaced by its literal value."""
+        # Not an override, so nothing is logged
+        return VarsBlock(vars_block).render(self.flat_values(), quiet=True)
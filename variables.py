@@ -1,4 +1,6 @@
 
+import re
+
 def fetch_categories() -> list:
     '''Return a list of categories'''
     return list(TB_THEME_VARS_BY_CATEGORY.keys())
@@ -12,6 +14,34 @@ def fetch_var(category: str, var_name: str) -> dict:
     '''Return the variable dict'''
     return {var_name:TB_THEME_VARS_BY_CATEGORY[category][var_name]}
 
+def lookup_var(var_name: str) -> dict:
+    '''Return the variable dict without knowing its category'''
+    try:
+        return {var_name: VAR_REGISTRY[var_name]}
+    except KeyError as e:
+        raise KeyError(f"[X] Unknown variable: {var_name}") from e
+
+def validate_value(var_name: str, value: str) -> str:
+    '''Validate a value for a variable, returning it normalised. Raises ValueError'''
+    meta = VAR_REGISTRY.get(var_name)
+    if meta is None:
+        raise ValueError(f"[X] Unknown variable: {var_name}")
+    
+    return VALIDATORS[meta["type"]](var_name, meta, str(value).strip())
+
+def validate_overrides(overrides: dict[str, str]) -> tuple[dict[str, str], list[str]]:
+    '''Validate many overrides in one pass. Returns (normalised, every error)'''
+    normalised = {}
+    errors = []
+    
+    for var_name, value in overrides.items():
+        try:
+            normalised[var_name] = validate_value(var_name, value)
+        except ValueError as e:
+            errors.append(str(e))
+    
+    return normalised, errors
+
 TB_THEME_VARS_BY_CATEGORY: dict[str, dict[str, dict[str, str]]] = {
     "surfaces": {
         "--tb-topbar-bg": {
@@ -56,6 +86,7 @@ TB_THEME_VARS_BY_CATEGORY: dict[str, dict[str, dict[str, str]]] = {
             "default": "flex-start",
             "type": "enum",
             "description": "Logo container alignment: flex-start | center | flex-end.",
+            "values": "flex-start|center|flex-end|left|right",
         },
     },
 
@@ -77,6 +108,60 @@ TB_THEME_VARS_BY_CATEGORY: dict[str, dict[str, dict[str, str]]] = {
         },
     },
 
+    "typography": {
+        "--tb-font-family": {
+            "default": 'Roboto, "Helvetica Neue", sans-serif',
+            "type": "css",
+            "description": "UI font stack. A brand font from the profile's [fonts] is put first.",
+        },
+        "--tb-font-family-heading": {
+            "default": "var(--tb-font-family)",
+            "type": "css",
+            "description": "Font stack for titles and toolbar headings.",
+        },
+        "--tb-font-size": {
+            "default": "14px",
+            "type": "px",
+            "description": "Base UI font size.",
+        },
+        "--tb-font-weight": {
+            "default": "400",
+            "type": "enum",
+            "description": "Body text weight.",
+            "values": "100|200|300|400|500|600|700|800|900|normal|bold",
+        },
+        "--tb-font-weight-medium": {
+            "default": "500",
+            "type": "enum",
+            "description": "Weight for buttons, tabs and labels.",
+            "values": "100|200|300|400|500|600|700|800|900|normal|bold",
+        },
+        "--tb-font-weight-bold": {
+            "default": "700",
+            "type": "enum",
+            "description": "Weight for headings and emphasis.",
+            "values": "100|200|300|400|500|600|700|800|900|normal|bold",
+        },
+    },
+
+    "images": {
+        "--tb-login-bg-image": {
+            "default": "none",
+            "type": "image",
+            "description": "Login page background. Set from the profile's [images], small files are inlined.",
+        },
+        "--tb-login-accent-image": {
+            "default": "none",
+            "type": "image",
+            "description": "Decorative image beside the login form.",
+        },
+        "--tb-header-icon-image": {
+            "default": "none",
+            "type": "image",
+            "description": "Icon in front of the top bar title.",
+        },
+    },
+
     "brand": {
         "--tb-brand": {
             "default": "#ff7a00",
@@ -246,3 +331,67 @@ TB_THEME_VARS_BY_CATEGORY: dict[str, dict[str, dict[str, str]]] = {
         },
     },
 }
+
+
+# =====================================================================
+# Flat registry + validators, built once at import
+# =====================================================================
+
+_HEX_RE = re.compile(r"#?(?P<hex>[0-9a-fA-F]{3}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})")
+_PX_RE = re.compile(r"(?P<num>-?(?:\d+(?:\.\d+)?|\.\d+))(?:px)?")
+_CSS_BAD_RE = re.compile(r"[;{}]")
+_IMAGE_RE = re.compile(r'none|url\("[^"\\\n]*"\)')
+
+def _validate_hex(var_name: str, meta: dict, value: str) -> str:
+    m = _HEX_RE.fullmatch(value)
+    if not m:
+        raise ValueError(f"[X] {var_name}: expected a hex colour like #1a2b3c, got {value!r}")
+    return f"#{m.group('hex').lower()}"
+
+def _validate_px(var_name: str, meta: dict, value: str) -> str:
+    m = _PX_RE.fullmatch(value)
+    if not m:
+        raise ValueError(f"[X] {var_name}: expected a pixel size like 12px, got {value!r}")
+    return f"{m.group('num')}px"
+
+def _validate_enum(var_name: str, meta: dict, value: str) -> str:
+    if value not in meta["allowed"]:
+        raise ValueError(f"[X] {var_name}: expected one of {' | '.join(meta['allowed'])}, got {value!r}")
+    return value
+
+def _validate_css(var_name: str, meta: dict, value: str) -> str:
+    if not value or _CSS_BAD_RE.search(value) or value.count("(") != value.count(")"):
+        raise ValueError(f"[X] {var_name}: not a valid CSS value: {value!r}")
+    return value
+
+def _validate_image(var_name: str, meta: dict, value: str) -> str:
+    if not _IMAGE_RE.fullmatch(value):
+        raise ValueError(f"[X] {var_name}: expected none or url(\"...\"), got {value!r}")
+    return value
+
+VALIDATORS = {
+    "hex": _validate_hex,
+    "px": _validate_px,
+    "enum": _validate_enum,
+    "css": _validate_css,
+    "image": _validate_image,
+}
+
+def _build_registry() -> dict[str, dict]:
+    '''selector -> {category, default, type, description, allowed}'''
+    registry = {}
+    
+    for category, items in TB_THEME_VARS_BY_CATEGORY.items():
+        for var_name, meta in items.items():
+            if meta["type"] not in VALIDATORS:
+                raise ValueError(f"[X] {var_name}: unknown type {meta['type']!r}")
+            
+            registry[var_name] = {
+                **meta,
+                "category": category,
+                "allowed": tuple(meta["values"].split("|")) if "values" in meta else (),
+            }
+    
+    return registry
+
+VAR_REGISTRY: dict[str, dict] = _build_registry()
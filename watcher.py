@@ -0,0 +1,263 @@
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Set
+
+from css_build import built_from, source_digest
+from precompress import is_variant
+from profile_loader import load_profile
+from changes import ChangeTracker
+from conf_check import ConfCheckError
+from staging import StagedChanges
+from tb_override import TBOverride, apply_changes
+from variables import validate_overrides
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal inotify binding over libc, watching directories."""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "[X] inotify_init1 failed")
+
+        self.watches: Dict[int, Path] = {}
+
+    def add_watch(self, directory: str | Path) -> None:
+        """Watch a directory for writes, creates, moves and deletes."""
+        directory = Path(directory)
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"[X] Cannot watch {directory}")
+        self.watches[wd] = directory
+
+    def read(self, timeout: float | None) -> List[Path]:
+        """Return paths touched since the last read, waiting up to timeout."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        pos = 0
+        while pos < len(buf):
+            wd, _mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, pos)
+            pos += _EVENT_HEADER.size
+            name = buf[pos:pos + length].rstrip(b"\0")
+            pos += length
+
+            if wd in self.watches:
+                paths.append(self.watches[wd] / os.fsdecode(name))
+        return paths
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class Watcher:
+    """
+    Long-running watch mode: tracks the assets dir and a declarative profile,
+    and coalesces bursts of edits into one apply with at most one reload.
+    """
+
+    def __init__(self, conf_path: str | Path, css_path: str | Path, profile_path: str | Path,
+                 assets_dir: str | Path = Path("/opt/custom_assets"), window: float = 2.0,
+                 fingerprint: bool = False, minify_css: bool = False):
+        self.tbov = TBOverride(conf_path=conf_path, css_path=css_path, assets_dir=assets_dir)
+        self.tbov.FINGERPRINT = fingerprint
+        self.tbov.MINIFY_CSS = minify_css
+
+        self.PROFILE = Path(profile_path).resolve()
+        self.window = window
+
+        # Parsed state kept between events
+        self.profile: Dict = {"variables": {}, "logo": None}
+        self.applied_vars: Dict[str, str] = {}
+        self.applied_logo: Path | None = None
+
+        # Counters
+        self.events_seen = 0
+        self.applies = 0
+        self.reloads = 0
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        return {"events_seen": self.events_seen, "applies": self.applies, "reloads": self.reloads}
+
+    def _ignored(self, path: Path) -> bool:
+        """Skip files we write ourselves, or the watcher would trigger itself."""
+        if is_variant(path) or path.name.startswith("."):
+            return True
+        generated = (self.tbov.FINGERPRINT_DIR.name, self.tbov.FAVICON_DIR.name)
+        if path.name in generated or path.parent.name in generated:
+            return True
+        # With a production build the CSS is hand-edited source, only the built copy is ours
+        css = self.tbov.production_css if self.tbov.MINIFY_CSS else self.tbov.fileio.CSS_FILE
+        return path.resolve() in (css.resolve(), self.tbov.fileio.CONF.resolve())
+
+    def _needs_build(self) -> bool:
+        """True if the production CSS was not built from the current source."""
+        try:
+            built = self.tbov.production_css.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return True
+        return built_from(built) != source_digest(self.tbov.fileio.read_css(), flatten=self.tbov.FLATTEN_VARS)
+
+    def apply(self, changed: Set[Path]) -> bool:
+        """Apply whatever the changed paths affect. Returns True if nginx was reloaded."""
+        if self.PROFILE in changed or not self.applied_vars:
+            self.profile = load_profile(self.PROFILE)
+
+        # Reject the whole profile before touching anything, like a batch apply
+        profile_vars, errors = validate_overrides(self.profile["variables"])
+        if errors:
+            raise ValueError("[X] Invalid overrides:\n" + "\n".join(errors))
+
+        # Only push variables whose value differs from the last apply
+        variables = {
+            k: v for k, v in profile_vars.items()
+            if self.applied_vars.get(k) != v
+        }
+
+        logo = self.profile["logo"]
+        logo_dirty = logo is not None and (logo != self.applied_logo or logo.resolve() in changed)
+
+        css_dirty = self.tbov.MINIFY_CSS and self._needs_build()
+
+        if not variables and not logo_dirty and not css_dirty:
+            return False
+
+        self.applies += 1
+
+        tracker = ChangeTracker(
+            conf_paths=[self.tbov.fileio.CONF],
+            asset_paths=[self.tbov.fileio.CSS_FILE, self.tbov.production_css],
+        )
+
+        # Stage, validate once, roll everything back together on failure
+        staging = StagedChanges()
+        self.tbov.fileio.staging = staging
+        try:
+            with self.tbov.fileio.edit_conf():
+                if variables:
+                    self.tbov.override_theme(elements=variables)
+
+                if logo_dirty:
+                    self.tbov.override_main_logo(logo)
+
+                if self.tbov.MINIFY_CSS:
+                    self.tbov.build_css()
+                else:
+                    self.tbov.serve_source_css()
+
+                if self.tbov.FINGERPRINT:
+                    self.tbov.fingerprint_assets()
+
+            self.tbov.stage_precompressed()
+            staging.commit()
+            try:
+                reloaded = apply_changes(tracker)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ConfCheckError):
+                staging.rollback()
+                raise
+
+            self.tbov.precompress_assets()
+            self.tbov.record_revision("watch")
+        finally:
+            self.tbov.fileio.staging = None
+            self.tbov.served_assets.clear()
+
+        # Only what actually went live counts as applied
+        self.applied_vars.update(variables)
+        if logo_dirty:
+            self.applied_logo = logo
+
+        if not reloaded:
+            return False
+
+        self.reloads += 1
+        return True
+
+    def run(self) -> None:
+        """Watch forever, applying once per quiet window."""
+        inotify = Inotify()
+        inotify.add_watch(self.tbov.CUSTOM_ASSETS)
+        if self.PROFILE.parent.resolve() != self.tbov.CUSTOM_ASSETS.resolve():
+            inotify.add_watch(self.PROFILE.parent)
+
+        print(f"[+] Watching {self.tbov.CUSTOM_ASSETS} and {self.PROFILE} (window {self.window}s)")
+
+        # Bring the files in line with the profile on startup
+        self._safe_apply({self.PROFILE})
+
+        pending: Set[Path] = set()
+        try:
+            while True:
+                # Block until something happens, then wait for a quiet window
+                timeout = self.window if pending else None
+                paths = [p.resolve() for p in inotify.read(timeout) if not self._ignored(p)]
+
+                if paths:
+                    self.events_seen += len(paths)
+                    pending.update(paths)
+                    continue
+
+                if pending:
+                    self._safe_apply(pending)
+                    pending = set()
+                    print(f"- {self.counters}")
+        except KeyboardInterrupt:
+            print("\n[+] Stopped watching.")
+        finally:
+            inotify.close()
+
+    def _safe_apply(self, changed: Set[Path]) -> None:
+        """Apply, but keep watching if one attempt fails."""
+        try:
+            self.apply(changed)
+        except (OSError, ValueError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            print(f"[X] Apply failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch custom assets and an overrides profile.")
+    parser.add_argument("profile", help="JSON/TOML file with 'variables' and optional 'logo'")
+    parser.add_argument("--conf", default="/etc/nginx/sites-available/tb-proxy")
+    parser.add_argument("--css", default="/opt/custom_assets/custom-theme.css")
+    parser.add_argument("--assets", default="/opt/custom_assets")
+    parser.add_argument("--window", type=float, default=2.0, help="Debounce window in seconds")
+    parser.add_argument("--fingerprint", action="store_true", help="Serve content-hashed assets with immutable caching")
+    parser.add_argument("--minify", action="store_true", help="Serve a minified build and rebuild it on hand edits")
+    args = parser.parse_args()
+
+    if os.geteuid() != 0:
+        print("Run script as sudo!")
+        raise SystemExit(1)
+
+    Watcher(args.conf, args.css, args.profile, assets_dir=args.assets, window=args.window,
+            fingerprint=args.fingerprint, minify_css=args.minify).run()
+
+
+if __name__ == "__main__":
+    main()